@@ -10,17 +10,26 @@
 - 车辆最新状态查询
 """
 
+import io
 import os
 import sys
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+import csv
+import json
+import base64
+import datetime
+import threading
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, g
 from werkzeug.utils import secure_filename
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # 导入项目模块
 from summarize.summarize import VehicleDataProcessor
+from summarize.upload_stream import MultipartFileStream, UploadStreamError, open_decompressed
+from summarize.jobs import JobManager
+from database.statement_cache import statement_cache_totals
 from config.config_manager import config_manager
 
 # 创建FLASK应用实例
@@ -31,6 +40,7 @@ app.config['SECRET_KEY'] = config_manager.get('app.secret_key')
 app.config['UPLOAD_FOLDER'] = config_manager.get('app.upload_folder', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
 app.config['ALLOWED_EXTENSIONS'] = set(config_manager.get('app.allowed_extensions', ['csv']))
 app.config['MAX_CONTENT_LENGTH'] = config_manager.get('app.max_content_length', 16 * 1024 * 1024)  # 默认16MB
+app.config['UPLOAD_CHUNK_SIZE'] = config_manager.get('app.upload_chunk_size', 1024 * 1024)  # 流式上传分块大小，默认1MB
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -38,41 +48,246 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 # 全局数据库配置
 DB_CONFIG = config_manager.get('database', {})
 
-# 全局车辆数据处理器实例
+# 每个工作进程持有一个长期存活的车辆数据处理器，按进程号区分 fork 出的工作进程
 VEHICLE_PROCESSOR: Optional[VehicleDataProcessor] = None
+VEHICLE_PROCESSOR_PID: Optional[int] = None
+PROCESSOR_LOCK = threading.Lock()
+
+# 每个工作进程的后台任务管理器（过滤轨迹批次、确认执行）
+JOBS_ENABLED = config_manager.get('jobs.enabled', True)
+JOB_MANAGER: Optional[JobManager] = None
+JOB_MANAGER_PID: Optional[int] = None
+
+# 当前工作进程的数据库连接复用统计
+DB_CONNECTION_STATS: Dict[str, int] = {"requests": 0, "reused": 0, "new": 0}
 
 def allowed_file(filename: str) -> bool:
     """
-    检查文件是否为允许的类型
+    检查文件是否为允许的类型，支持 csv.gz 这类多段扩展名
     
     :param filename: 文件名
     :return: 是否允许上传
     """
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    lower_name = filename.lower()
+    return any(lower_name.endswith('.' + ext) for ext in app.config['ALLOWED_EXTENSIONS'])
+
+def open_upload_stream(field_name: str) -> MultipartFileStream:
+    """
+    从当前请求体中流式打开上传文件字段
+    
+    不能在此之前访问 request.files / request.form，否则请求体已被完整解析
+    
+    :param field_name: 文件字段名
+    :return: 上传文件的二进制流
+    :raises UploadStreamError: 请求不是multipart表单或缺少该字段
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        raise UploadStreamError("请求不是文件上传表单")
+    return MultipartFileStream(request.stream, boundary.encode('latin-1'), field_name,
+                               app.config['UPLOAD_CHUNK_SIZE'])
+
+def read_content_hash() -> Optional[str]:
+    """
+    读取客户端在 X-Content-SHA256 请求头中提供的上传内容摘要（解压后CSV内容的 sha256）
+
+    提供摘要时，重复上传的文件在读取请求体之前即被拒绝
+
+    :return: 小写十六进制摘要，未提供时返回None
+    :raises ValueError: 摘要格式错误
+    """
+    value = request.headers.get('X-Content-SHA256', '').strip().lower()
+    if not value:
+        return None
+    if len(value) != 64 or any(ch not in '0123456789abcdef' for ch in value):
+        raise ValueError("X-Content-SHA256 应为64位十六进制 sha256 摘要")
+    return value
+
+def parse_time_arg(value: str) -> datetime.datetime:
+    """
+    解析查询参数中的时间，支持 2024-05-01、2024-05-01T08:05、2024/05/01 08:05:30 等写法
+    
+    :param value: 时间字符串
+    :return: 时间
+    :raises ValueError: 格式错误时
+    """
+    try:
+        return datetime.datetime.fromisoformat(value.strip().replace('/', '-'))
+    except ValueError:
+        raise ValueError(f"时间格式错误: {value}")
+
+def encode_pass_cursor(position: tuple) -> str:
+    """
+    将分页位置 (pass_time, id) 编码为不透明的游标字符串
+    """
+    pass_time, record_id = position
+    raw = f"{pass_time.isoformat()}|{record_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_pass_cursor(cursor: str) -> tuple:
+    """
+    解码分页游标
+    
+    :param cursor: encode_pass_cursor 生成的游标
+    :return: (pass_time, id)
+    :raises ValueError: 游标无效时
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        pass_time, record_id = raw.split('|')
+        return datetime.datetime.fromisoformat(pass_time), int(record_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("分页游标无效")
+
+def read_batch_plates(max_plates: int) -> List[str]:
+    """
+    从请求中读取批量查询的车牌列表：JSON 请求体 {"plates": [...]}，
+    或上传的CSV文件（字段名 plates_file，每行第一列为车牌，可带 plate 表头）
+    
+    车牌去除首尾空白并去重，保持原有顺序
+    
+    :param max_plates: 最多允许的车牌数
+    :return: 车牌列表
+    :raises ValueError: 请求格式错误、没有车牌或车牌数超过上限时
+    """
+    if request.is_json:
+        body = request.get_json(silent=True)
+        values = body.get('plates') if isinstance(body, dict) else None
+        if not isinstance(values, list):
+            raise ValueError('JSON请求体应为 {"plates": [...]}')
+    else:
+        try:
+            upload = open_upload_stream('plates_file')
+        except UploadStreamError:
+            raise ValueError('请提供JSON车牌列表或上传车牌CSV文件')
+        try:
+            source = open_decompressed(upload, upload.filename or '', app.config['UPLOAD_CHUNK_SIZE'])
+            text = io.TextIOWrapper(io.BufferedReader(source), encoding='utf-8-sig', newline='')
+            values = []
+            for row in csv.reader(text):
+                if row:
+                    values.append(row[0])
+                if len(values) > max_plates + 1:
+                    break
+        finally:
+            upload.close()
+        if values and values[0].strip().lower() == 'plate':
+            values = values[1:]
+    
+    plates = list(dict.fromkeys(str(value).strip() for value in values if value is not None and str(value).strip()))
+    if not plates:
+        raise ValueError('车牌列表为空')
+    if len(plates) > max_plates:
+        raise ValueError(f'一次最多查询 {max_plates} 个车牌')
+    return plates
+
+def _json_default(value):
+    """
+    JSON序列化时间等非基本类型
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+def _get_or_create_processor() -> VehicleDataProcessor:
+    """
+    获取当前工作进程的车辆数据处理器，不存在或属于父进程时创建
+    
+    :return: VehicleDataProcessor实例
+    """
+    global VEHICLE_PROCESSOR, VEHICLE_PROCESSOR_PID
+    with PROCESSOR_LOCK:
+        if VEHICLE_PROCESSOR is None or VEHICLE_PROCESSOR_PID != os.getpid():
+            VEHICLE_PROCESSOR = VehicleDataProcessor(**DB_CONFIG)
+            VEHICLE_PROCESSOR_PID = os.getpid()
+            # 监听其它工作进程发出的车辆状态变更通知，失效本进程的查询缓存
+            VEHICLE_PROCESSOR.start_cache_listener()
+        return VEHICLE_PROCESSOR
 
 def get_vehicle_processor() -> VehicleDataProcessor:
     """
-    获取或创建车辆数据处理器实例
+    获取车辆数据处理器实例
+    
+    处理器的每次数据库操作从连接池借用连接，本次请求是否复用了已有连接在请求结束时统计
     
     :return: VehicleDataProcessor实例
     """
-    global VEHICLE_PROCESSOR
-    if VEHICLE_PROCESSOR is None:
-        VEHICLE_PROCESSOR = VehicleDataProcessor(**DB_CONFIG)
-    return VEHICLE_PROCESSOR
+    processor = _get_or_create_processor()
+    if 'vehicle_processor' not in g:
+        processor.begin_request()
+        g.vehicle_processor = processor
+    return processor
+
+def get_job_manager() -> JobManager:
+    """
+    获取当前工作进程的后台任务管理器，不存在或属于父进程时创建
+    
+    :return: JobManager实例
+    """
+    global JOB_MANAGER, JOB_MANAGER_PID
+    processor = _get_or_create_processor()
+    with PROCESSOR_LOCK:
+        if JOB_MANAGER is None or JOB_MANAGER_PID != os.getpid():
+            JOB_MANAGER = JobManager(processor.pool,
+                                     max_workers=config_manager.get('jobs.max_workers', 2),
+                                     progress_interval=config_manager.get('jobs.progress_interval', 1.0),
+                                     heartbeat_interval=config_manager.get('jobs.heartbeat_interval', 10.0),
+                                     lease_seconds=config_manager.get('jobs.lease_seconds', 60.0))
+            JOB_MANAGER_PID = os.getpid()
+        return JOB_MANAGER
+
+def _filter_batch_job(batch_id: int):
+    """
+    生成过滤轨迹批次的后台任务函数，任务使用独立的处理器和连接
+    
+    :param batch_id: 批次号
+    :return: 任务函数
+    """
+    def run(progress) -> str:
+        processor = VehicleDataProcessor(**DB_CONFIG)
+        try:
+            batch = processor.filter_vehicle_trace_batch(batch_id, progress)
+            return f'批次号 {batch_id}，共导入 {batch["imported_count"]} 条记录，有效 {batch["filtered_count"]} 条。'
+        except Exception:
+            processor.fail_import_batch(batch_id)
+            raise
+        finally:
+            processor.close()
+    return run
+
+def _process_batches_job(batch_ids: Optional[List[int]]):
+    """
+    生成确认执行的后台任务函数，任务使用独立的处理器和连接
+    
+    :param batch_ids: 批次号列表，None表示所有待处理批次
+    :return: 任务函数
+    """
+    def run(progress) -> str:
+        processor = VehicleDataProcessor(**DB_CONFIG)
+        try:
+            if not processor.process_vehicle_data(batch_ids, progress):
+                raise RuntimeError('数据处理失败，请检查是否有待处理的导入批次及数据格式！')
+            return '数据处理成功，已生成车辆记录并更新车辆信息！'
+        finally:
+            processor.close()
+    return run
 
-@app.teardown_appcontext
-def close_database_connection(exception: Optional[Exception] = None) -> None:
+@app.after_request
+def record_connection_reuse(response):
     """
-    应用上下文结束时关闭数据库连接
+    统计访问数据库的请求是否复用了连接，并通过响应头返回
     
-    :param exception: 异常信息（如果有）
+    :param response: 响应对象
+    :return: 响应对象
     """
-    global VEHICLE_PROCESSOR
-    if VEHICLE_PROCESSOR is not None:
-        VEHICLE_PROCESSOR.close()
-        VEHICLE_PROCESSOR = None
+    processor = g.pop('vehicle_processor', None)
+    reused = processor.connection_reused() if processor is not None else None
+    if reused is not None:
+        with PROCESSOR_LOCK:
+            DB_CONNECTION_STATS["requests"] += 1
+            DB_CONNECTION_STATS["reused" if reused else "new"] += 1
+        response.headers['X-DB-Connection-Reused'] = '1' if reused else '0'
+    return response
 
 @app.route('/')
 def index() -> str:
@@ -85,6 +300,38 @@ def index() -> str:
 
 
 
+@app.route('/stats')
+def stats():
+    """
+    当前工作进程的运行统计
+    
+    :return: JSON响应，包含连接复用计数、连接池状态、预编译语句缓存计数和车辆状态缓存统计
+    """
+    with PROCESSOR_LOCK:
+        db_stats = dict(DB_CONNECTION_STATS, pid=os.getpid())
+        processor = VEHICLE_PROCESSOR if VEHICLE_PROCESSOR_PID == os.getpid() else None
+    pool_stats = processor.pool.stats() if processor else None
+    cache_stats = processor.vehicle_cache.stats() if processor and processor.vehicle_cache else None
+    return jsonify(db_connection=db_stats, pool=pool_stats, statement_cache=statement_cache_totals(),
+                   vehicle_cache=cache_stats)
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id: int):
+    """
+    后台任务状态查询路由
+    
+    :param job_id: 任务号
+    :return: JSON响应，包含任务状态、已处理行数、吞吐量（行/秒）和预计剩余秒数
+    """
+    try:
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify(success=False, message=f'任务 {job_id} 不存在！'), 404
+        return jsonify(success=True, job=job)
+    except Exception as e:
+        app.logger.error(f'查询后台任务错误: {str(e)}')
+        return jsonify(success=False, message=f'查询后台任务失败: {str(e)}')
+
 @app.route('/import-vehicle-info', methods=['POST'])
 def import_vehicle_info():
     """
@@ -95,45 +342,44 @@ def import_vehicle_info():
     :return: JSON响应，包含操作结果
     """
     try:
-        # 检查是否有文件上传
-        if 'vehicle_info_file' not in request.files:
-            return jsonify(success=False, message='请选择要上传的文件！')
-        
-        file = request.files['vehicle_info_file']
-        
-        # 检查文件名是否为空
-        if file.filename == '':
+        # 直接解析请求体，定位上传文件字段（不保存到上传目录）
+        try:
+            upload = open_upload_stream('vehicle_info_file')
+        except UploadStreamError as e:
+            app.logger.warning(f'车辆信息上传请求无效: {str(e)}')
             return jsonify(success=False, message='请选择要上传的文件！')
         
-        # 检查文件类型
-        if not (file and allowed_file(file.filename)):
-            return jsonify(success=False, message='只支持CSV文件格式！')
-        
-        # 保存文件到临时目录
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
         try:
+            # 检查文件名是否为空
+            if not upload.filename:
+                return jsonify(success=False, message='请选择要上传的文件！')
+            
+            # 检查文件类型
+            if not allowed_file(upload.filename):
+                return jsonify(success=False, message='只支持CSV文件格式（可压缩为 .csv.gz / .csv.zst / .zip）！')
+            
             # 获取车辆数据处理器实例
             processor = get_vehicle_processor()
             
-            # 导入车辆信息
-            imported_count = processor.import_vehicle_info_from_csv(file_path)
+            # 导入车辆信息，上传内容按块流式解压并送入COPY
+            result = processor.import_vehicle_info_from_csv(
+                open_decompressed(upload, upload.filename, app.config['UPLOAD_CHUNK_SIZE']))
             
             # 导入成功，记录日志
-            app.logger.info(f'车辆信息导入成功: {imported_count} 条记录')
+            app.logger.info(f'车辆信息导入成功: {result}')
             
-            return jsonify(success=True, message=f'车辆信息导入成功！共导入 {imported_count} 条记录。')
+            return jsonify(success=True,
+                           message=f'车辆信息导入成功！新增 {result["inserted"]} 条，更新 {result["updated"]} 条，'
+                                   f'拒绝 {result["rejected"]} 条。',
+                           result=result)
             
         except Exception as e:
             # 导入失败
             app.logger.error(f'车辆信息导入错误: {str(e)}')
             return jsonify(success=False, message=f'车辆信息导入失败: {str(e)}')
         finally:
-            # 清理临时文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # 丢弃未读取的请求体
+            upload.close()
                 
     except Exception as e:
         app.logger.error(f'处理车辆信息文件时出错: {str(e)}')
@@ -149,45 +395,64 @@ def import_vehicle_trace():
     :return: JSON响应，包含操作结果
     """
     try:
-        # 检查是否有文件上传
-        if 'vehicle_trace_file' not in request.files:
-            return jsonify(success=False, message='请选择要上传的文件！')
-        
-        file = request.files['vehicle_trace_file']
-        
-        # 检查文件名是否为空
-        if file.filename == '':
+        # 直接解析请求体，定位上传文件字段（不保存到上传目录）
+        try:
+            upload = open_upload_stream('vehicle_trace_file')
+        except UploadStreamError as e:
+            app.logger.warning(f'车辆轨迹上传请求无效: {str(e)}')
             return jsonify(success=False, message='请选择要上传的文件！')
         
-        # 检查文件类型
-        if not (file and allowed_file(file.filename)):
-            return jsonify(success=False, message='只支持CSV文件格式！')
-        
-        # 保存文件到临时目录
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
         try:
+            # 检查文件名是否为空
+            if not upload.filename:
+                return jsonify(success=False, message='请选择要上传的文件！')
+            
+            # 检查文件类型
+            if not allowed_file(upload.filename):
+                return jsonify(success=False, message='只支持CSV文件格式（可压缩为 .csv.gz / .csv.zst / .zip）！')
+            
+            filename = secure_filename(upload.filename)
+            content_hash = read_content_hash()
+            
             # 获取车辆数据处理器实例
             processor = get_vehicle_processor()
             
-            # 导入车辆轨迹
-            imported_count = processor.import_vehicle_trace_from_csv(file_path)
+            # 上传内容按块流式解压并送入COPY，登记为一个导入批次（请求体必须在本次请求内读完）
+            source = open_decompressed(upload, upload.filename, app.config['UPLOAD_CHUNK_SIZE'])
+            if processor.trace_ingest == 'binary':
+                # 客户端校验后直接写入过滤表，没有单独的过滤步骤
+                batch = processor.ingest_vehicle_trace_binary(source, filename=filename, content_hash=content_hash)
+                app.logger.info(f'车辆轨迹导入成功: 批次 {batch["batch_id"]}, {batch["imported_count"]} 条记录')
+                return jsonify(success=True,
+                               message=f'车辆轨迹导入成功！批次号 {batch["batch_id"]}，共导入 {batch["imported_count"]} 条记录，'
+                                       f'有效 {batch["filtered_count"]} 条，标记号无效 {batch["rejected_count"]} 条。',
+                               batch=batch)
+            if not JOBS_ENABLED:
+                batch = processor.import_vehicle_trace_from_csv(source, filename=filename, content_hash=content_hash)
+                app.logger.info(f'车辆轨迹导入成功: 批次 {batch["batch_id"]}, {batch["imported_count"]} 条记录')
+                return jsonify(success=True,
+                               message=f'车辆轨迹导入成功！批次号 {batch["batch_id"]}，共导入 {batch["imported_count"]} 条记录，'
+                                       f'有效 {batch["filtered_count"]} 条。',
+                               batch=batch)
             
-            # 导入成功，记录日志
-            app.logger.info(f'车辆轨迹导入成功: {imported_count} 条记录')
+            batch = processor.load_vehicle_trace(source, filename=filename, content_hash=content_hash)
+            
+            # 过滤与校验在后台任务中执行，前端通过 /jobs/<job_id> 查询进度
+            job_id = get_job_manager().submit('filter_trace', _filter_batch_job(batch["batch_id"]),
+                                              batch_id=batch["batch_id"])
+            app.logger.info(f'车辆轨迹上传完成: 批次 {batch["batch_id"]}, {batch["imported_count"]} 条记录, 过滤任务 {job_id}')
             
-            return jsonify(success=True, message=f'车辆轨迹导入成功！共导入 {imported_count} 条记录。')
+            return jsonify(success=True,
+                           message=f'车辆轨迹上传完成！批次号 {batch["batch_id"]}，共 {batch["imported_count"]} 条记录，正在后台过滤…',
+                           batch=batch, job_id=job_id)
             
         except Exception as e:
             # 导入失败
             app.logger.error(f'车辆轨迹导入错误: {str(e)}')
             return jsonify(success=False, message=f'车辆轨迹导入失败: {str(e)}')
         finally:
-            # 清理临时文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # 丢弃未读取的请求体
+            upload.close()
                 
     except Exception as e:
         app.logger.error(f'处理车辆轨迹文件时出错: {str(e)}')
@@ -229,26 +494,91 @@ def query_vehicle():
         app.logger.error(f'车辆状态查询错误: {str(e)}')
         return jsonify(success=False, message=f'查询出错: {str(e)}', vehicles=[])
 
+@app.route('/vehicles/query-batch', methods=['POST'])
+def query_vehicles_batch():
+    """
+    车辆状态批量查询路由
+    
+    接受 JSON 请求体 {"plates": [...]} 或上传的车牌CSV文件（字段名 plates_file），
+    所有车牌在一条查询中完成，结果以 JSON Lines 流式返回：按请求顺序每个车牌一行，
+    找到时为 {"plate": ..., "found": true, ...车辆信息}，否则为 {"plate": ..., "found": false}
+    
+    :return: application/x-ndjson 响应，请求无效时为JSON错误响应
+    """
+    try:
+        processor = get_vehicle_processor()
+        try:
+            plates = read_batch_plates(processor.batch_query_max_plates)
+        except ValueError as e:
+            return jsonify(success=False, message=str(e)), 400
+        
+        vehicles = processor.query_vehicles_batch(plates)
+        app.logger.info(f'车辆状态批量查询: {len(plates)} 个车牌, 找到 {len(vehicles)} 个')
+        
+        def generate():
+            for plate in plates:
+                vehicle = vehicles.get(plate)
+                line = dict(vehicle, found=True) if vehicle else {"plate": plate, "found": False}
+                yield json.dumps(line, ensure_ascii=False, default=_json_default) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson')
+    except Exception as e:
+        app.logger.error(f'车辆状态批量查询错误: {str(e)}')
+        return jsonify(success=False, message=f'查询出错: {str(e)}'), 500
+
+@app.route('/vehicles/<plate>/passes', methods=['GET'])
+def vehicle_passes(plate: str):
+    """
+    车辆通行记录查询路由
+    
+    查询参数：from / to 为时间范围（默认最近 passes_default_days 天，to 不包含），
+    limit 为每页记录数，after 为上一页返回的 next_cursor
+    
+    :param plate: 车牌号
+    :return: JSON响应，包含通行记录列表和下一页游标（没有更多记录时为null）
+    """
+    try:
+        processor = get_vehicle_processor()
+        try:
+            end = parse_time_arg(request.args['to']) if request.args.get('to') else datetime.datetime.now()
+            start = (parse_time_arg(request.args['from']) if request.args.get('from')
+                     else end - datetime.timedelta(days=processor.passes_default_days))
+            after = decode_pass_cursor(request.args['after']) if request.args.get('after') else None
+            limit = int(request.args.get('limit', processor.passes_page_size))
+            if not 0 < limit <= processor.passes_max_page_size:
+                raise ValueError(f"limit 应在 1 到 {processor.passes_max_page_size} 之间")
+        except ValueError as e:
+            return jsonify(success=False, message=f'查询参数错误: {str(e)}'), 400
+        
+        page = processor.query_vehicle_passes(plate, start, end, after, limit)
+        passes = [{"id": row["id"], "mark": row["mark"], "pass_time": row["pass_time"].isoformat()}
+                  for row in page["passes"]]
+        return jsonify(success=True, plate=plate, start=start.isoformat(), end=end.isoformat(), passes=passes,
+                       next_cursor=encode_pass_cursor(page["next"]) if page["next"] else None)
+    except Exception as e:
+        app.logger.error(f'车辆通行记录查询错误: {str(e)}')
+        return jsonify(success=False, message=f'查询出错: {str(e)}', passes=[]), 500
+
 @app.route('/undo-import', methods=['POST'])
 def undo_import():
     """
     撤销导入路由
     
-    清空过滤表中的所有数据，撤销之前的导入操作
+    撤销所有待处理的导入批次，清空其过滤数据
     
-    :return: 重定向到首页，显示操作结果消息
+    :return: JSON响应，包含操作结果
     """
     try:
         # 获取车辆数据处理器实例
         processor = get_vehicle_processor()
         
-        # 清空过滤表
-        with processor.db_connection():
-            processor.postgresql_client.execute("TRUNCATE TABLE filtered_trace_data")
+        # 撤销所有待处理批次
+        discarded_ids = processor.discard_import_batches()
         
         # 操作成功，显示结果
-        app.logger.info('撤销导入操作成功')
-        return jsonify(success=True, message='已撤销所有导入操作，过滤表已清空！')
+        app.logger.info(f'撤销导入操作成功: {discarded_ids}')
+        return jsonify(success=True, message=f'已撤销所有导入操作，共撤销 {len(discarded_ids)} 个批次！',
+                       batch_ids=discarded_ids)
         
     except Exception as e:
         # 操作失败
@@ -260,16 +590,97 @@ def confirm_execution():
     """
     确认执行路由
     
-    处理TMP1表中的数据，生成车辆记录并更新车辆信息
+    处理所有待处理导入批次中的数据，生成车辆记录并更新车辆信息
+    
+    :return: JSON响应，包含操作结果
+    """
+    return _confirm_batches(None)
+
+@app.route('/import-batches', methods=['GET'])
+def list_import_batches():
+    """
+    导入批次列表路由
+    
+    可通过 status 参数筛选：pending / confirmed / discarded / expired
     
-    :return: 重定向到首页，显示操作结果消息
+    :return: JSON响应，包含批次列表
     """
     try:
+        processor = get_vehicle_processor()
+        batches = processor.list_import_batches(request.args.get('status') or None)
+        return jsonify(success=True, batches=batches)
+    except Exception as e:
+        app.logger.error(f'查询导入批次错误: {str(e)}')
+        return jsonify(success=False, message=f'查询导入批次失败: {str(e)}', batches=[])
+
+@app.route('/import-batches/<int:batch_id>/confirm', methods=['POST'])
+def confirm_import_batch(batch_id: int):
+    """
+    确认执行单个导入批次
+    
+    :param batch_id: 批次号
+    :return: JSON响应，包含操作结果
+    """
+    return _confirm_batches([batch_id])
+
+@app.route('/import-batches/<int:batch_id>/discard', methods=['POST'])
+def discard_import_batch(batch_id: int):
+    """
+    撤销单个导入批次
+    
+    :param batch_id: 批次号
+    :return: JSON响应，包含操作结果
+    """
+    try:
+        processor = get_vehicle_processor()
+        discarded_ids = processor.discard_import_batches([batch_id])
+        if not discarded_ids:
+            return jsonify(success=False, message=f'批次 {batch_id} 不存在或已处理！')
+        app.logger.info(f'撤销导入批次成功: {batch_id}')
+        return jsonify(success=True, message=f'已撤销批次 {batch_id}！')
+    except Exception as e:
+        app.logger.error(f'撤销导入批次错误: {str(e)}')
+        return jsonify(success=False, message=f'撤销导入批次失败: {str(e)}')
+
+@app.route('/reconcile-late-arrivals', methods=['POST'])
+def reconcile_late_arrivals():
+    """
+    迟到记录对账路由
+
+    将增量处理中早于车辆水位线的迟到记录补入车辆通行记录
+
+    :return: JSON响应，包含操作结果
+    """
+    try:
+        processor = get_vehicle_processor()
+        result = processor.reconcile_late_arrivals()
+        app.logger.info(f'迟到记录对账成功: {result}')
+        return jsonify(success=True, message=f'已处理 {result["taken"]} 条迟到记录，补入 {result["inserted"]} 条通行记录！',
+                       **result)
+    except Exception as e:
+        app.logger.error(f'迟到记录对账错误: {str(e)}')
+        return jsonify(success=False, message=f'迟到记录对账失败: {str(e)}')
+
+def _confirm_batches(batch_ids: Optional[List[int]]):
+    """
+    执行数据处理并返回JSON响应
+    
+    :param batch_ids: 批次号列表，None表示所有待处理批次
+    :return: JSON响应，包含操作结果
+    """
+    try:
+        if JOBS_ENABLED:
+            # 数据处理在后台任务中执行，前端通过 /jobs/<job_id> 查询进度
+            job_id = get_job_manager().submit('process_data', _process_batches_job(batch_ids),
+                                              batch_id=batch_ids[0] if batch_ids else None)
+            app.logger.info(f'数据处理任务已提交: {job_id}')
+            return jsonify(success=True, message='数据处理已在后台开始…', job_id=job_id)
+        
         # 获取车辆数据处理器实例
         processor = get_vehicle_processor()
         
         # 执行数据处理
-        success = processor.process_vehicle_data()
+        success = processor.process_vehicle_data(batch_ids)
         
         if success:
             # 操作成功，显示结果
@@ -277,7 +688,7 @@ def confirm_execution():
             return jsonify(success=True, message='数据处理成功，已生成车辆记录并更新车辆信息！')
         else:
             app.logger.error('数据处理执行失败')
-            return jsonify(success=False, message='数据处理失败，请检查表中的数据格式！')
+            return jsonify(success=False, message='数据处理失败，请检查是否有待处理的导入批次及数据格式！')
         
     except Exception as e:
         # 操作失败
@@ -288,6 +699,26 @@ def confirm_execution():
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+def warm_up_worker() -> None:
+    """
+    工作进程启动时即创建处理器并建立连接，避免首个请求承担建连开销；数据库暂不可用时在首个请求时重试
+
+    直接运行时在启动前调用；gunicorn 由 gunicorn.conf.py 的 post_worker_init 钩子、uWSGI 由 postfork 钩子
+    在每个工作进程中调用（不在导入时调用，预加载模式下主进程建立的连接会被 fork 出的工作进程继承）
+    """
+    try:
+        _get_or_create_processor().ensure_connection()
+        app.logger.info(f'工作进程 {os.getpid()} 已预热数据库连接')
+    except Exception as e:
+        app.logger.warning(f'启动时建立数据库连接失败: {str(e)}')
+
+try:
+    from uwsgidecorators import postfork
+    postfork(warm_up_worker)
+except ImportError:
+    pass
+
 if __name__ == '__main__':
+    warm_up_worker()
     # 在生产环境中应设置debug=False
     app.run(host='0.0.0.0', port=5000, debug=False)
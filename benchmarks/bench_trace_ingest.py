@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+轨迹导入基准测试：端到端比较两种导入方式从轨迹文件到写入vehicle_record的耗时
+
+- copy：文本COPY到原始表（VARCHAR）→ INSERT ... SELECT（TO_TIMESTAMP 转换、关联vehicle_info）到过滤表
+  → 确认执行（暂存表、写入vehicle_record、更新vehicle_info）
+- binary：客户端解析时间、校验车牌和标记号 → 二进制COPY直接写入过滤表 → 确认执行
+
+测试数据使用 BENCH 前缀的车牌。每次运行后删除其通行记录、导入文件登记和迟到记录并重置车辆状态，
+下一次运行从相同状态开始导入同一文件；结束后删除测试车辆。
+数据库连接默认取 config.json 中的 database 配置，可用命令行参数覆盖
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config_manager import config_manager
+from summarize.summarize import VehicleDataProcessor
+
+PLATE_PREFIX = "BENCH"
+
+
+def generate_trace_csv(path: str, rows: int, plates: int, marks: list, seed: int) -> None:
+    """
+    生成测试轨迹CSV：每分钟约有 plates / 10 条记录，约 1% 的行标记号无效
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("plate,pass_time,mark\n")
+        for i in range(rows):
+            plate = f"{PLATE_PREFIX}{rng.randrange(plates):06d}"
+            pass_time = start + datetime.timedelta(minutes=i * 10 // plates)
+            mark = rng.choice(marks) if rng.random() >= 0.01 else "BAD"
+            f.write(f"{plate},{pass_time:%Y/%m/%d %H:%M},{mark}\n")
+
+
+def create_bench_vehicles(processor: VehicleDataProcessor, plates: int) -> None:
+    client = processor.postgresql_client
+    with processor.db_connection():
+        client.delete("vehicle_info", "plate LIKE %s", (f"{PLATE_PREFIX}%",))
+        client.insert_many("vehicle_info",
+                           [("bench", "13800000000", f"{PLATE_PREFIX}{i:06d}", "bench") for i in range(plates)],
+                           columns=["username", "phone_num", "plate", "vehicle_type"])
+
+
+def drop_bench_vehicles(processor: VehicleDataProcessor) -> None:
+    with processor.db_connection():
+        processor.postgresql_client.delete("vehicle_info", "plate LIKE %s", (f"{PLATE_PREFIX}%",))
+
+
+def reset_bench_state(processor: VehicleDataProcessor, batch_ids: list) -> None:
+    """
+    撤销未确认的批次，删除测试车牌的通行记录、迟到记录和批次的导入文件登记，并重置车辆状态
+    """
+    client = processor.postgresql_client
+    if batch_ids:
+        processor.discard_import_batches(batch_ids)
+    with processor.db_connection():
+        client.delete(client.VEHICLE_RECORD_TABLE, "plate LIKE %s", (f"{PLATE_PREFIX}%",))
+        client.delete(client.LATE_ARRIVAL_TABLE, "plate LIKE %s", (f"{PLATE_PREFIX}%",))
+        if batch_ids:
+            client.delete(client.INGEST_LEDGER_TABLE, "batch_id = ANY(%s)", (batch_ids,))
+        client.update("vehicle_info",
+                      {"last_record": None, "last_record_time": None, "mileage": 0, "points": 0},
+                      "plate LIKE %s", (f"{PLATE_PREFIX}%",))
+
+
+def count_bench_records(processor: VehicleDataProcessor) -> int:
+    with processor.db_connection():
+        rows = processor.postgresql_client.execute(
+            "SELECT COUNT(*) AS record_count FROM vehicle_record WHERE plate LIKE %s", (f"{PLATE_PREFIX}%",))
+        return rows[0]["record_count"]
+
+
+def confirm_batch(processor: VehicleDataProcessor, result: dict, started: float) -> dict:
+    """
+    确认执行批次（写入vehicle_record并更新vehicle_info），补充 process 与 total 耗时
+    """
+    processing = time.perf_counter()
+    if not processor.process_vehicle_data([result["batch_id"]]):
+        raise RuntimeError(f"批次 {result['batch_id']} 确认执行失败")
+    finished = time.perf_counter()
+    result["timings"].update(process=finished - processing, total=finished - started)
+    result["record_count"] = count_bench_records(processor)
+    return result
+
+
+def run_copy(processor: VehicleDataProcessor, path: str, batch_ids: list) -> dict:
+    started = time.perf_counter()
+    batch = processor.load_vehicle_trace(path)
+    batch_ids.append(batch["batch_id"])
+    loaded = time.perf_counter()
+    result = processor.filter_vehicle_trace_batch(batch["batch_id"])
+    filtered = time.perf_counter()
+    result["timings"] = {"load": loaded - started, "filter": filtered - loaded}
+    return confirm_batch(processor, result, started)
+
+
+def run_binary(processor: VehicleDataProcessor, path: str, batch_ids: list) -> dict:
+    started = time.perf_counter()
+    result = processor.ingest_vehicle_trace_binary(path)
+    batch_ids.append(result["batch_id"])
+    result["timings"] = {"ingest": time.perf_counter() - started}
+    return confirm_batch(processor, result, started)
+
+
+def main() -> int:
+    db_config = dict(config_manager.get('database', {}))
+    parser = argparse.ArgumentParser(description="轨迹导入端到端基准测试（copy 与 binary 两种方式，至vehicle_record）")
+    parser.add_argument("--rows", type=int, default=1000000, help="轨迹记录行数")
+    parser.add_argument("--plates", type=int, default=10000, help="车牌数")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式的运行次数（取最快一次）")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    parser.add_argument("--host", default=db_config.get("host"))
+    parser.add_argument("--port", type=int, default=db_config.get("port"))
+    parser.add_argument("--user", default=db_config.get("user"))
+    parser.add_argument("--password", default=db_config.get("password"))
+    parser.add_argument("--dbname", default=db_config.get("dbname"))
+    args = parser.parse_args()
+
+    processor = VehicleDataProcessor(args.host, args.port, args.user, args.password, args.dbname)
+    marks = [mark for path in processor.standard_path for mark in path]
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    batch_ids = []  # 出错时尚未清理的批次
+    try:
+        generate_trace_csv(path, args.rows, args.plates, marks, args.seed)
+        create_bench_vehicles(processor, args.plates)
+        reset_bench_state(processor, [])
+        print(f"{args.rows} 行, {args.plates} 个车牌, 文件 {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        for name, run in (("copy", run_copy), ("binary", run_binary)):
+            best = None
+            for _ in range(args.repeat):
+                try:
+                    result = run(processor, path, batch_ids)
+                finally:
+                    reset_bench_state(processor, batch_ids)
+                    batch_ids.clear()
+                if best is None or result["timings"]["total"] < best["timings"]["total"]:
+                    best = result
+            timings = ", ".join(f"{key} {value:.2f}s" for key, value in best["timings"].items())
+            print(f"{name:>6}: {timings} | 导入 {best['imported_count']} 行, 过滤表 {best['filtered_count']} 行, "
+                  f"通行记录 {best['record_count']} 行, {best['imported_count'] / best['timings']['total']:,.0f} 行/秒")
+    finally:
+        drop_bench_vehicles(processor)
+        processor.close()
+        os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from database.statement_cache import CachedStatementConnection
+
+# 获取或创建logger
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """
+    在 acquire_timeout 内未能从连接池获取到连接
+    """
+    pass
+
+
+class PooledConnection(CachedStatementConnection):
+    """
+    携带连接池元数据的连接对象（预编译语句缓存随物理连接保留）
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.borrow_count = 0  # 被借出的次数，大于1表示复用了已有的物理连接
+
+
+class ConnectionPool:
+    """
+    线程安全的PostgreSQL连接池
+
+    - min_size/max_size：常驻与最大连接数
+    - max_lifetime：连接最长存活秒数，超过后归还时关闭
+    - health_check_interval：空闲超过该秒数的连接在借出前执行 SELECT 1 检查
+    - acquire_timeout：连接耗尽时的最长等待秒数
+    """
+
+    def __init__(self, conn_params: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 3600, acquire_timeout: float = 30,
+                 health_check_interval: float = 30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"连接池大小配置错误: min_size={min_size}, max_size={max_size}")
+        self.conn_params = dict(conn_params)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {"acquired": 0, "created": 0, "discarded": 0, "timeouts": 0}
+
+        # 预建常驻连接，数据库暂不可用时延迟到首次借用
+        try:
+            for _ in range(min_size):
+                conn = self._create_connection()
+                with self._cond:
+                    self._size += 1
+                    self._idle.append(conn)
+        except psycopg2.Error as e:
+            logger.warning(f"连接池预建连接失败，将在首次使用时重试: {e}")
+
+    def _create_connection(self) -> PooledConnection:
+        """
+        新建一个物理连接
+        """
+        conn = psycopg2.connect(connection_factory=PooledConnection, **self.conn_params)
+        with self._cond:
+            self._stats["created"] += 1
+        logger.info("PostgreSQL 连接池新建连接")
+        return conn
+
+    def _expired(self, conn: PooledConnection) -> bool:
+        """
+        判断连接是否超过最长存活时间
+        """
+        return self.max_lifetime is not None and time.monotonic() - conn.created_at > self.max_lifetime
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        """
+        检查连接是否可用，空闲时间较短的连接跳过探测
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"连接健康检查失败，丢弃连接: {e}")
+            return False
+
+    def _close_connection(self, conn: PooledConnection) -> None:
+        """
+        关闭物理连接并释放占用的名额（调用方需持有锁）
+        """
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+        self._size -= 1
+        self._stats["discarded"] += 1
+        self._cond.notify()
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        从连接池借出连接
+
+        :param timeout: 等待超时秒数，None 使用 acquire_timeout
+        :return: 可用连接
+        :raises PoolTimeoutError: 超时仍无可用连接
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("连接池已关闭")
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"{timeout} 秒内未能获取数据库连接（max_size={self.max_size}）")
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    conn = self._create_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif self._expired(conn) or not self._is_healthy(conn):
+                with self._cond:
+                    self._close_connection(conn)
+                continue
+
+            with self._cond:
+                self._stats["acquired"] += 1
+            conn.borrow_count += 1
+            return conn
+
+    def release(self, conn: PooledConnection, discard: bool = False) -> None:
+        """
+        归还连接，未结束的事务会被回滚
+
+        :param conn: 借出的连接
+        :param discard: 为 True 时直接关闭该连接（如连接已出错）
+        """
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = False
+            except psycopg2.Error as e:
+                logger.warning(f"归还连接时重置失败，丢弃连接: {e}")
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed or self._expired(conn):
+                self._close_connection(conn)
+                return
+            conn.last_used_at = time.monotonic()
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self) -> None:
+        """
+        关闭连接池中的所有空闲连接，之后不再借出连接
+        """
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close_connection(self._idle.pop())
+            self._cond.notify_all()
+        logger.info("PostgreSQL 连接池已关闭")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取连接池统计信息
+
+        :return: 包含当前连接数、空闲数及累计计数的字典
+        """
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle), max_size=self.max_size)
+
+
+# 按进程和连接参数共享的连接池
+_shared_pools: Dict[Tuple, ConnectionPool] = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(conn_params: Dict[str, Any], **pool_options) -> ConnectionPool:
+    """
+    获取当前进程内与连接参数对应的共享连接池，不存在时创建
+
+    fork 出的子进程不会复用父进程的连接
+
+    :param conn_params: psycopg2.connect 的连接参数
+    :param pool_options: ConnectionPool 的其它构造参数，仅在首次创建时生效
+    :return: 共享连接池
+    """
+    key = (os.getpid(),) + tuple(sorted((k, str(v)) for k, v in conn_params.items()))
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(conn_params, **pool_options)
+            _shared_pools[key] = pool
+        return pool
@@ -0,0 +1,219 @@
+import io
+import struct
+import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# COPY 文本格式中需要转义的字符
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def format_copy_row(values: Iterable[Any]) -> str:
+    """
+    将一行数据格式化为 COPY 文本格式（制表符分隔，None 输出为 \\N）
+
+    :param values: 字段值序列
+    :return: 以换行结尾的一行 COPY 文本
+    """
+    return '\t'.join(
+        '\\N' if value is None else str(value).translate(_COPY_ESCAPES)
+        for value in values
+    ) + '\n'
+
+
+class IteratorFile(io.TextIOBase):
+    """
+    将按行产生文本的迭代器包装为只读文件对象，供 cursor.copy_expert 分块读取
+
+    内存占用只与单次 read 的大小有关，与数据总量无关
+    """
+
+    def __init__(self, lines: Iterable[str]):
+        self._lines: Iterator[str] = iter(lines)
+        self._buffer = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        """
+        读取至多 size 个字符，size 为负数或 None 时读取全部
+        """
+        if size is None or size < 0:
+            data = self._buffer + ''.join(self._lines)
+            self._buffer = ''
+            return data
+
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while length < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+# PostgreSQL 二进制 COPY 格式：文件头、时间基准与各类型的编码
+BINARY_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+BINARY_COPY_TRAILER = struct.pack('!h', -1)
+_PG_EPOCH = datetime.datetime(2000, 1, 1)
+_PG_EPOCH_DATE = datetime.date(2000, 1, 1)
+# 二进制 timestamp 为自 2000-01-01 起的微秒数，加上该偏移换算为自 1970-01-01 起的微秒数
+PG_EPOCH_OFFSET_US = (_PG_EPOCH - datetime.datetime(1970, 1, 1)) // datetime.timedelta(microseconds=1)
+_NULL_FIELD = struct.pack('!i', -1)
+
+
+def _encode_text(value: Any) -> bytes:
+    return str(value).encode('utf-8')
+
+
+def _encode_timestamp(value: datetime.datetime) -> bytes:
+    return struct.pack('!q', (value - _PG_EPOCH) // datetime.timedelta(microseconds=1))
+
+
+def _encode_date(value: datetime.date) -> bytes:
+    return struct.pack('!i', (value - _PG_EPOCH_DATE).days)
+
+
+def _struct_encoder(fmt: str) -> Callable[[Any], bytes]:
+    packer = struct.Struct(fmt)
+    return lambda value: packer.pack(value)
+
+
+_BINARY_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    'smallint': _struct_encoder('!h'),
+    'integer': _struct_encoder('!i'),
+    'bigint': _struct_encoder('!q'),
+    'real': _struct_encoder('!f'),
+    'double precision': _struct_encoder('!d'),
+    'boolean': lambda value: b'\x01' if value else b'\x00',
+    'text': _encode_text,
+    'varchar': _encode_text,
+    'timestamp': _encode_timestamp,
+    'date': _encode_date,
+}
+
+# 类型别名 -> 标准类型名
+_BINARY_TYPE_ALIASES = {
+    'int2': 'smallint', 'int': 'integer', 'int4': 'integer', 'serial': 'integer',
+    'int8': 'bigint', 'bigserial': 'bigint', 'float4': 'real', 'float8': 'double precision',
+    'float': 'double precision', 'bool': 'boolean', 'character varying': 'varchar',
+    'timestamp without time zone': 'timestamp',
+}
+
+
+def binary_encoder(type_name: str) -> Callable[[Any], bytes]:
+    """
+    获取列类型对应的二进制 COPY 编码函数
+
+    :param type_name: 列类型，如 integer、varchar(20)、timestamp、double precision
+    :return: 将 Python 值编码为字段内容的函数
+    :raises ValueError: 不支持的类型
+    """
+    name = type_name.strip().lower().split('(')[0].strip()
+    name = _BINARY_TYPE_ALIASES.get(name, name)
+    if name not in _BINARY_ENCODERS:
+        raise ValueError(f"二进制COPY不支持的列类型: {type_name}")
+    return _BINARY_ENCODERS[name]
+
+
+def iter_binary_copy(rows: Iterable[Sequence[Any]], column_types: Sequence[str]) -> Iterator[bytes]:
+    """
+    将数据行编码为 PostgreSQL 二进制 COPY 格式
+
+    :param rows: 数据行，字段顺序与 column_types 一致
+    :param column_types: 各列类型
+    :return: 按行产生字节串的迭代器（含文件头和结束标记）
+    """
+    encoders = [binary_encoder(type_name) for type_name in column_types]
+    field_count = struct.pack('!h', len(encoders))
+    pack_length = struct.Struct('!i').pack
+    yield BINARY_COPY_HEADER
+    for row in rows:
+        parts = [field_count]
+        for encode, value in zip(encoders, row):
+            if value is None:
+                parts.append(_NULL_FIELD)
+            else:
+                data = encode(value)
+                parts.append(pack_length(len(data)))
+                parts.append(data)
+        yield b''.join(parts)
+    yield BINARY_COPY_TRAILER
+
+
+def read_binary_copy_int64(data: bytes, field_count: int) -> List[np.ndarray]:
+    """
+    将二进制 COPY 输出解析为按列的 int64 数组，各列须为 8 字节的非空值（bigint，或 timestamp 的自 2000-01-01 起微秒数）
+
+    每行长度固定，直接以结构化 dtype 映射整个缓冲区，不为每行创建 Python 对象
+
+    :param data: COPY ... TO STDOUT WITH BINARY 的完整输出
+    :param field_count: 每行的列数
+    :return: field_count 个 int64 数组
+    :raises ValueError: 格式不符或存在空值
+    """
+    view = memoryview(data)
+    if bytes(view[:11]) != BINARY_COPY_HEADER[:11]:
+        raise ValueError("不是二进制COPY格式的数据")
+    offset = 19 + struct.unpack('!i', view[15:19])[0]
+    row_dtype = np.dtype([('count', '>i2')] + [(f'f{index}', [('length', '>i4'), ('value', '>i8')])
+                                                for index in range(field_count)])
+    body = len(view) - offset - len(BINARY_COPY_TRAILER)
+    if body < 0 or body % row_dtype.itemsize or bytes(view[offset + body:]) != BINARY_COPY_TRAILER:
+        raise ValueError("二进制COPY数据的行长度与列定义不一致")
+    rows = np.frombuffer(view, dtype=row_dtype, count=body // row_dtype.itemsize, offset=offset)
+    if (rows['count'] != field_count).any():
+        raise ValueError("二进制COPY数据的列数与列定义不一致")
+    columns = []
+    for index in range(field_count):
+        field = rows[f'f{index}']
+        if (field['length'] != 8).any():
+            raise ValueError("二进制COPY数据中存在空值或非8字节的列")
+        columns.append(field['value'].astype(np.int64))
+    return columns
+
+
+class BytesIteratorFile(io.RawIOBase):
+    """
+    将按块产生字节串的迭代器包装为只读二进制文件对象，供二进制 COPY 分块读取
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._chunks: Iterator[bytes] = iter(chunks)
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        """
+        读取至多 len(buffer) 字节，合并多个小块以减少 COPY 数据消息的数量
+        """
+        size = len(buffer)
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while length < size:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        data = b''.join(chunks)
+        count = min(size, len(data))
+        buffer[:count] = data[:count]
+        self._buffer = data[count:]
+        return count
@@ -1,7 +1,16 @@
+import io
+import re
+import json
+import datetime
 import psycopg2
 import logging
 from psycopg2 import sql
-from typing import List, Dict, Any, Optional
+from psycopg2.extras import execute_values
+from typing import List, Dict, Any, Optional, Sequence, Union
+from database.connection_pool import ConnectionPool
+from database.statement_cache import CachedStatementConnection, StatementCache, to_positional
+from database.copy_stream import (PG_EPOCH_OFFSET_US, BytesIteratorFile, IteratorFile, format_copy_row,
+                                  iter_binary_copy, read_binary_copy_int64)
 
 # 获取或创建logger
 logger = logging.getLogger(__name__)
@@ -17,9 +26,13 @@ class PostgreSQLClient:
     提供增删改查（CRUD）基础操作
     """
 
-    def __init__(self, host: str, port: int, user: str, password: str, database: str):
+    def __init__(self, host: str, port: int, user: str, password: str, database: str,
+                 pool: Optional[ConnectionPool] = None, statement_cache_size: int = 128):
         """
         初始化连接参数
+
+        :param pool: 连接池（可选），提供时 connect()/close() 从连接池借用和归还连接
+        :param statement_cache_size: 每个连接缓存的预编译语句数，0 表示不使用预编译语句
         """
         self.conn_params = {
             "host": host,
@@ -28,6 +41,8 @@ class PostgreSQLClient:
             "password": password,
             "database": database
         }
+        self.pool = pool
+        self.statement_cache_size = statement_cache_size
         self.conn = None
 
     def connect(self):
@@ -35,19 +50,155 @@ class PostgreSQLClient:
         建立数据库连接
         """
         try:
-            self.conn = psycopg2.connect(**self.conn_params)
-            logger.info("PostgreSQL 连接成功")
+            if self.pool is not None:
+                self.conn = self.pool.acquire()
+                logger.debug("已从连接池获取 PostgreSQL 连接")
+            else:
+                self.conn = psycopg2.connect(connection_factory=CachedStatementConnection, **self.conn_params)
+                logger.info("PostgreSQL 连接成功")
         except psycopg2.Error as e:
             logger.error(f"连接失败: {e}")
             raise
 
-    def close(self):
+    def close(self, discard: bool = False):
         """
-        关闭数据库连接
+        关闭数据库连接，使用连接池时归还连接
+
+        :param discard: 使用连接池时是否丢弃该连接而非放回连接池
         """
         if self.conn:
-            self.conn.close()
-            logger.info("PostgreSQL 连接已关闭")
+            if self.pool is not None:
+                self.pool.release(self.conn, discard=discard)
+                logger.debug("PostgreSQL 连接已归还连接池")
+            else:
+                self.conn.close()
+                logger.info("PostgreSQL 连接已关闭")
+            self.conn = None
+
+    def ping(self) -> bool:
+        """
+        检查当前连接是否可用
+
+        :return: 连接可用返回True
+        """
+        if not self.conn or self.conn.closed:
+            return False
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            self.conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"连接检查失败: {e}")
+            return False
+
+    # ==================== 预编译语句 ====================
+    def _statement_cache(self) -> Optional[StatementCache]:
+        """
+        获取当前连接的预编译语句缓存，缓存挂在连接对象上，重新连接后自动失效
+
+        :return: 语句缓存，未启用或连接不支持时返回None
+        """
+        if self.statement_cache_size <= 0 or not isinstance(self.conn, CachedStatementConnection):
+            return None
+        if self.conn.statement_cache is None:
+            self.conn.statement_cache = StatementCache(self.statement_cache_size)
+        return self.conn.statement_cache
+
+    def _in_caller_transaction(self) -> bool:
+        """
+        判断当前是否处于调用方已执行过语句的事务中，此时语句出错会使整个事务中止
+
+        :return: 事务中已有语句时返回True；自动提交或事务尚未开始时返回False
+        """
+        return self.conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+    def _prepare(self, cur, cache: StatementCache, query: str, param_count: int) -> Optional[str]:
+        """
+        在服务端预编译语句并登记到缓存
+
+        预编译失败（如参数类型无法推断）时该语句此后直接执行：调用方事务中已有语句时使用保存点包裹
+        PREPARE，不影响当前事务；事务尚未开始时直接回滚，不额外增加保存点的往返
+
+        :return: 语句名，无法预编译时返回None
+        """
+        converted = to_positional(query)
+        if converted is None or converted[1] != param_count:
+            cache.reject(query)
+            return None
+        name = cache.next_name()
+        use_savepoint = self._in_caller_transaction()
+        if use_savepoint:
+            cur.execute("SAVEPOINT prepare_statement")
+        try:
+            cur.execute(f"PREPARE {name} AS {converted[0]}")
+        except psycopg2.Error as e:
+            if use_savepoint:
+                cur.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+                cur.execute("RELEASE SAVEPOINT prepare_statement")
+            elif not self.conn.autocommit:
+                self.conn.rollback()
+            logger.debug(f"语句无法预编译，改为直接执行: {e}")
+            cache.reject(query)
+            return None
+        if use_savepoint:
+            cur.execute("RELEASE SAVEPOINT prepare_statement")
+        evicted = cache.put(query, name)
+        if evicted:
+            cur.execute(f"DEALLOCATE {evicted}")
+        return name
+
+    def _execute_statement(self, cur, query, params, prepare: bool = True, retry: bool = True) -> None:
+        """
+        执行增删改查语句：同形状的语句首次执行时预编译，之后使用 EXECUTE 跳过解析与规划
+
+        服务端预编译语句已被清除（如 DISCARD ALL）或表结构变化使缓存的计划失效时清空缓存，
+        语句是事务中的第一条（或自动提交）时重新预编译并重试一次；调用方事务中已有语句时事务已中止，
+        无法透明重试，错误交由调用方处理
+
+        :param cur: 游标
+        :param query: 语句（字符串或 sql.Composable），参数使用 %s 占位符
+        :param params: 参数序列
+        :param prepare: 是否预编译，结果列随表结构变化的语句（如 SELECT *）应传 False
+        :param retry: 缓存失效时是否重试
+        """
+        cache = self._statement_cache()
+        params = list(params or ())
+        if cache is None or not prepare:
+            cur.execute(query, params)
+            return
+        text = query.as_string(self.conn) if isinstance(query, sql.Composable) else query
+        if cache.is_rejected(text):
+            cur.execute(text, params)
+            return
+        can_retry = retry and not self._in_caller_transaction()
+        name = cache.get(text) or self._prepare(cur, cache, text, len(params))
+        if name is None:
+            cur.execute(text, params)
+            return
+        execute_query = f"EXECUTE {name}" + (" (" + ", ".join(["%s"] * len(params)) + ")" if params else "")
+        try:
+            cur.execute(execute_query, params)
+        except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.FeatureNotSupported) as e:
+            # FeatureNotSupported 即 "cached plan must not change result type"
+            cache.clear()
+            if not can_retry:
+                raise
+            if not self.conn.autocommit:
+                self.conn.rollback()
+            # 失效的语句可能仍在服务端，统一释放后重新预编译
+            cur.execute("DEALLOCATE ALL")
+            logger.warning(f"预编译语句已失效，重新预编译后重试: {e}")
+            self._execute_statement(cur, query, params, retry=False)
+
+    def statement_cache_stats(self) -> Optional[Dict[str, int]]:
+        """
+        获取当前连接的预编译语句缓存统计
+
+        :return: 包含 size、hits、misses、evictions、rejected 的字典，未启用时返回None
+        """
+        cache = self._statement_cache() if self.conn else None
+        return cache.stats() if cache is not None else None
 
     # ==================== 增（Create） ====================
     def insert(self, table: str, data: Dict[str, Any] = None, columns: List[str] = None, values: List[Any] = None) -> int:
@@ -91,7 +242,7 @@ class PostgreSQLClient:
         
         with self.conn.cursor() as cur:
             try:
-                cur.execute(query, values_list)
+                self._execute_statement(cur, query, values_list)
                 # 尝试获取返回的id，但不依赖它
                 try:
                     result = cur.fetchone()
@@ -106,26 +257,81 @@ class PostgreSQLClient:
                     self.conn.rollback()
                 raise e
 
-    def insert_many(self, table: str, data_list: List[Dict[str, Any]]) -> List[int]:
+    # insert_many 写入方式：达到该行数且不需要返回值时自动改用 COPY
+    COPY_THRESHOLD = 5000
+
+    def insert_many(self, table: str, data_list: Sequence[Any], columns: Optional[List[str]] = None,
+                    returning: Optional[str] = None, method: str = 'auto', page_size: int = 1000,
+                    column_types: Optional[Dict[str, str]] = None) -> Union[int, List[Any]]:
         """
         批量插入记录
+
+        写入方式：
+        - values：execute_values 按 page_size 行拼成一条多行 INSERT，可返回生成的字段
+        - copy：COPY FROM STDIN 文本格式
+        - binary：COPY FROM STDIN 二进制格式，需要通过 column_types 提供每列类型
+        - auto：不需要返回值且行数达到 COPY_THRESHOLD 时使用 copy（提供 column_types 时使用 binary），否则使用 values
+
         :param table: 表名
-        :param data_list: 多条记录的字典列表
-        :return: 新插入记录的主键 id 列表
+        :param data_list: 多条记录，字典列表；提供 columns 时也可以是与之对应的元组列表
+        :param columns: 列名列表（可选），默认取第一条字典记录的键
+        :param returning: 需要返回的字段名（如 id），仅 values 方式支持
+        :param method: 写入方式：auto / values / copy / binary
+        :param page_size: values 方式每条 INSERT 的行数
+        :param column_types: 列名 -> 类型（如 {"pass_time": "timestamp"}），binary 方式必需
+        :return: 指定 returning 时返回该字段值列表，否则返回插入的行数
+        :raises ValueError: 参数组合不支持时
         """
         if not data_list:
-            return []
-        columns = list(data_list[0].keys())
-        values = [tuple(d[c] for c in columns) for d in data_list]
-        query = sql.SQL("INSERT INTO {table} ({fields}) VALUES {placeholders} RETURNING id").format(
-            table=sql.Identifier(table),
-            fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-            placeholders=sql.SQL(', ').join(sql.Placeholder() * len(columns))
-        )
-        with self.conn.cursor() as cur:
-            cur.executemany(query, values)
-            new_ids = [row[0] for row in cur.fetchall()]
-            return new_ids
+            return [] if returning else 0
+        if columns is None:
+            columns = list(data_list[0].keys())
+        if isinstance(data_list[0], dict):
+            rows = [tuple(d[c] for c in columns) for d in data_list]
+        else:
+            rows = data_list
+
+        if method == 'auto':
+            if returning or len(rows) < self.COPY_THRESHOLD:
+                method = 'values'
+            else:
+                method = 'binary' if column_types else 'copy'
+        if returning and method != 'values':
+            raise ValueError(f"{method} 方式不支持返回字段")
+
+        fields = sql.SQL(', ').join(map(sql.Identifier, columns))
+        if method == 'values':
+            query = sql.SQL("INSERT INTO {table} ({fields}) VALUES %s").format(
+                table=sql.Identifier(table),
+                fields=fields
+            )
+            if returning:
+                query = query + sql.SQL(" RETURNING {}").format(sql.Identifier(returning))
+            with self.conn.cursor() as cur:
+                result = execute_values(cur, query.as_string(self.conn), rows, page_size=page_size,
+                                        fetch=bool(returning))
+                if returning:
+                    return [row[0] for row in result]
+                return len(rows)
+
+        if method == 'copy':
+            query = sql.SQL("COPY {table} ({fields}) FROM STDIN").format(
+                table=sql.Identifier(table),
+                fields=fields
+            )
+            source = IteratorFile(format_copy_row(row) for row in rows)
+        elif method == 'binary':
+            missing = [c for c in columns if not column_types or c not in column_types]
+            if missing:
+                raise ValueError(f"二进制COPY需要提供列类型: {', '.join(missing)}")
+            query = sql.SQL("COPY {table} ({fields}) FROM STDIN WITH (FORMAT binary)").format(
+                table=sql.Identifier(table),
+                fields=fields
+            )
+            source = BytesIteratorFile(iter_binary_copy(rows, [column_types[c] for c in columns]))
+        else:
+            raise ValueError(f"未知的批量插入方式: {method}")
+        return self.copy_expert(query.as_string(self.conn), source, size=65536)
 
     # ==================== 查（Read） ====================
     def select(self, table: str, columns: Optional[List[str]] = None,
@@ -167,12 +373,15 @@ class PostgreSQLClient:
             query_parts.append(sql.SQL(" ORDER BY ") + sql.SQL(order_by))
         
         if limit is not None:
-            query_parts.append(sql.SQL(" LIMIT {limit}").format(limit=sql.Literal(limit)))
+            # LIMIT 作为参数传入，不同的 limit 共用同一条预编译语句
+            query_parts.append(sql.SQL(" LIMIT %s"))
+            params = tuple(params or ()) + (limit,)
         
         query = sql.Composed(query_parts)
         
         with self.conn.cursor() as cur:
-            cur.execute(query, params or ())
+            # SELECT * 的结果列随表结构变化，预编译后 ALTER TABLE 会使缓存的计划失效，直接执行
+            self._execute_statement(cur, query, params, prepare=bool(columns))
             rows = cur.fetchall()
             col_names = [desc[0] for desc in cur.description]
             return [dict(zip(col_names, row)) for row in rows]
@@ -226,7 +435,7 @@ class PostgreSQLClient:
         
         values += list(params)
         with self.conn.cursor() as cur:
-            cur.execute(query, values)
+            self._execute_statement(cur, query, values)
             return cur.rowcount
 
     # ==================== 删（Delete） ====================
@@ -243,7 +452,7 @@ class PostgreSQLClient:
             where=sql.SQL(where)
         )
         with self.conn.cursor() as cur:
-            cur.execute(query, params)
+            self._execute_statement(cur, query, params)
             return cur.rowcount
 
     def execute(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
@@ -293,7 +502,7 @@ class PostgreSQLClient:
             raise RuntimeError("数据库连接未建立，请先调用connect()方法")
         self.conn.rollback()
 
-    def copy_from(self, file_object, table, sep=',', columns=None):
+    def copy_from(self, file_object, table, sep=',', columns=None, size=8192):
         """
         使用copy_from方法从文件对象导入数据到数据库表
         
@@ -301,21 +510,55 @@ class PostgreSQLClient:
         :param table: 目标表名
         :param sep: 分隔符，默认为逗号
         :param columns: 列名列表
-        :param header: 是否包含表头，默认为False
+        :param size: 每次从文件对象读取的缓冲区大小
+        :return: 导入的行数
         """
         try:
             with self.conn.cursor() as cur:
                 # if header:
                     # 跳过表头行
                     # file_object.readline()
-                cur.copy_from(file_object, table, sep=sep, columns=columns)
+                cur.copy_from(file_object, table, sep=sep, columns=columns, size=size)
+                return cur.rowcount
         except Exception as e:
             raise DatabaseError(f"copy_from操作失败: {str(e)}")
     
+    def copy_expert(self, query, file_object, size: int = 8192) -> int:
+        """
+        使用copy_expert执行任意COPY语句
+
+        :param query: COPY 语句（字符串或 sql.Composable）
+        :param file_object: 数据来源（COPY FROM）或写入目标（COPY TO）文件对象
+        :param size: 每次读取的缓冲区大小
+        :return: COPY 处理的行数
+        """
+        try:
+            with self.conn.cursor() as cur:
+                cur.copy_expert(query, file_object, size=size)
+                return cur.rowcount
+        except Exception as e:
+            raise DatabaseError(f"copy_expert操作失败: {str(e)}")
+    
     # 表名常量定义
     RAW_TABLE = "raw_trace_data"           # 原始表：存储从CSV导入的原始数据
-    FILTERED_TABLE = "filtered_trace_data" # 过滤表：存储过滤后的数据
+    FILTERED_TABLE = "filtered_trace_data" # 过滤表：按导入批次存储过滤后的数据（UNLOGGED）
+    IMPORT_BATCH_TABLE = "import_batch"    # 导入批次登记表
+    INGEST_LEDGER_TABLE = "ingest_ledger"  # 导入文件登记表：按内容摘要识别重复上传的文件
     STAGING_TABLE = "staging_trace_data"   # 暂存表：存储排序并分配序号的数据
+    MARK_LOOKUP_TABLE = "mark_lookup"      # 标记号查找表：标记号 -> 路径位置、公里数
+    IMPORT_JOB_TABLE = "import_job"        # 后台任务表：导入/处理任务的状态与进度
+    VEHICLE_INFO_LOAD_TABLE = "vehicle_info_load"  # 车辆信息装载表：COPY 导入的车辆信息
+    VEHICLE_INFO_UPDATE_TABLE = "vehicle_info_update"  # 车辆状态更新表：批量写回的计算结果（临时表）
+    LATE_ARRIVAL_TABLE = "late_arrival"    # 迟到记录表：增量处理时早于车辆水位线的通行记录
+    VEHICLE_RECORD_TABLE = "vehicle_record"  # 通行记录表：按 pass_time 按月分区
+    VEHICLE_RECORD_DEFAULT_PARTITION = "vehicle_record_default"  # 通行记录默认分区：没有对应月分区的记录
+
+    # 月分区表名：vehicle_record_pYYYYMM
+    VEHICLE_RECORD_PARTITION_PATTERN = re.compile(r"^vehicle_record_p(\d{4})(\d{2})$")
+
+    # 车辆状态更新表的列类型（二进制COPY使用）
+    VEHICLE_INFO_UPDATE_TYPES = {"plate": "varchar", "last_record": "varchar", "last_record_time": "timestamp",
+                                 "mileage": "double precision", "points": "double precision"}
 
     # ==================== 高级方法（固定业务操作） ====================
     def drop_table_if_exists(self, table: str) -> None:
@@ -330,60 +573,428 @@ class PostgreSQLClient:
         with self.conn.cursor() as cur:
             cur.execute(query)
     
-    def create_raw_table(self) -> None:
+    def raw_table_name(self, batch_id: int) -> str:
+        """
+        获取导入批次对应的原始表名
+
+        :param batch_id: 导入批次号
+        :return: 原始表名
         """
-        创建原始表，用于存储从CSV导入的原始数据
+        return f"{self.RAW_TABLE}_{batch_id}"
+
+    def create_raw_table(self, batch_id: int) -> None:
+        """
+        创建导入批次的原始表（UNLOGGED表），用于存储从CSV导入的原始数据
+
+        原始表跨连接保留，过滤步骤可以由后台任务在其它连接中完成
+
+        :param batch_id: 导入批次号
         """
         query = sql.SQL("""
-            CREATE TEMP TABLE IF NOT EXISTS {raw_table} (
+            CREATE UNLOGGED TABLE IF NOT EXISTS {raw_table} (
                 plate VARCHAR(20),
                 pass_time VARCHAR(50),
                 mark VARCHAR(20)
             )
         """).format(
-            raw_table=sql.Identifier(self.RAW_TABLE)
+            raw_table=sql.Identifier(self.raw_table_name(batch_id))
         )
         with self.conn.cursor() as cur:
             cur.execute(query)
     
-    def create_filtered_table(self) -> None:
+    def register_import_batch(self, filename: Optional[str], ttl_hours: float, status: str = 'pending') -> int:
         """
-        创建过滤表（临时表），用于存储过滤和转换后的轨迹数据
+        登记一个新的导入批次
+
+        :param filename: 上传的文件名
+        :param ttl_hours: 批次未确认时的保留小时数
+        :param status: 初始状态，原始数据尚未过滤时为 loading
+        :return: 批次号
         """
         query = sql.SQL("""
-            CREATE TEMP TABLE IF NOT EXISTS {filtered_table} (
-                plate VARCHAR(20),
-                pass_time TIMESTAMP,
-                mark VARCHAR(20)
-            )
+            INSERT INTO {batch_table} (filename, status, expires_at)
+            VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+            RETURNING batch_id
         """).format(
-            filtered_table=sql.Identifier(self.FILTERED_TABLE)
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
         )
         with self.conn.cursor() as cur:
-            cur.execute(query)
-    
-    def import_from_raw_to_filtered(self) -> None:
+            cur.execute(query, (filename, status, ttl_hours))
+            return cur.fetchone()[0]
+
+    def record_ingest_file(self, content_hash: str, batch_id: int, filename: Optional[str], byte_count: int) -> int:
         """
-        从原始表导入数据到过滤表，过滤重复项、转换时间格式并关联车辆信息
+        在导入文件登记表中登记文件内容摘要
+
+        相同摘要已被其它批次登记、且该批次仍有效（未被撤销、过期或处理失败）时不登记；
+        内容摘要为主键，并发上传相同文件时后者等待前者的事务结束
+
+        :param content_hash: 文件内容的 sha256 摘要（十六进制）
+        :param batch_id: 导入批次号
+        :param filename: 上传的文件名
+        :param byte_count: 文件内容字节数
+        :return: 登记该摘要的批次号，不等于 batch_id 时表示文件重复
+        """
+        query = sql.SQL("""
+            INSERT INTO {ledger_table} AS l (content_hash, batch_id, filename, byte_count)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (content_hash) DO UPDATE
+            SET batch_id = EXCLUDED.batch_id, filename = EXCLUDED.filename,
+                byte_count = EXCLUDED.byte_count, created_at = CURRENT_TIMESTAMP
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {batch_table} b
+                WHERE b.batch_id = l.batch_id AND b.status NOT IN ('discarded', 'expired', 'failed'))
+            RETURNING batch_id
+        """).format(
+            ledger_table=sql.Identifier(self.INGEST_LEDGER_TABLE),
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
+        )
+        owner_query = sql.SQL("SELECT batch_id FROM {ledger_table} WHERE content_hash = %s").format(
+            ledger_table=sql.Identifier(self.INGEST_LEDGER_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (content_hash, batch_id, filename, byte_count))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute(owner_query, (content_hash,))
+                row = cur.fetchone()
+            return row[0]
+
+    def select_ingest_owner(self, content_hash: str) -> Optional[int]:
+        """
+        查询登记了该内容摘要、且仍有效（未被撤销、过期或处理失败）的批次
+
+        :param content_hash: 文件内容的 sha256 摘要（十六进制）
+        :return: 批次号，没有时返回None
         """
         query = sql.SQL("""
-            INSERT INTO {filtered_table} (plate, pass_time, mark)
-            SELECT DISTINCT
+            SELECT l.batch_id FROM {ledger_table} l
+            JOIN {batch_table} b ON b.batch_id = l.batch_id
+            WHERE l.content_hash = %s AND b.status NOT IN ('discarded', 'expired', 'failed')
+        """).format(
+            ledger_table=sql.Identifier(self.INGEST_LEDGER_TABLE),
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
+        )
+        results = self.execute(query, (content_hash,))
+        return results[0]["batch_id"] if results else None
+
+    def import_from_raw_to_filtered(self, batch_id: int, start_block: Optional[int] = None,
+                                    end_block: Optional[int] = None) -> int:
+        """
+        从原始表导入数据到过滤表，转换时间格式并关联车辆信息
+
+        过滤表中不去重：暂存表按 (plate, mark, pass_time) 去重，vehicle_record 的唯一索引跳过已有记录。
+        指定块范围时只处理 ctid 位于 [start_block, end_block) 数据块中的行（TID范围扫描），
+        用于分段过滤并报告进度；end_block 为空表示直到表末尾
+
+        :param batch_id: 导入批次号
+        :param start_block: 起始数据块号（可选）
+        :param end_block: 结束数据块号（可选，不含）
+        :return: 写入过滤表的记录数
+        """
+        conditions = []
+        params = [batch_id]
+        if start_block is not None:
+            conditions.append(sql.SQL("t0.ctid >= %s::tid"))
+            params.append(f"({start_block},0)")
+        if end_block is not None:
+            conditions.append(sql.SQL("t0.ctid < %s::tid"))
+            params.append(f"({end_block},0)")
+        where_clause = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+        query = sql.SQL("""
+            INSERT INTO {filtered_table} (batch_id, plate, pass_time, mark)
+            SELECT
+                %s,
                 t0.plate, 
                 TO_TIMESTAMP(t0.pass_time, 'YYYY/MM/DD HH24:MI') as pass_time, 
                 t0.mark
             FROM {raw_table} t0
             JOIN vehicle_info vi ON t0.plate = vi.plate
+            {where_clause}
         """).format(
             filtered_table=sql.Identifier(self.FILTERED_TABLE),
-            raw_table=sql.Identifier(self.RAW_TABLE)
+            raw_table=sql.Identifier(self.raw_table_name(batch_id)),
+            where_clause=where_clause
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.rowcount
+
+    def select_table_block_count(self, table: str) -> int:
+        """
+        查询表当前占用的数据块数
+
+        :param table: 表名
+        :return: 数据块数
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_relation_size(%s::regclass) / current_setting('block_size')::INTEGER", (table,))
+            return cur.fetchone()[0]
+
+    def select_vehicle_plates(self, itersize: int = 100000) -> set:
+        """
+        使用服务端游标读取vehicle_info中的全部车牌，供客户端校验轨迹数据
+
+        :param itersize: 每次从服务端取回的行数
+        :return: 车牌集合
+        """
+        with self.conn.cursor(name="vehicle_plates") as cur:
+            cur.itersize = itersize
+            cur.execute("SELECT plate FROM vehicle_info")
+            return {row[0] for row in cur}
+
+    def copy_into_filtered_binary(self, file_object, size: int = 65536) -> int:
+        """
+        将二进制COPY格式的数据（batch_id, plate, pass_time, mark）直接导入过滤表
+
+        :param file_object: 提供二进制COPY数据的文件对象
+        :param size: 每次读取的字节数
+        :return: 导入的行数
+        """
+        query = sql.SQL("COPY {filtered_table} (batch_id, plate, pass_time, mark) FROM STDIN WITH (FORMAT binary)").format(
+            filtered_table=sql.Identifier(self.FILTERED_TABLE)
+        )
+        return self.copy_expert(query.as_string(self.conn), file_object, size=size)
+
+    def update_import_batch(self, batch_id: int, data: Dict[str, Any]) -> None:
+        """
+        更新导入批次的状态或计数
+
+        :param batch_id: 导入批次号
+        :param data: 需要更新的字段，如 status、row_count、filtered_count
+        """
+        self.update(self.IMPORT_BATCH_TABLE, data, where="batch_id = %s", params=(batch_id,))
+
+    def lock_loading_batch(self, batch_id: int) -> Optional[Dict[str, Any]]:
+        """
+        锁定尚未完成过滤的导入批次
+
+        :param batch_id: 导入批次号
+        :return: 批次信息，批次不存在或不处于 loading 状态时返回None
+        """
+        query = sql.SQL("""
+            SELECT batch_id, row_count FROM {batch_table}
+            WHERE batch_id = %s AND status = 'loading'
+            FOR UPDATE
+        """).format(
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
+        )
+        results = self.execute(query, (batch_id,))
+        return results[0] if results else None
+
+    def list_import_batches(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询导入批次
+
+        :param status: 批次状态（可选），不传则查询所有
+        :return: 批次字典列表，按批次号倒序
+        """
+        return self.select(
+            self.IMPORT_BATCH_TABLE,
+            ["batch_id", "filename", "status", "row_count", "filtered_count",
+             "created_at", "expires_at", "finished_at"],
+            where="status = %s" if status else None,
+            params=(status,) if status else None,
+            order_by="batch_id DESC"
+        )
+
+    def lock_pending_batches(self, batch_ids: Optional[List[int]] = None) -> List[int]:
+        """
+        锁定待处理的导入批次，防止同一批次被并发确认或撤销
+
+        :param batch_ids: 批次号列表（可选），不传则锁定所有未过期的待处理批次
+        :return: 实际锁定的批次号列表
+        """
+        query = sql.SQL("""
+            SELECT batch_id FROM {batch_table}
+            WHERE status = 'pending'
+              AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+              AND (%s::INTEGER[] IS NULL OR batch_id = ANY(%s::INTEGER[]))
+            ORDER BY batch_id
+            FOR UPDATE
+        """).format(
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (batch_ids, batch_ids))
+            return [row[0] for row in cur.fetchall()]
+
+    def finish_import_batches(self, batch_ids: List[int], status: str) -> None:
+        """
+        结束导入批次：更新批次状态并删除其在过滤表中的数据及原始表
+
+        :param batch_ids: 批次号列表
+        :param status: 结束状态（confirmed / discarded / expired / failed）
+        """
+        if not batch_ids:
+            return
+        update_query = sql.SQL("""
+            UPDATE {batch_table} SET status = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE batch_id = ANY(%s)
+        """).format(
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
+        )
+        delete_query = sql.SQL("DELETE FROM {filtered_table} WHERE batch_id = ANY(%s)").format(
+            filtered_table=sql.Identifier(self.FILTERED_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(update_query, (status, batch_ids))
+            cur.execute(delete_query, (batch_ids,))
+        for batch_id in batch_ids:
+            self.drop_table_if_exists(self.raw_table_name(batch_id))
+
+    def expire_import_batches(self) -> List[int]:
+        """
+        将超过保留时间仍未确认的批次标记为过期并清理其数据
+
+        :return: 过期的批次号列表
+        """
+        query = sql.SQL("""
+            SELECT batch_id FROM {batch_table}
+            WHERE status IN ('pending', 'loading') AND expires_at <= CURRENT_TIMESTAMP
+            FOR UPDATE SKIP LOCKED
+        """).format(
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
         )
         with self.conn.cursor() as cur:
             cur.execute(query)
+            expired_ids = [row[0] for row in cur.fetchall()]
+        self.finish_import_batches(expired_ids, "expired")
+        return expired_ids
     
-    def create_and_populate_staging(self) -> None:
+    def create_import_job_table(self) -> None:
+        """
+        创建后台任务表，记录任务状态（queued / running / done / failed）、进度、执行任务的工作进程与租约心跳时间
+        """
+        query = sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {job_table} (
+                job_id SERIAL PRIMARY KEY,
+                kind VARCHAR(30) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                batch_id INTEGER,
+                rows_processed BIGINT DEFAULT 0,
+                rows_total BIGINT,
+                message TEXT,
+                worker VARCHAR(100),
+                heartbeat_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        """).format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE)
+        )
+        alter_query = sql.SQL("""
+            ALTER TABLE {job_table}
+                ADD COLUMN IF NOT EXISTS worker VARCHAR(100),
+                ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP
+        """).format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            cur.execute(alter_query)
+
+    def create_import_job(self, kind: str, batch_id: Optional[int] = None, worker: Optional[str] = None) -> int:
+        """
+        登记一个排队中的后台任务
+
+        :param kind: 任务类型
+        :param batch_id: 关联的导入批次号（可选）
+        :param worker: 执行任务的工作进程标识（可选），格式为 主机名:进程号
+        :return: 任务号
+        """
+        query = sql.SQL("""
+            INSERT INTO {job_table} (kind, batch_id, worker, heartbeat_at) VALUES (%s, %s, %s, LOCALTIMESTAMP)
+            RETURNING job_id
+        """).format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (kind, batch_id, worker))
+            return cur.fetchone()[0]
+
+    def renew_import_job_leases(self, job_ids: List[int]) -> None:
+        """
+        为未结束的后台任务续租：heartbeat_at 更新为当前时间
+
+        :param job_ids: 任务号列表
+        """
+        query = sql.SQL("""
+            UPDATE {job_table} SET heartbeat_at = LOCALTIMESTAMP
+            WHERE job_id = ANY(%s) AND status IN ('queued', 'running')
+        """).format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (job_ids,))
+
+    def fail_expired_import_jobs(self, lease_seconds: float, message: str) -> List[int]:
+        """
+        将超过租约时长未续租的 queued / running 任务标记为 failed
+
+        没有心跳时间的任务（续租机制之前登记的任务）以登记时间计算
+
+        :param lease_seconds: 租约时长（秒）
+        :param message: 失败原因
+        :return: 标记为失败的任务号列表
+        """
+        query = sql.SQL("""
+            UPDATE {job_table} SET status = 'failed', message = %s, finished_at = LOCALTIMESTAMP
+            WHERE status IN ('queued', 'running')
+              AND COALESCE(heartbeat_at, created_at) < LOCALTIMESTAMP - %s * INTERVAL '1 second'
+            RETURNING job_id
+        """).format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (message, lease_seconds))
+            return sorted(row[0] for row in cur.fetchall())
+
+    def update_import_job(self, job_id: int, data: Dict[str, Any], timestamp_column: Optional[str] = None) -> None:
+        """
+        更新后台任务的状态或进度
+
+        :param job_id: 任务号
+        :param data: 需要更新的字段
+        :param timestamp_column: 需要同时设为当前时间的字段（started_at / finished_at）
+        """
+        set_clauses = [sql.SQL("{} = %s").format(sql.Identifier(k)) for k in data]
+        if timestamp_column:
+            set_clauses.append(sql.SQL("{} = LOCALTIMESTAMP").format(sql.Identifier(timestamp_column)))
+        query = sql.SQL("UPDATE {job_table} SET {set_clause} WHERE job_id = %s").format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE),
+            set_clause=sql.SQL(', ').join(set_clauses)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, list(data.values()) + [job_id])
+
+    def get_import_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        查询后台任务，附带已运行秒数
+
+        :param job_id: 任务号
+        :return: 任务信息字典，不存在时返回None
+        """
+        query = sql.SQL("""
+            SELECT job_id, kind, status, batch_id, rows_processed, rows_total, message,
+                   created_at, started_at, finished_at,
+                   EXTRACT(EPOCH FROM (COALESCE(finished_at, LOCALTIMESTAMP) - started_at))::FLOAT AS elapsed_seconds
+            FROM {job_table}
+            WHERE job_id = %s
+        """).format(
+            job_table=sql.Identifier(self.IMPORT_JOB_TABLE)
+        )
+        results = self.execute(query, (job_id,))
+        return results[0] if results else None
+
+    def create_and_populate_staging(self, batch_ids: List[int]) -> None:
         """
         创建并填充暂存表，按车牌和时间排序，并为每条记录分配序号
+
+        与增量方式一致，标记号或通行时间为空的记录不进入暂存表
+
+        :param batch_ids: 参与处理的导入批次号列表
         """
         # 删除可能存在的暂存表
         self.drop_table_if_exists(self.STAGING_TABLE)
@@ -397,7 +1008,8 @@ class PostgreSQLClient:
                 pass_time,
                 ROW_NUMBER() OVER (PARTITION BY plate ORDER BY pass_time) AS seq
             FROM (
-                SELECT DISTINCT plate, mark, pass_time FROM {filtered_table} WHERE mark IS NOT NULL
+                SELECT DISTINCT plate, mark, pass_time FROM {filtered_table}
+                WHERE mark IS NOT NULL AND pass_time IS NOT NULL AND batch_id = ANY(%s)
             ) AS unique_data
             WHERE mark IS NOT NULL
         """).format(
@@ -405,21 +1017,646 @@ class PostgreSQLClient:
             filtered_table=sql.Identifier(self.FILTERED_TABLE)
         )
         with self.conn.cursor() as cur:
-            cur.execute(query)
+            cur.execute(query, (batch_ids,))
     
-    def import_from_staging_to_vehicle_record(self) -> None:
+    def create_and_populate_staging_incremental(self, batch_ids: List[int]) -> int:
         """
-        从暂存表导入数据到vehicle_record表
+        增量方式创建并填充暂存表：按vehicle_info.last_record_time水位线过滤每个车牌的记录
+
+        - 晚于水位线的记录进入暂存表
+        - 等于水位线的记录与vehicle_record去重后进入暂存表（重复发送的导出数据在此被排除）
+        - 早于水位线的记录与vehicle_record去重后写入迟到记录表，由 reconcile_late_arrivals 处理
+
+        :param batch_ids: 参与处理的导入批次号列表
+        :return: 新写入迟到记录表的记录数
+        """
+        self.drop_table_if_exists(self.STAGING_TABLE)
+        staging_query = sql.SQL("""
+            CREATE TEMP TABLE {staging_table} AS
+            SELECT
+                plate,
+                mark,
+                pass_time,
+                ROW_NUMBER() OVER (PARTITION BY plate ORDER BY pass_time) AS seq
+            FROM (
+                SELECT DISTINCT f.plate, f.mark, f.pass_time
+                FROM {filtered_table} f
+                JOIN vehicle_info vi ON vi.plate = f.plate
+                WHERE f.batch_id = ANY(%s) AND f.mark IS NOT NULL AND f.pass_time IS NOT NULL
+                  AND (vi.last_record_time IS NULL
+                       OR f.pass_time > vi.last_record_time
+                       OR (f.pass_time = vi.last_record_time AND NOT EXISTS (
+                           SELECT 1 FROM vehicle_record r
+                           WHERE r.plate = f.plate AND r.pass_time = f.pass_time AND r.mark = f.mark)))
+            ) AS unique_data
+        """).format(
+            staging_table=sql.Identifier(self.STAGING_TABLE),
+            filtered_table=sql.Identifier(self.FILTERED_TABLE)
+        )
+        late_query = sql.SQL("""
+            INSERT INTO {late_table} (plate, mark, pass_time, batch_id)
+            SELECT DISTINCT ON (f.plate, f.pass_time, f.mark) f.plate, f.mark, f.pass_time, f.batch_id
+            FROM {filtered_table} f
+            JOIN vehicle_info vi ON vi.plate = f.plate
+            WHERE f.batch_id = ANY(%s) AND f.mark IS NOT NULL AND f.pass_time < vi.last_record_time
+              AND NOT EXISTS (
+                  SELECT 1 FROM vehicle_record r
+                  WHERE r.plate = f.plate AND r.pass_time = f.pass_time AND r.mark = f.mark)
+            ON CONFLICT DO NOTHING
+        """).format(
+            late_table=sql.Identifier(self.LATE_ARRIVAL_TABLE),
+            filtered_table=sql.Identifier(self.FILTERED_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(staging_query, (batch_ids,))
+            cur.execute(late_query, (batch_ids,))
+            return cur.rowcount
+
+    def move_late_arrivals_to_vehicle_record(self) -> Dict[str, int]:
+        """
+        将迟到记录表中的记录移入vehicle_record表（(plate, pass_time, mark) 已存在的记录跳过），并清空迟到记录表
+
+        :return: 包含 taken（取出的迟到记录数）和 inserted（插入vehicle_record的记录数）的字典
+        """
+        query = sql.SQL("""
+            WITH moved AS (
+                DELETE FROM {late_table}
+                RETURNING plate, mark, pass_time
+            ), inserted AS (
+                INSERT INTO vehicle_record (plate, mark, pass_time)
+                SELECT plate, mark, pass_time FROM moved
+                ON CONFLICT DO NOTHING
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM moved), (SELECT COUNT(*) FROM inserted)
+        """).format(
+            late_table=sql.Identifier(self.LATE_ARRIVAL_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            taken, inserted = cur.fetchone()
+            return {"taken": taken, "inserted": inserted}
+
+    def import_from_staging_to_vehicle_record(self) -> int:
+        """
+        从暂存表导入数据到vehicle_record表，(plate, pass_time, mark) 已存在的记录跳过
+
+        :return: 实际插入的记录数
         """
         query = sql.SQL("""
             INSERT INTO vehicle_record (plate, mark, pass_time)
             SELECT plate, mark, pass_time FROM {staging_table}
+            WHERE pass_time IS NOT NULL
+            ON CONFLICT DO NOTHING
         """).format(
             staging_table=sql.Identifier(self.STAGING_TABLE)
         )
         with self.conn.cursor() as cur:
             cur.execute(query)
+            return cur.rowcount
+
+    def select_vehicles_by_plates(self, plates: List[str], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        用一条 plate = ANY(%s) 查询批量获取车辆信息
+
+        :param plates: 车牌号列表
+        :param columns: 需要查询的字段列表，None表示全部字段
+        :return: 字典列表（不保证与 plates 顺序一致，不存在的车牌没有对应记录）
+        """
+        if not plates:
+            return []
+        return self.select("vehicle_info", columns, where="plate = ANY(%s)", params=(list(plates),))
+
+    def select_vehicle_passes(self, plate: str, start: datetime.datetime, end: datetime.datetime,
+                              after: Optional[tuple] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        按 (pass_time, id) 顺序分页查询某车牌在时间范围内的通行记录（键集分页）
+
+        使用 (plate, pass_time, id) 索引定位起点，只扫描涉及月份的分区，翻页代价与页码无关
+
+        :param plate: 车牌号
+        :param start: 起始时间（包含）
+        :param end: 结束时间（不包含）
+        :param after: 上一页最后一条记录的 (pass_time, id)（可选），返回其后的记录
+        :param limit: 返回的最大记录数
+        :return: 包含 id、mark、pass_time 的字典列表
+        """
+        where = "plate = %s AND pass_time >= %s AND pass_time < %s"
+        params = [plate, start, end]
+        if after is not None:
+            where += " AND (pass_time, id) > (%s, %s)"
+            params.extend(after)
+        return self.select(self.VEHICLE_RECORD_TABLE, ["id", "mark", "pass_time"], where=where,
+                           params=tuple(params), order_by="pass_time, id", limit=limit)
+
+    # ==================== vehicle_record 分区管理 ====================
+    @staticmethod
+    def add_months(month: datetime.date, count: int) -> datetime.date:
+        """
+        计算若干个月之后（count 为负时为之前）的月份第一天
+        """
+        index = month.year * 12 + month.month - 1 + count
+        return datetime.date(index // 12, index % 12 + 1, 1)
+
+    def vehicle_record_partition_name(self, month: datetime.date) -> str:
+        """
+        获取某个月份的vehicle_record分区表名
+
+        :param month: 月份（任意一天）
+        :return: 分区表名，如 vehicle_record_p202405
+        """
+        return f"{self.VEHICLE_RECORD_TABLE}_p{month:%Y%m}"
+
+    def is_vehicle_record_partitioned(self) -> bool:
+        """
+        判断vehicle_record是否已是分区表（未迁移的旧表为普通表）
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (self.VEHICLE_RECORD_TABLE,))
+            row = cur.fetchone()
+            return row is not None and row[0] == 'p'
+
+    def list_vehicle_record_partitions(self) -> List[datetime.date]:
+        """
+        查询vehicle_record当前挂载的月分区（不含默认分区）
+
+        :return: 月份第一天的列表，按时间排序
+        """
+        query = """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(query, (self.VEHICLE_RECORD_TABLE,))
+            names = [row[0] for row in cur.fetchall()]
+        months = []
+        for name in names:
+            match = self.VEHICLE_RECORD_PARTITION_PATTERN.match(name)
+            if match:
+                months.append(datetime.date(int(match.group(1)), int(match.group(2)), 1))
+        return sorted(months)
+
+    def select_late_arrival_months(self) -> List[datetime.date]:
+        """
+        查询迟到记录表中记录涉及的月份
+
+        :return: 月份第一天的列表
+        """
+        query = sql.SQL("""
+            SELECT DISTINCT date_trunc('month', pass_time)::date FROM {late_table}
+            WHERE pass_time IS NOT NULL
+        """).format(
+            late_table=sql.Identifier(self.LATE_ARRIVAL_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            return sorted(row[0] for row in cur.fetchall())
+
+    def select_pending_batch_months(self, batch_ids: Optional[List[int]] = None) -> List[datetime.date]:
+        """
+        查询待处理导入批次在过滤表中的记录涉及的月份
+
+        :param batch_ids: 批次号列表（可选），不传则查询所有未过期的待处理批次
+        :return: 月份第一天的列表
+        """
+        query = sql.SQL("""
+            SELECT DISTINCT date_trunc('month', f.pass_time)::date
+            FROM {filtered_table} f
+            JOIN {batch_table} b ON b.batch_id = f.batch_id
+            WHERE b.status = 'pending'
+              AND (b.expires_at IS NULL OR b.expires_at > CURRENT_TIMESTAMP)
+              AND (%s::INTEGER[] IS NULL OR b.batch_id = ANY(%s::INTEGER[]))
+              AND f.pass_time IS NOT NULL
+        """).format(
+            filtered_table=sql.Identifier(self.FILTERED_TABLE),
+            batch_table=sql.Identifier(self.IMPORT_BATCH_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query, (batch_ids, batch_ids))
+            return sorted(row[0] for row in cur.fetchall())
+
+    def create_vehicle_record_partition(self, month: datetime.date) -> bool:
+        """
+        创建某个月份的vehicle_record分区（已存在时跳过）
+
+        默认分区中已有该月份的记录时，先建独立表并把这些记录移入，再挂载为分区；
+        分区索引由父表上的分区索引自动创建。持有事务级咨询锁，避免多个进程同时建同一分区
+
+        :param month: 月份（任意一天）
+        :return: 新建分区返回True，已存在返回False
+        """
+        month = month.replace(day=1)
+        name = self.vehicle_record_partition_name(month)
+        bounds = sql.SQL("FROM ({start}) TO ({end})").format(
+            start=sql.Literal(month.isoformat()),
+            end=sql.Literal(self.add_months(month, 1).isoformat())
+        )
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.VEHICLE_RECORD_TABLE,))
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+            if cur.fetchone()[0]:
+                return False
+            cur.execute(sql.SQL("""
+                SELECT EXISTS (SELECT 1 FROM {default_partition} WHERE pass_time >= %s AND pass_time < %s)
+            """).format(
+                default_partition=sql.Identifier(self.VEHICLE_RECORD_DEFAULT_PARTITION)
+            ), (month, self.add_months(month, 1)))
+            if not cur.fetchone()[0]:
+                cur.execute(sql.SQL("CREATE TABLE {partition} PARTITION OF {record_table} FOR VALUES {bounds}").format(
+                    partition=sql.Identifier(name),
+                    record_table=sql.Identifier(self.VEHICLE_RECORD_TABLE),
+                    bounds=bounds
+                ))
+                return True
+
+            cur.execute(sql.SQL("CREATE TABLE {partition} (LIKE {record_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(
+                partition=sql.Identifier(name),
+                record_table=sql.Identifier(self.VEHICLE_RECORD_TABLE)
+            ))
+            cur.execute(sql.SQL("""
+                WITH moved AS (
+                    DELETE FROM {default_partition}
+                    WHERE pass_time >= %s AND pass_time < %s
+                    RETURNING id, plate, mark, pass_time
+                )
+                INSERT INTO {partition} (id, plate, mark, pass_time)
+                SELECT id, plate, mark, pass_time FROM moved
+            """).format(
+                default_partition=sql.Identifier(self.VEHICLE_RECORD_DEFAULT_PARTITION),
+                partition=sql.Identifier(name)
+            ), (month, self.add_months(month, 1)))
+            logger.info(f"默认分区中 {cur.rowcount} 条记录移入分区 {name}")
+            cur.execute(sql.SQL("ALTER TABLE {record_table} ATTACH PARTITION {partition} FOR VALUES {bounds}").format(
+                record_table=sql.Identifier(self.VEHICLE_RECORD_TABLE),
+                partition=sql.Identifier(name),
+                bounds=bounds
+            ))
+            return True
+
+    def detach_vehicle_record_partition(self, month: datetime.date, archive_schema: Optional[str] = None) -> str:
+        """
+        从vehicle_record卸载某个月份的分区，卸载后的表不再参与查询和写入
+
+        :param month: 月份（任意一天）
+        :param archive_schema: 归档模式名（可选），指定时把卸载的表移入该模式
+        :return: 卸载后的表名（含模式名）
+        """
+        name = self.vehicle_record_partition_name(month)
+        with self.conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE {record_table} DETACH PARTITION {partition}").format(
+                record_table=sql.Identifier(self.VEHICLE_RECORD_TABLE),
+                partition=sql.Identifier(name)
+            ))
+            if not archive_schema:
+                return name
+            cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {schema}").format(schema=sql.Identifier(archive_schema)))
+            cur.execute(sql.SQL("ALTER TABLE {partition} SET SCHEMA {schema}").format(
+                partition=sql.Identifier(name),
+                schema=sql.Identifier(archive_schema)
+            ))
+            return f"{archive_schema}.{name}"
     
+    def create_vehicle_info_load_table(self) -> None:
+        """
+        创建车辆信息装载表（临时表），用于COPY导入后合并到vehicle_info表
+        """
+        self.drop_table_if_exists(self.VEHICLE_INFO_LOAD_TABLE)
+        query = sql.SQL("""
+            CREATE TEMP TABLE {load_table} (
+                line_no INTEGER NOT NULL,
+                username VARCHAR(100),
+                phone_num VARCHAR(11) NOT NULL,
+                plate VARCHAR(20) NOT NULL,
+                vehicle_type VARCHAR(50)
+            )
+        """).format(
+            load_table=sql.Identifier(self.VEHICLE_INFO_LOAD_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+
+    def copy_into_vehicle_info_load(self, file_object) -> int:
+        """
+        将COPY文本格式的数据（line_no, username, phone_num, plate, vehicle_type）导入装载表
+
+        :param file_object: 提供COPY文本数据的文件对象
+        :return: 导入的行数
+        """
+        query = sql.SQL("COPY {load_table} (line_no, username, phone_num, plate, vehicle_type) FROM STDIN").format(
+            load_table=sql.Identifier(self.VEHICLE_INFO_LOAD_TABLE)
+        )
+        return self.copy_expert(query.as_string(self.conn), file_object)
+
+    def merge_vehicle_info_from_load(self) -> Dict[str, int]:
+        """
+        将装载表合并到vehicle_info表：新车牌插入，已存在的车牌更新用户信息
+        同一文件中重复的车牌以最后一行为准
+
+        :return: 包含 inserted 和 updated 计数的字典
+        """
+        query = sql.SQL("""
+            WITH merged AS (
+                INSERT INTO vehicle_info (username, phone_num, plate, vehicle_type)
+                SELECT DISTINCT ON (plate) username, phone_num, plate, vehicle_type
+                FROM {load_table}
+                ORDER BY plate, line_no DESC
+                ON CONFLICT (plate) DO UPDATE
+                SET username = EXCLUDED.username,
+                    phone_num = EXCLUDED.phone_num,
+                    vehicle_type = EXCLUDED.vehicle_type
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE inserted) AS inserted,
+                COUNT(*) FILTER (WHERE NOT inserted) AS updated
+            FROM merged
+        """).format(
+            load_table=sql.Identifier(self.VEHICLE_INFO_LOAD_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            inserted, updated = cur.fetchone()
+            return {"inserted": inserted, "updated": updated}
+
+    def create_mark_lookup(self, entries: List[tuple]) -> None:
+        """
+        创建并填充标记号查找表（临时表），供集合式里程计算关联使用
+
+        :param entries: (mark, path_pos, km) 元组列表，path_pos 与 path_index 返回值一致
+        """
+        self.drop_table_if_exists(self.MARK_LOOKUP_TABLE)
+        create_query = sql.SQL("""
+            CREATE TEMP TABLE {lookup_table} (
+                mark VARCHAR(20) PRIMARY KEY,
+                path_pos INTEGER NOT NULL,
+                km DOUBLE PRECISION NOT NULL
+            )
+        """).format(
+            lookup_table=sql.Identifier(self.MARK_LOOKUP_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(create_query)
+        self.insert_many(self.MARK_LOOKUP_TABLE, entries, columns=["mark", "path_pos", "km"], method='values')
+
+    def update_vehicle_info_set_based(self) -> Dict[str, Any]:
+        """
+        在数据库内以集合方式根据暂存表更新vehicle_info表
+
+        与逐车牌处理的语义一致：
+        - 早于 last_record_time 的记录被跳过
+        - 相邻两条记录（首条与 vehicle_info.last_record 相邻）路径位置相差1时累加里程差，
+          任一方标记号为空时不计算里程差
+        - 出现不在查找表中的标记号、或 mileage / bonus 为空的车牌整体跳过，不做更新
+        - 暂存表中出现的车牌即使没有可处理的记录也会重算 points
+
+        :return: 包含 updated（更新的车辆数）和 failed（跳过的车牌列表）的字典
+        """
+        query = sql.SQL("""
+            WITH state AS (
+                SELECT vi.plate, vi.last_record, vi.last_record_time, vi.mileage, vi.bonus
+                FROM vehicle_info vi
+                WHERE vi.plate IN (SELECT DISTINCT plate FROM {staging_table})
+            ),
+            chained AS (
+                SELECT
+                    s.plate,
+                    s.mark,
+                    s.pass_time,
+                    s.seq,
+                    CASE
+                        WHEN ROW_NUMBER() OVER w = 1 THEN st.last_record
+                        ELSE LAG(s.mark) OVER w
+                    END AS prev_mark
+                FROM {staging_table} s
+                JOIN state st ON st.plate = s.plate
+                WHERE st.last_record_time IS NULL OR s.pass_time >= st.last_record_time
+                WINDOW w AS (PARTITION BY s.plate ORDER BY s.pass_time, s.seq)
+            ),
+            deltas AS (
+                SELECT
+                    c.plate,
+                    c.mark,
+                    c.pass_time,
+                    c.seq,
+                    CASE
+                        WHEN c.prev_mark IS NOT NULL AND cur.path_pos - prev.path_pos = 1
+                        THEN ABS(cur.km - prev.km) / 1000.0
+                        ELSE 0
+                    END AS delta,
+                    (c.mark IS NOT NULL AND c.prev_mark IS NOT NULL
+                     AND (cur.mark IS NULL OR prev.mark IS NULL)) AS invalid
+                FROM chained c
+                LEFT JOIN {lookup_table} cur ON cur.mark = c.mark
+                LEFT JOIN {lookup_table} prev ON prev.mark = c.prev_mark
+            ),
+            summary AS (
+                SELECT
+                    st.plate,
+                    COALESCE(SUM(d.delta), 0) AS delta_sum,
+                    COALESCE(BOOL_OR(d.invalid), FALSE)
+                        OR st.mileage IS NULL OR st.bonus IS NULL AS invalid,
+                    CASE
+                        WHEN COUNT(d.plate) > 0 THEN (ARRAY_AGG(d.mark ORDER BY d.pass_time DESC, d.seq DESC))[1]
+                        ELSE st.last_record
+                    END AS last_mark,
+                    COALESCE(MAX(d.pass_time), st.last_record_time) AS last_time
+                FROM state st
+                LEFT JOIN deltas d ON d.plate = st.plate
+                GROUP BY st.plate, st.last_record, st.last_record_time, st.mileage, st.bonus
+            ),
+            updated AS (
+                UPDATE vehicle_info v
+                SET last_record = s.last_mark,
+                    last_record_time = s.last_time,
+                    mileage = v.mileage + s.delta_sum,
+                    points = (v.mileage + s.delta_sum) * v.bonus
+                FROM summary s
+                WHERE v.plate = s.plate AND NOT s.invalid
+                RETURNING v.plate
+            )
+            SELECT
+                (SELECT COUNT(*) FROM updated) AS updated,
+                ARRAY(SELECT plate FROM summary WHERE invalid ORDER BY plate) AS failed
+        """).format(
+            staging_table=sql.Identifier(self.STAGING_TABLE),
+            lookup_table=sql.Identifier(self.MARK_LOOKUP_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            updated, failed = cur.fetchone()
+            return {"updated": updated, "failed": failed}
+
+    def select_staging_vehicle_states(self) -> List[Dict[str, Any]]:
+        """
+        一次性查询暂存表中所有车牌在vehicle_info表中的当前状态
+
+        :return: 包含 id、plate、last_record、last_record_time、mileage、bonus 的字典列表
+        """
+        query = sql.SQL("""
+            SELECT vi.id, vi.plate, vi.last_record, vi.last_record_time, vi.mileage, vi.bonus
+            FROM vehicle_info vi
+            WHERE vi.plate IN (SELECT DISTINCT plate FROM {staging_table})
+        """).format(
+            staging_table=sql.Identifier(self.STAGING_TABLE)
+        )
+        return self.execute(query)
+
+    def iter_staging_rows(self, itersize: int = 10000):
+        """
+        使用服务端游标按车牌、时间顺序流式读取暂存表
+
+        :param itersize: 每次从服务端取回的行数
+        :return: 生成 plate、mark、pass_time、seq 字典的迭代器
+        """
+        query = sql.SQL("""
+            SELECT plate, mark, pass_time, seq
+            FROM {staging_table}
+            ORDER BY plate, pass_time, seq
+        """).format(
+            staging_table=sql.Identifier(self.STAGING_TABLE)
+        )
+        with self.conn.cursor(name="staging_stream") as cur:
+            cur.itersize = itersize
+            cur.execute(query)
+            col_names = None
+            for row in cur:
+                if col_names is None:
+                    col_names = [desc[0] for desc in cur.description]
+                yield dict(zip(col_names, row))
+
+    def fetch_staging_columns(self) -> Dict[str, Any]:
+        """
+        按列读取暂存表：车牌以 vehicle_info.id 表示，标记号以 marks 中的下标表示（空标记号为 -1），
+        通行时间换算为自 1970-01-01 起的微秒数
+
+        数据以二进制 COPY 一次读入内存缓冲区后直接映射为 NumPy 数组，不为每行创建 Python 对象；
+        没有车辆信息的车牌不会被读出
+
+        :return: 包含 vehicle_id、mark_code、pass_time_us、seq 四个 int64 数组和 marks（标记号列表）的字典
+        :raises DatabaseError: 暂存表中存在空的通行时间
+        """
+        marks_query = sql.SQL("SELECT DISTINCT mark FROM {staging_table} WHERE mark IS NOT NULL ORDER BY mark").format(
+            staging_table=sql.Identifier(self.STAGING_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(marks_query)
+            marks = [row[0] for row in cur.fetchall()]
+
+        # 标记号按 marks 中的位置编码（哈希连接小表），空标记号编码为 -1；
+        # 时间以 timestamp 的二进制形式（自 2000-01-01 起的微秒数）读出
+        copy_query = sql.SQL("""
+            COPY (
+                SELECT vi.id::BIGINT, COALESCE(m.code - 1, -1), s.pass_time, s.seq::BIGINT
+                FROM {staging_table} s
+                JOIN vehicle_info vi ON vi.plate = s.plate
+                LEFT JOIN unnest({marks}::VARCHAR[]) WITH ORDINALITY AS m(mark, code) ON m.mark = s.mark
+            ) TO STDOUT WITH BINARY
+        """).format(
+            staging_table=sql.Identifier(self.STAGING_TABLE),
+            marks=sql.Literal(marks)
+        )
+        buffer = io.BytesIO()
+        with self.conn.cursor() as cur:
+            cur.copy_expert(copy_query, buffer)
+        try:
+            vehicle_ids, mark_codes, pass_times, seqs = read_binary_copy_int64(buffer.getbuffer(), 4)
+        except ValueError as e:
+            raise DatabaseError(f"读取暂存表失败: {e}")
+        return {
+            "vehicle_id": vehicle_ids,
+            "mark_code": mark_codes,
+            "marks": marks,
+            "pass_time_us": pass_times + PG_EPOCH_OFFSET_US,
+            "seq": seqs
+        }
+
+    def update_vehicle_info_states(self, rows: List[tuple]) -> int:
+        """
+        批量写回车辆状态：COPY 到临时表后用一条 UPDATE ... FROM 更新vehicle_info表
+
+        :param rows: (plate, last_record, last_record_time, mileage, points) 元组列表
+        :return: 更新的车辆数
+        """
+        create_query = sql.SQL("""
+            CREATE TEMP TABLE IF NOT EXISTS {update_table} (
+                plate VARCHAR(20),
+                last_record VARCHAR(20),
+                last_record_time TIMESTAMP,
+                mileage DOUBLE PRECISION,
+                points DOUBLE PRECISION
+            )
+        """).format(
+            update_table=sql.Identifier(self.VEHICLE_INFO_UPDATE_TABLE)
+        )
+        update_query = sql.SQL("""
+            UPDATE vehicle_info v
+            SET last_record = u.last_record,
+                last_record_time = u.last_record_time,
+                mileage = u.mileage,
+                points = u.points
+            FROM {update_table} u
+            WHERE v.plate = u.plate
+        """).format(
+            update_table=sql.Identifier(self.VEHICLE_INFO_UPDATE_TABLE)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(create_query)
+        self.truncate_table(self.VEHICLE_INFO_UPDATE_TABLE)
+        self.insert_many(self.VEHICLE_INFO_UPDATE_TABLE, rows,
+                         columns=["plate", "last_record", "last_record_time", "mileage", "points"],
+                         method='binary', column_types=self.VEHICLE_INFO_UPDATE_TYPES)
+        with self.conn.cursor() as cur:
+            cur.execute(update_query)
+            return cur.rowcount
+
+    # NOTIFY 负载的最大字节数（服务端上限为 8000 字节）
+    NOTIFY_PAYLOAD_LIMIT = 7900
+
+    def notify_plates(self, channel: str, plates: Optional[List[str]]) -> int:
+        """
+        在当前事务中发送车牌变更通知，事务提交后才会送达监听方
+
+        车牌列表按负载上限分块，每块为一个 JSON 数组；plates 为 None 时发送 "*" 表示全部失效
+
+        :param channel: 通知通道名
+        :param plates: 变更的车牌列表，None 表示全部
+        :return: 发送的通知条数
+        """
+        if plates is None:
+            payloads = ["*"]
+        else:
+            payloads = []
+            chunk: List[str] = []
+            size = 2
+            for plate in plates:
+                plate_size = len(json.dumps(plate, ensure_ascii=False).encode('utf-8')) + 1
+                if chunk and size + plate_size > self.NOTIFY_PAYLOAD_LIMIT:
+                    payloads.append(json.dumps(chunk, ensure_ascii=False, separators=(',', ':')))
+                    chunk, size = [], 2
+                chunk.append(plate)
+                size += plate_size
+            if chunk:
+                payloads.append(json.dumps(chunk, ensure_ascii=False, separators=(',', ':')))
+        with self.conn.cursor() as cur:
+            for payload in payloads:
+                cur.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+        return len(payloads)
+
+    def select_table_plates(self, table: str) -> List[str]:
+        """
+        查询表中出现的所有车牌（去重），如暂存表、车辆信息装载表
+
+        :param table: 表名
+        :return: 车牌列表
+        """
+        query = sql.SQL("SELECT DISTINCT plate FROM {table} WHERE plate IS NOT NULL").format(
+            table=sql.Identifier(table)
+        )
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            return [row[0] for row in cur.fetchall()]
+
     def truncate_table(self, table: str) -> None:
         """
         清空表中的所有数据
@@ -0,0 +1,150 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import psycopg2.extensions
+
+# 进程内所有连接的预编译语句缓存累计计数
+_totals = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+_totals_lock = threading.Lock()
+
+# psycopg2 风格的占位符：%s、转义的 %% 以及命名占位符 %(name)s
+_PLACEHOLDER_PATTERN = re.compile(r"%%|%s|%\([^)]*\)s")
+
+
+def to_positional(query: str) -> Optional[Tuple[str, int]]:
+    """
+    将使用 %s 占位符的语句转换为 PREPARE 使用的 $1、$2 … 形式
+
+    :param query: 语句文本
+    :return: (转换后的语句, 参数个数)，含命名占位符时返回None
+    """
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        token = match.group(0)
+        if token == "%%":
+            return "%"
+        if token != "%s":
+            raise ValueError(token)
+        count += 1
+        return f"${count}"
+
+    try:
+        return _PLACEHOLDER_PATTERN.sub(replace, query), count
+    except ValueError:
+        return None
+
+
+class StatementCache:
+    """
+    单个连接上服务端预编译语句的 LRU 缓存
+
+    键为组合后的语句文本（即语句形状，参数以占位符表示），值为 PREPARE 使用的语句名
+    """
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self._statements: "OrderedDict[str, str]" = OrderedDict()
+        self._rejected = set()
+        self._counter = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def _count(self, key: str) -> None:
+        with _totals_lock:
+            _totals[key] += 1
+
+    def get(self, query: str) -> Optional[str]:
+        """
+        查找已预编译的语句，命中时移到最近使用的位置
+
+        :param query: 语句文本
+        :return: 语句名，未缓存时返回None
+        """
+        name = self._statements.get(query)
+        if name is None:
+            self.misses += 1
+            self._count("misses")
+            return None
+        self._statements.move_to_end(query)
+        self.hits += 1
+        self._count("hits")
+        return name
+
+    def is_rejected(self, query: str) -> bool:
+        """
+        判断语句是否曾预编译失败（如参数类型无法推断），此类语句直接执行
+        """
+        return query in self._rejected
+
+    def reject(self, query: str) -> None:
+        """
+        记录无法预编译的语句
+        """
+        if len(self._rejected) < self.max_size:
+            self._rejected.add(query)
+        self._count("rejected")
+
+    def next_name(self) -> str:
+        """
+        生成新的语句名
+        """
+        self._counter += 1
+        return f"stmt_{self._counter}"
+
+    def put(self, query: str, name: str) -> Optional[str]:
+        """
+        登记已预编译的语句
+
+        :param query: 语句文本
+        :param name: 语句名
+        :return: 因超出容量被淘汰的语句名（需要 DEALLOCATE），没有时返回None
+        """
+        self._statements[query] = name
+        if len(self._statements) <= self.max_size:
+            return None
+        _, evicted = self._statements.popitem(last=False)
+        self.evictions += 1
+        self._count("evictions")
+        return evicted
+
+    def clear(self) -> None:
+        """
+        清空已登记的语句（服务端语句已失效时调用），保留语句名计数，避免与服务端残留的同名语句冲突
+        """
+        self._statements.clear()
+        self._rejected.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取本连接的缓存统计
+        """
+        return {"size": len(self._statements), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "rejected": len(self._rejected)}
+
+
+class CachedStatementConnection(psycopg2.extensions.connection):
+    """
+    携带预编译语句缓存的连接对象，缓存随连接关闭而失效
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statement_cache: Optional[StatementCache] = None
+
+
+def statement_cache_totals() -> Dict[str, int]:
+    """
+    获取进程内所有连接的预编译语句缓存累计计数
+
+    :return: hits、misses、evictions、rejected 计数
+    """
+    with _totals_lock:
+        return dict(_totals)
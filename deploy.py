@@ -8,12 +8,16 @@ import psycopg2
 import logging
 import sys
 import os
+from datetime import date
 from typing import Dict, Any
 
+from psycopg2 import errors, sql
+
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config.config_manager import ConfigManager
+from database.postgresql_client import PostgreSQLClient
 
 # 配置日志
 logging.basicConfig(
@@ -26,6 +30,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 通行记录 (plate, pass_time, mark) 唯一索引
+VEHICLE_RECORD_UNIQUE_INDEX = "uq_vehicle_record_plate_time_mark"
+
 
 def ensure_database_exists(host: str, port: int, user: str, password: str, dbname: str) -> bool:
     """
@@ -79,6 +86,228 @@ def ensure_database_exists(host: str, port: int, user: str, password: str, dbnam
             conn.close()
 
 
+def create_vehicle_record_table(client: PostgreSQLClient, premake_months: int = 3) -> None:
+    """
+    创建按 pass_time 按月分区的vehicle_record表及默认分区，并创建当前月起 premake_months 个月的分区
+
+    只创建分区表的空壳：已存在的普通表（未分区的旧表）改名为 vehicle_record_legacy，记录由
+    migrate_vehicle_record_legacy_rows 按月迁移，(plate, pass_time, mark) 唯一索引由
+    migrate_vehicle_record_unique_index 在线创建，都不在初始化事务中持有 ACCESS EXCLUSIVE 锁执行；
+    (plate, pass_time, id) 索引建在父表上，每个分区自动创建对应的索引
+
+    :param client: 已连接的数据库客户端（处于事务中），月分区由其 create_vehicle_record_partition 创建
+    :param premake_months: 提前创建的月数
+    """
+    cur = client.conn.cursor()
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('vehicle_record')")
+    row = cur.fetchone()
+    legacy = row is not None and row[0] == 'r'
+    if legacy:
+        logger.info("检测到未分区的vehicle_record表，改名为vehicle_record_legacy，稍后迁移为分区表...")
+        cur.execute("ALTER TABLE vehicle_record RENAME TO vehicle_record_legacy")
+        cur.execute("ALTER TABLE vehicle_record_legacy RENAME CONSTRAINT vehicle_record_pkey TO vehicle_record_legacy_pkey")
+        cur.execute("ALTER SEQUENCE IF EXISTS vehicle_record_id_seq RENAME TO vehicle_record_legacy_id_seq")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS vehicle_record (
+        id BIGSERIAL,
+        plate VARCHAR(20) NOT NULL,
+        mark VARCHAR(20) NOT NULL,
+        pass_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, pass_time)
+    ) PARTITION BY RANGE (pass_time);
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS vehicle_record_default PARTITION OF vehicle_record DEFAULT;")
+
+    current = date.today().replace(day=1)
+    for offset in range(premake_months + 1):
+        client.create_vehicle_record_partition(client.add_months(current, offset))
+
+    if legacy:
+        # 新表的 id 接着旧表继续分配，迁移过来的记录保留原 id
+        cur.execute("SELECT setval('vehicle_record_id_seq', GREATEST((SELECT MAX(id) FROM vehicle_record_legacy), 1))")
+
+    # (plate, pass_time, id) 同时用于按车牌的时间范围查询和 (pass_time, id) 键集分页
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_record_plate_time_id ON vehicle_record (plate, pass_time, id);")
+    cur.execute("DROP INDEX IF EXISTS idx_vehicle_record_plate_time;")
+    cur.close()
+
+
+def migrate_vehicle_record_legacy_rows(host: str, port: int, user: str, password: str, dbname: str) -> Dict[str, Any]:
+    """
+    把 vehicle_record_legacy（未分区的旧表）中的记录按月迁移到vehicle_record分区表
+
+    每个月单独一个事务：创建该月分区，再用 DELETE ... RETURNING 把该月记录从旧表移入分区表，
+    中断后重新执行会从未迁移的月份继续。重复的 (plate, pass_time, mark) 记录在此原样迁移，
+    由 migrate_vehicle_record_unique_index 建唯一索引前去重（保留 id 最小的一条）；
+    pass_time 为空的记录无法放入分区，保留在 vehicle_record_legacy 中，全部迁移完时删除旧表
+
+    :param host: 数据库主机地址
+    :param port: 数据库端口号
+    :param user: 数据库用户名
+    :param password: 数据库密码
+    :param dbname: 数据库名称
+    :return: 包含 success、migrated（迁移的记录数）、remaining（保留在旧表中的记录数）和 message 的字典
+    """
+    result = {"success": False, "migrated": 0, "remaining": 0, "message": ""}
+    client = PostgreSQLClient(host, port, user, password, dbname)
+    client.connect()
+    try:
+        conn = client.conn
+        conn.autocommit = False
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('vehicle_record_legacy') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            result["success"] = True
+            result["message"] = "没有需要迁移的旧表"
+            return result
+
+        logger.info("开始把vehicle_record_legacy按月迁移到分区表...")
+        cur.execute("""
+        SELECT DISTINCT date_trunc('month', pass_time)::date FROM vehicle_record_legacy
+        WHERE pass_time IS NOT NULL ORDER BY 1
+        """)
+        months = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+        for month in months:
+            client.create_vehicle_record_partition(month)
+            cur.execute("""
+            WITH moved AS (
+                DELETE FROM vehicle_record_legacy
+                WHERE pass_time >= %s AND pass_time < %s
+                RETURNING id, plate, mark, pass_time
+            )
+            INSERT INTO vehicle_record (id, plate, mark, pass_time)
+            SELECT id, plate, mark, pass_time FROM moved
+            ON CONFLICT DO NOTHING
+            """, (month, client.add_months(month, 1)))
+            result["migrated"] += cur.rowcount
+            conn.commit()
+            logger.info(f"✓ {month:%Y-%m}: 迁移 {cur.rowcount} 条记录")
+
+        cur.execute("SELECT COUNT(*) FROM vehicle_record_legacy")
+        result["remaining"] = cur.fetchone()[0]
+        if result["remaining"]:
+            logger.warning(f"vehicle_record_legacy中保留了 {result['remaining']} 条 pass_time 为空的记录")
+        else:
+            cur.execute("DROP TABLE vehicle_record_legacy")
+        conn.commit()
+        result["success"] = True
+        result["message"] = f"vehicle_record迁移完成：{result['migrated']} 条记录"
+        logger.info(f"✓ {result['message']}")
+        return result
+    except Exception as e:
+        client.rollback()
+        result["message"] = f"vehicle_record迁移失败: {str(e)}"
+        logger.error(f"✗ {result['message']}")
+        raise
+    finally:
+        client.close()
+
+
+def _is_index_valid(cur, index: str) -> Any:
+    """
+    查询索引是否有效
+
+    :return: 有效返回True，无效（如并发创建失败留下的索引）返回False，不存在返回None
+    """
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (index,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _dedupe_vehicle_record_partition(cur, partition: str) -> int:
+    """
+    删除分区中重复的 (plate, pass_time, mark) 记录，每组保留 id 最小的一条
+
+    :return: 删除的记录数
+    """
+    cur.execute(sql.SQL("""
+    DELETE FROM {partition} a USING {partition} b
+    WHERE a.plate = b.plate AND a.pass_time = b.pass_time AND a.mark = b.mark AND a.id > b.id
+    """).format(partition=sql.Identifier(partition)))
+    return cur.rowcount
+
+
+def migrate_vehicle_record_unique_index(host: str, port: int, user: str, password: str, dbname: str,
+                                        max_attempts: int = 3) -> Dict[str, Any]:
+    """
+    为vehicle_record表在线创建 (plate, pass_time, mark) 唯一索引（初始化时只创建分区表空壳，不建该索引）
+
+    分区表的父表上不能 CREATE INDEX CONCURRENTLY：先用 ON ONLY 在父表上创建（无效的）索引，
+    再逐个分区去重、CONCURRENTLY 创建唯一索引并 ATTACH 到父表索引，所有分区都挂上后父表索引自动生效。
+    使用自动提交连接，每个分区单独完成，可以中断后重新执行；
+    建索引期间又写入重复记录导致失败时，删除留下的无效索引后重新去重、重建
+
+    :param host: 数据库主机地址
+    :param port: 数据库端口号
+    :param user: 数据库用户名
+    :param password: 数据库密码
+    :param dbname: 数据库名称
+    :param max_attempts: 每个分区建索引的最大尝试次数
+    :return: 包含 success、deduped（删除的重复记录数）、indexed_partitions 和 message 的字典
+    """
+    result = {"success": False, "deduped": 0, "indexed_partitions": [], "message": ""}
+    conn = psycopg2.connect(host=host, port=port, user=user, password=password, dbname=dbname)
+    try:
+        conn.autocommit = True  # CREATE INDEX CONCURRENTLY 不能在事务中执行
+        cur = conn.cursor()
+        if _is_index_valid(cur, VEHICLE_RECORD_UNIQUE_INDEX):
+            result["success"] = True
+            result["message"] = "唯一索引已存在"
+            return result
+
+        logger.info("开始为vehicle_record在线创建 (plate, pass_time, mark) 唯一索引...")
+        parent_index = sql.Identifier(VEHICLE_RECORD_UNIQUE_INDEX)
+        cur.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON ONLY vehicle_record (plate, pass_time, mark)")
+                    .format(parent_index))
+
+        # 尚未挂到父表索引上的分区
+        cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'vehicle_record'::regclass
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_inherits ii JOIN pg_index x ON x.indexrelid = ii.inhrelid
+              WHERE ii.inhparent = to_regclass(%s) AND x.indrelid = i.inhrelid)
+        ORDER BY c.relname
+        """, (VEHICLE_RECORD_UNIQUE_INDEX,))
+        partitions = [row[0] for row in cur.fetchall()]
+
+        for partition in partitions:
+            index = f"{partition}_plate_pass_time_mark_idx"
+            for attempt in range(1, max_attempts + 1):
+                if _is_index_valid(cur, index) is False:
+                    cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(index)))
+                deleted = _dedupe_vehicle_record_partition(cur, partition)
+                result["deduped"] += deleted
+                try:
+                    cur.execute(sql.SQL("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (plate, pass_time, mark)")
+                                .format(sql.Identifier(index), sql.Identifier(partition)))
+                    break
+                except errors.UniqueViolation:
+                    logger.warning(f"{partition} 建索引期间写入了重复记录（第 {attempt} 次），重新去重")
+            else:
+                raise RuntimeError(f"{partition} 唯一索引创建失败：重复记录持续写入")
+            cur.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(parent_index, sql.Identifier(index)))
+            result["indexed_partitions"].append(partition)
+            logger.info(f"✓ {partition}: 删除重复记录 {deleted} 条，唯一索引已创建")
+
+        if not _is_index_valid(cur, VEHICLE_RECORD_UNIQUE_INDEX):
+            raise RuntimeError("唯一索引仍未生效，请检查是否有分区未挂上索引")
+        result["success"] = True
+        result["message"] = f"唯一索引创建完成：{len(partitions)} 个分区，删除重复记录 {result['deduped']} 条"
+        logger.info(f"✓ {result['message']}")
+        return result
+    except Exception as e:
+        result["message"] = f"唯一索引迁移失败: {str(e)}"
+        logger.error(f"✗ {result['message']}")
+        raise
+    finally:
+        conn.close()
+
+
 def init_postgres_db(host: str, port: int, user: str, password: str, dbname: str) -> Dict[str, Any]:
     """
     初始化PostgreSQL数据库，创建车辆管理系统所需的表结构
@@ -101,13 +330,9 @@ def init_postgres_db(host: str, port: int, user: str, password: str, dbname: str
     
     try:
         # 建立数据库连接
-        conn = psycopg2.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            dbname=dbname
-        )
+        client = PostgreSQLClient(host, port, user, password, dbname)
+        client.connect()
+        conn = client.conn
         conn.autocommit = False  # 开启事务
         cur = conn.cursor()
         
@@ -133,17 +358,93 @@ def init_postgres_db(host: str, port: int, user: str, password: str, dbname: str
         result["created_tables"].append("vehicle_info")
         logger.info("✓ vehicle_info表创建成功")
         
-        create_vehicle_record_sql = """
-        CREATE TABLE IF NOT EXISTS vehicle_record (
-            id SERIAL PRIMARY KEY,
-            plate VARCHAR(20) NOT NULL, 
+        # 通行记录表：按 pass_time 按月分区，旧的普通表迁移为分区表
+        record_config = ConfigManager().get("business.record_partitions", {}) or {}
+        create_vehicle_record_table(client, record_config.get("premake_months", 3))
+        result["created_tables"].append("vehicle_record")
+        logger.info("✓ vehicle_record表创建成功")
+
+        # 导入批次登记表与按批次区分的过滤表（UNLOGGED，跨连接保留导入数据）
+        create_import_batch_sql = """
+        CREATE TABLE IF NOT EXISTS import_batch (
+            batch_id SERIAL PRIMARY KEY,
+            filename VARCHAR(255),
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            row_count INTEGER DEFAULT 0,
+            filtered_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        """
+        cur.execute(create_import_batch_sql)
+        result["created_tables"].append("import_batch")
+        logger.info("✓ import_batch表创建成功")
+
+        create_filtered_trace_data_sql = """
+        CREATE UNLOGGED TABLE IF NOT EXISTS filtered_trace_data (
+            batch_id INTEGER NOT NULL,
+            plate VARCHAR(20),
+            pass_time TIMESTAMP,
+            mark VARCHAR(20)
+        );
+        """
+        cur.execute(create_filtered_trace_data_sql)
+        result["created_tables"].append("filtered_trace_data")
+        logger.info("✓ filtered_trace_data表创建成功")
+
+        # 迟到记录表：增量处理时早于车辆水位线的通行记录，等待对账处理
+        create_late_arrival_sql = """
+        CREATE TABLE IF NOT EXISTS late_arrival (
+            plate VARCHAR(20) NOT NULL,
             mark VARCHAR(20) NOT NULL,
-            pass_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            pass_time TIMESTAMP NOT NULL,
+            batch_id INTEGER,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (plate, pass_time, mark)
         );
         """
-        cur.execute(create_vehicle_record_sql)
-        result["created_tables"].append("vehicle_record")
-        logger.info("✓ vehicle_record表创建成功")
+        cur.execute(create_late_arrival_sql)
+        result["created_tables"].append("late_arrival")
+        logger.info("✓ late_arrival表创建成功")
+
+        # 导入文件登记表：按内容摘要拒绝重复上传的轨迹文件
+        create_ingest_ledger_sql = """
+        CREATE TABLE IF NOT EXISTS ingest_ledger (
+            content_hash CHAR(64) PRIMARY KEY,
+            batch_id INTEGER NOT NULL,
+            filename VARCHAR(255),
+            byte_count BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+        cur.execute(create_ingest_ledger_sql)
+        result["created_tables"].append("ingest_ledger")
+        logger.info("✓ ingest_ledger表创建成功")
+
+        # 后台任务表：轨迹过滤、确认执行等任务的状态与进度
+        create_import_job_sql = """
+        CREATE TABLE IF NOT EXISTS import_job (
+            job_id SERIAL PRIMARY KEY,
+            kind VARCHAR(30) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            batch_id INTEGER,
+            rows_processed BIGINT DEFAULT 0,
+            rows_total BIGINT,
+            message TEXT,
+            worker VARCHAR(100),
+            heartbeat_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        """
+        cur.execute(create_import_job_sql)
+        # 执行任务的工作进程（主机名:进程号）与租约心跳时间，超过租约未续租的任务会被标记为失败
+        cur.execute("ALTER TABLE import_job ADD COLUMN IF NOT EXISTS worker VARCHAR(100), "
+                    "ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;")
+        result["created_tables"].append("import_job")
+        logger.info("✓ import_job表创建成功")
 
         
         # 添加索引以提高查询性能
@@ -151,6 +452,9 @@ def init_postgres_db(host: str, port: int, user: str, password: str, dbname: str
         
         # 为vehicle_info表的plate字段创建索引
         cur.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_info_plate ON vehicle_info(plate);")
+
+        # 为过滤表的批次号创建索引
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_filtered_trace_data_batch ON filtered_trace_data(batch_id);")
            
         # 提交事务
         conn.commit()
@@ -213,6 +517,18 @@ def main():
         if not db_init_result["success"]:
             logger.error(f"数据库表初始化失败: {db_init_result['message']}")
             return 1
+
+        # 未分区的旧表：按月迁移到分区表
+        legacy_result = migrate_vehicle_record_legacy_rows(**db_config)
+        if not legacy_result["success"]:
+            logger.error(f"通行记录迁移失败: {legacy_result['message']}")
+            return 1
+
+        # 通行记录表：逐个分区去重后在线创建唯一索引
+        migrate_result = migrate_vehicle_record_unique_index(**db_config)
+        if not migrate_result["success"]:
+            logger.error(f"通行记录唯一索引迁移失败: {migrate_result['message']}")
+            return 1
         
         logger.info("车辆管理系统部署完成！")
         return 0
@@ -0,0 +1,17 @@
+"""
+gunicorn 配置：gunicorn -c gunicorn.conf.py app:app
+"""
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+workers = multiprocessing.cpu_count()
+# 大文件流式上传可能持续较长时间
+timeout = 3600
+
+
+def post_worker_init(worker):
+    """
+    工作进程加载应用后立即预热数据库连接
+    """
+    from app import warm_up_worker
+    warm_up_worker()
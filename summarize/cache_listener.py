@@ -0,0 +1,131 @@
+import os
+import json
+import select
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+
+from summarize.vehicle_cache import VehicleCache
+
+# 获取或创建logger
+logger = logging.getLogger(__name__)
+
+
+class CacheInvalidationListener:
+    """
+    监听车辆状态变更通知（LISTEN/NOTIFY），失效本进程的车辆状态缓存
+
+    使用独立的自动提交连接（不占用连接池），在后台线程中等待通知：
+    负载为 "*" 时清空缓存，否则为车牌 JSON 数组，逐个失效。
+    连接断开期间可能错过通知，因此每次（重新）开始监听时都清空缓存
+    """
+
+    def __init__(self, conn_params: Dict[str, Any], channel: str, cache: VehicleCache,
+                 poll_interval: float = 5.0, retry_interval: float = 5.0):
+        """
+        :param conn_params: psycopg2.connect 的连接参数
+        :param channel: 通知通道名
+        :param cache: 需要失效的车辆状态缓存
+        :param poll_interval: 等待通知的超时秒数（用于检查停止标志）
+        :param retry_interval: 连接失败后重试的间隔秒数
+        """
+        self.conn_params = conn_params
+        self.channel = channel
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"notifications": 0, "reconnects": 0}
+
+    def start(self) -> None:
+        """
+        启动监听线程
+        """
+        self._thread = threading.Thread(target=self._run, name='cache-listener', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        停止监听线程
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval + 1)
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.conn_params)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        return conn
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self.cache.clear()
+                logger.info(f"开始监听车辆状态变更通知: {self.channel}")
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.handle(conn.notifies.pop(0).payload)
+            except Exception as e:
+                self.stats["reconnects"] += 1
+                logger.warning(f"车辆状态变更监听连接异常，{self.retry_interval} 秒后重连: {str(e)}")
+                self._stop.wait(self.retry_interval)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+
+    def handle(self, payload: str) -> None:
+        """
+        处理一条通知
+
+        :param payload: "*" 或车牌 JSON 数组
+        """
+        self.stats["notifications"] += 1
+        if payload == "*":
+            self.cache.clear()
+            return
+        try:
+            plates = json.loads(payload)
+        except ValueError:
+            logger.warning(f"无法解析的车辆状态变更通知，清空缓存: {payload[:100]}")
+            self.cache.clear()
+            return
+        self.cache.invalidate(plates)
+
+
+# 每个进程一个监听线程
+_listener: Optional[CacheInvalidationListener] = None
+_listener_pid: Optional[int] = None
+_listener_lock = threading.Lock()
+
+
+def start_cache_listener(conn_params: Dict[str, Any], channel: str, cache: VehicleCache) -> CacheInvalidationListener:
+    """
+    为当前进程启动车辆状态变更监听线程，已启动时直接返回
+
+    :param conn_params: psycopg2.connect 的连接参数
+    :param channel: 通知通道名
+    :param cache: 需要失效的车辆状态缓存
+    :return: 监听器
+    """
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener is None or _listener_pid != os.getpid():
+            _listener = CacheInvalidationListener(conn_params, channel, cache)
+            _listener.start()
+            _listener_pid = os.getpid()
+        return _listener
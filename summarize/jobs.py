@@ -0,0 +1,194 @@
+import os
+import time
+import socket
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from database.postgresql_client import PostgreSQLClient
+from database.connection_pool import ConnectionPool
+
+# 获取或创建logger
+logger = logging.getLogger(__name__)
+
+
+class JobManager:
+    """
+    后台任务管理器
+
+    任务在本进程的线程池中执行，状态（queued / running / done / failed）、
+    已处理行数与总行数保存在 import_job 表中，任意工作进程都可以查询。
+    本进程未结束的任务由心跳线程每 heartbeat_interval 秒续租（更新 heartbeat_at）；
+    工作进程退出后租约不再续期，超过 lease_seconds 未续租的任务在管理器启动和查询任务时标记为 failed
+    """
+
+    def __init__(self, pool: ConnectionPool, max_workers: int = 2, progress_interval: float = 1.0,
+                 heartbeat_interval: float = 10.0, lease_seconds: float = 60.0):
+        """
+        :param pool: 共享连接池，任务状态读写从中借用连接
+        :param max_workers: 同时执行的任务数
+        :param progress_interval: 进度写入数据库的最小间隔（秒）
+        :param heartbeat_interval: 续租间隔（秒）
+        :param lease_seconds: 租约时长（秒），应为续租间隔的数倍
+        """
+        self.pool = pool
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_seconds = lease_seconds
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        self._table_ready = False
+        self._table_lock = threading.Lock()
+        self._active_jobs = set()
+        self._active_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._fail_expired_jobs()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='import-job-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+
+    @contextmanager
+    def _client(self):
+        """
+        借用一个连接执行任务表读写，结束时提交并归还
+        """
+        client = PostgreSQLClient(**self.pool.conn_params, pool=self.pool)
+        client.connect()
+        try:
+            with self._table_lock:
+                if not self._table_ready:
+                    client.create_import_job_table()
+                    client.commit()
+                    self._table_ready = True
+            yield client
+            client.commit()
+        except Exception:
+            client.rollback()
+            raise
+        finally:
+            client.close()
+
+    def _heartbeat(self) -> None:
+        """
+        心跳线程：定期为本进程未结束的任务续租
+        """
+        while not self._stopped.wait(self.heartbeat_interval):
+            with self._active_lock:
+                job_ids = sorted(self._active_jobs)
+            if not job_ids:
+                continue
+            try:
+                with self._client() as client:
+                    client.renew_import_job_leases(job_ids)
+            except Exception as e:
+                logger.warning(f"后台任务续租失败: {str(e)}")
+
+    def _fail_expired_jobs(self) -> None:
+        """
+        将租约已过期的 queued / running 任务标记为 failed（执行它们的工作进程已退出或失去响应）
+        """
+        try:
+            with self._client() as client:
+                job_ids = client.fail_expired_import_jobs(self.lease_seconds, "执行任务的工作进程已退出或失去响应")
+            if job_ids:
+                logger.warning(f"已将租约过期的后台任务标记为失败: {job_ids}")
+        except Exception as e:
+            logger.warning(f"清理租约过期的后台任务失败: {str(e)}")
+
+    def submit(self, kind: str, func: Callable[[Callable[..., None]], str], batch_id: Optional[int] = None) -> int:
+        """
+        登记并提交一个后台任务
+
+        :param kind: 任务类型，如 filter_trace / process_data
+        :param func: 任务函数，参数为进度回调 progress(已处理行数, 总行数)，返回完成消息
+        :param batch_id: 关联的导入批次号（可选）
+        :return: 任务号
+        """
+        with self._client() as client:
+            job_id = client.create_import_job(kind, batch_id, self.worker)
+        with self._active_lock:
+            self._active_jobs.add(job_id)
+        self._executor.submit(self._run, job_id, func)
+        logger.info(f"后台任务 {job_id} ({kind}) 已提交")
+        return job_id
+
+    def _run(self, job_id: int, func: Callable[[Callable[..., None]], str]) -> None:
+        """
+        执行任务并记录状态
+        """
+        try:
+            with self._client() as client:
+                client.update_import_job(job_id, {"status": "running"}, timestamp_column="started_at")
+            message = func(self._progress_callback(job_id))
+            with self._client() as client:
+                client.update_import_job(job_id, {"status": "done", "message": message}, timestamp_column="finished_at")
+            logger.info(f"后台任务 {job_id} 完成: {message}")
+        except Exception as e:
+            logger.error(f"后台任务 {job_id} 失败: {str(e)}")
+            logger.error(f"异常堆栈: {traceback.format_exc()}")
+            try:
+                with self._client() as client:
+                    client.update_import_job(job_id, {"status": "failed", "message": str(e)},
+                                             timestamp_column="finished_at")
+            except Exception as update_error:
+                logger.error(f"记录后台任务 {job_id} 失败状态时出错: {str(update_error)}")
+        finally:
+            with self._active_lock:
+                self._active_jobs.discard(job_id)
+
+    def _progress_callback(self, job_id: int) -> Callable[..., None]:
+        """
+        生成写入任务进度的回调，按 progress_interval 节流，完成时总会写入
+        """
+        last_write = [0.0]
+
+        def progress(rows_processed: int, rows_total: Optional[int] = None) -> None:
+            now = time.monotonic()
+            finished = rows_total is not None and rows_processed >= rows_total
+            if not finished and now - last_write[0] < self.progress_interval:
+                return
+            last_write[0] = now
+            data = {"rows_processed": rows_processed}
+            if rows_total is not None:
+                data["rows_total"] = rows_total
+            try:
+                with self._client() as client:
+                    client.update_import_job(job_id, data)
+            except Exception as e:
+                logger.warning(f"更新后台任务 {job_id} 进度失败: {str(e)}")
+
+        return progress
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        查询任务状态，并计算吞吐量（行/秒）和预计剩余秒数
+
+        :param job_id: 任务号
+        :return: 任务信息字典，不存在时返回None
+        """
+        self._fail_expired_jobs()
+        with self._client() as client:
+            job = client.get_import_job(job_id)
+        if job is None:
+            return None
+        elapsed = job.pop("elapsed_seconds")
+        processed = job["rows_processed"] or 0
+        throughput = processed / elapsed if elapsed else None
+        eta = None
+        if job["status"] == "running" and throughput and job["rows_total"]:
+            eta = max(job["rows_total"] - processed, 0) / throughput
+        job.update(elapsed_seconds=elapsed, throughput=throughput, eta_seconds=eta)
+        return job
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        停止接受新任务
+
+        :param wait: 是否等待正在执行的任务完成
+        """
+        self._executor.shutdown(wait=wait)
+        if wait:
+            # 未等待时仍在执行的任务需要继续续租
+            self._stopped.set()
@@ -0,0 +1,102 @@
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# 标记号格式：K + 公里数 + "+" + 三位米数，如 K0001+100
+MARK_PATTERN = re.compile(r"^K(\d+)\+(\d{3})$")
+
+
+def parse_mark_km(mark: str) -> float:
+    """
+    解析标记号，返回具体距离数字
+
+    :param mark: 标记号，格式为 "K0001+100"
+    :return: 具体距离
+    :raises ValueError: 当标记号格式错误时
+    """
+    match = MARK_PATTERN.match(mark.strip())
+    if not match:
+        raise ValueError(f"标记号格式错误：{mark}（应为Kx+y格式，如K3+500）")
+    return int(match.group(1)) + int(match.group(2)) / 1000.0
+
+
+class MarkEntry(NamedTuple):
+    """
+    标准路径中的一个标记号
+    """
+    mark: str        # 标记号（已驻留的字符串）
+    path_id: int     # 所在路径（0 为主路径，1 为第二条路径）
+    position: int    # 在所在路径中的位置
+    index: int       # 连续性判断使用的全局索引，与原 path_index 返回值一致
+    km: float        # 解析后的里程值
+
+
+class MarkCatalog:
+    """
+    标记号目录：由配置中的标准路径一次性编译而成
+
+    标记号精确匹配，每次查找为一次字典访问；同一标记号在多条路径中出现时，
+    只保留主路径（其次是靠前位置）的条目
+    """
+
+    # 第二条路径的索引偏移，保证两条路径之间不会被判为连续
+    PATH_INDEX_STRIDE = 10000
+
+    def __init__(self, standard_path: Sequence[Sequence[str]]):
+        """
+        :param standard_path: 标准路径配置，每条路径为按顺序排列的标记号列表
+        :raises ValueError: 当路径中的标记号格式错误时
+        """
+        self._entries: Dict[str, MarkEntry] = {}
+        for path_id, path in enumerate(standard_path):
+            for position, mark in enumerate(path):
+                if mark in self._entries:
+                    continue
+                mark = sys.intern(mark)
+                self._entries[mark] = MarkEntry(
+                    mark, path_id, position, position + path_id * self.PATH_INDEX_STRIDE, parse_mark_km(mark)
+                )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, mark: Optional[str]) -> MarkEntry:
+        """
+        查找标记号，不存在时抛出异常
+
+        :param mark: 标记号
+        :return: 标记号条目
+        :raises ValueError: 当标记号为None或不在标准路径中时
+        """
+        entry = self._entries.get(mark)
+        if entry is None:
+            if mark is None:
+                raise ValueError("标记号不能为None")
+            raise ValueError(f"标记号 {mark} 不在标准路径中")
+        return entry
+
+    def intern(self, mark: Optional[str]) -> Optional[str]:
+        """
+        返回目录中驻留的同值字符串，使大量记录共享同一个标记号对象
+
+        :param mark: 标记号
+        :return: 驻留的标记号，不在目录中时原样返回
+        """
+        entry = self._entries.get(mark)
+        return entry.mark if entry is not None else mark
+
+    def is_continuous(self, mark1: str, mark2: str) -> bool:
+        """
+        判断两个标记号是否连续（mark1 紧接在 mark2 之后）
+
+        :raises ValueError: 当任意标记号不在标准路径中时
+        """
+        return self.lookup(mark1).index - self.lookup(mark2).index == 1
+
+    def lookup_rows(self) -> List[tuple]:
+        """
+        生成数据库查找表数据
+
+        :return: (mark, path_pos, km) 元组列表，path_pos 即全局索引
+        """
+        return [(entry.mark, entry.index, entry.km) for entry in self._entries.values()]
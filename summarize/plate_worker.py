@@ -0,0 +1,118 @@
+import os
+import threading
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Sequence, Tuple
+
+from summarize.mark_catalog import MarkCatalog
+from summarize.vectorized import from_epoch_us, to_epoch_us
+
+# 工作进程内的标记号目录，由 init_worker 在进程启动时编译
+_catalog: Optional[MarkCatalog] = None
+
+
+def advance_plate_state(catalog: MarkCatalog, last_record: Optional[str], last_record_time: Any,
+                        mileage: float, marks: Sequence[Optional[str]], pass_times: Sequence[Any]) -> tuple:
+    """
+    按时间顺序推进单个车牌的状态：早于 last_record_time 的记录被跳过，
+    与上一标记号连续时累加里程差
+
+    :param catalog: 标记号目录
+    :param last_record: 当前最后标记号
+    :param last_record_time: 当前最后记录时间（datetime 或微秒数，与 pass_times 同类型）
+    :param mileage: 当前里程
+    :param marks: 按时间排序的标记号序列
+    :param pass_times: 与 marks 对应的通行时间序列
+    :return: (last_record, last_record_time, mileage)
+    :raises ValueError: 当标记号不在标准路径中时
+    """
+    lookup = catalog.lookup
+    for mark, pass_time in zip(marks, pass_times):
+        if last_record_time is not None and pass_time < last_record_time:
+            continue
+        if mark is not None and last_record is not None:
+            current = lookup(mark)
+            previous = lookup(last_record)
+            if current.index - previous.index == 1:
+                mileage += abs(current.km - previous.km) / 1000.0
+        last_record = mark
+        last_record_time = pass_time
+    return last_record, last_record_time, mileage
+
+
+def pack_plate(plate: str, vehicle_info: dict, records: List[dict]) -> tuple:
+    """
+    将一个车牌的状态和记录打包为便于跨进程传输的紧凑结构（时间为微秒数数组）
+    """
+    last_record_time = vehicle_info["last_record_time"]
+    return (
+        plate,
+        vehicle_info["last_record"],
+        None if last_record_time is None else to_epoch_us(last_record_time),
+        vehicle_info["mileage"],
+        vehicle_info["bonus"],
+        tuple(record["mark"] for record in records),
+        array('q', (to_epoch_us(record["pass_time"]) for record in records)),
+    )
+
+
+def init_worker(standard_path: Sequence[Sequence[str]]) -> None:
+    """
+    工作进程初始化：编译标记号目录
+    """
+    global _catalog
+    _catalog = MarkCatalog(standard_path)
+
+
+def process_plate_chunk(chunk: List[tuple]) -> List[Tuple[str, Optional[tuple], Optional[str]]]:
+    """
+    在工作进程中计算一组车牌的最终状态
+
+    :param chunk: pack_plate 生成的车牌数据列表
+    :return: (plate, 状态元组, 错误信息) 列表，状态元组为 (plate, last_record, last_record_time, mileage, points)
+    """
+    results = []
+    for plate, last_record, last_time, mileage, bonus, marks, pass_times in chunk:
+        try:
+            last_record, last_time, mileage = advance_plate_state(
+                _catalog, last_record, last_time, mileage, marks, pass_times
+            )
+            last_record_time = None if last_time is None else from_epoch_us(last_time)
+            results.append((plate, (plate, last_record, last_record_time, mileage, mileage * bonus), None))
+        except Exception as e:
+            results.append((plate, None, f"{type(e).__name__}: {str(e)}"))
+    return results
+
+
+# 按进程号和标准路径复用的常驻进程池，跨多次处理保持预热
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_key: Optional[tuple] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool(max_workers: int, standard_path: Sequence[Sequence[str]]) -> ProcessPoolExecutor:
+    """
+    获取当前进程的常驻计算进程池，不存在或配置变化时创建
+
+    使用 spawn 方式启动工作进程，避免在多线程的 Web 进程中 fork
+
+    :param max_workers: 工作进程数
+    :param standard_path: 标准路径配置
+    :return: 进程池
+    """
+    global _process_pool, _process_pool_key
+    key = (os.getpid(), max_workers, tuple(tuple(path) for path in standard_path))
+    with _process_pool_lock:
+        # 工作进程异常退出后进程池不可再用，需要重建
+        if _process_pool is None or _process_pool_key != key or getattr(_process_pool, '_broken', False):
+            if _process_pool is not None and _process_pool_key[0] == os.getpid():
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(standard_path,)
+            )
+            _process_pool_key = key
+        return _process_pool
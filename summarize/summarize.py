@@ -1,15 +1,26 @@
-from typing import List, Dict, Any, Optional
-from collections import defaultdict
-from decimal import Decimal
+from typing import Callable, List, Dict, Any, Optional
 from database.postgresql_client import PostgreSQLClient
+from database.connection_pool import get_shared_pool
+from database.copy_stream import BytesIteratorFile, IteratorFile, format_copy_row
+from summarize.mark_catalog import MarkCatalog, parse_mark_km
+from summarize.vectorized import compute_vehicle_states
+from summarize.plate_worker import advance_plate_state, get_process_pool, pack_plate, process_plate_chunk
+from summarize.trace_ingest import TraceRowEncoder
+from summarize.vehicle_cache import get_vehicle_cache
+from summarize.cache_listener import start_cache_listener
+from summarize.upload_stream import HashingStream
 import csv
 import datetime
-import re
+import io
 import logging
 import os
-from contextlib import contextmanager
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 import threading
+import psycopg2
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 
 # 导入配置管理器
 import sys
@@ -36,12 +47,7 @@ def mark_parse(mark: str) -> float:
     :return: 具体距离
     :raises ValueError: 当标记号格式错误时
     """
-    match = re.match(r"^K(\d+)\+(\d{3})$", mark.strip())
-    if not match:
-        raise ValueError(f"标记号格式错误：{mark}（应为Kx+y格式，如K3+500）")
-    km_part = int(match.group(1))
-    meter_part = int(match.group(2))
-    return km_part + meter_part / 1000.0
+    return parse_mark_km(mark)
 
 def mileage_diff(mark1: str, mark2: str) -> float:
         """
@@ -61,6 +67,18 @@ class VehicleDataProcessor:
     """
     车辆数据处理类，负责车辆信息的导入、分析和查询
     """
+
+    # 支持的里程计算引擎
+    MILEAGE_ENGINES = ('python', 'sql', 'numpy', 'process')
+
+    # 支持的处理方式：full 为整批重放，incremental 为按车辆水位线增量处理
+    PROCESSING_MODES = ('full', 'incremental')
+
+    # 支持的轨迹导入方式
+    TRACE_INGEST_MODES = ('copy', 'binary')
+
+    # vehicle_info 各字段的最大长度，超长的行在COPY前被拒绝
+    VEHICLE_INFO_FIELD_LIMITS = (("username", 100), ("phone_num", 11), ("plate", 20), ("vehicle_type", 50))
     
     def __init__(self, host, port, user, password, dbname):
         """
@@ -72,36 +90,85 @@ class VehicleDataProcessor:
         :param password: 数据库密码
         :param dbname: 数据库名称
         """
-        # 创建PostgreSQL客户端实例
-        self.postgresql_client = PostgreSQLClient(host, port, user, password, dbname)
+        # 所有客户端（含工作线程）共享同一个连接池
+        pool_config = dict(config_manager.get('database_pool', {}))
+        # 每个连接缓存的预编译语句数，0 表示不使用预编译语句
+        statement_cache_size = pool_config.pop('statement_cache_size', 128)
+        self.pool = get_shared_pool(
+            {"host": host, "port": port, "user": user, "password": password, "database": dbname},
+            **pool_config
+        )
+        # 每个线程使用自己的PostgreSQL客户端，每次数据库操作从连接池借用连接、结束后归还，
+        # 长时间的导入不会阻塞同一工作进程中其它请求的查询
+        self._client_args = (host, port, user, password, dbname)
+        self._statement_cache_size = statement_cache_size
+        self._local = threading.local()
         
         # 从配置文件读取业务参数
         business_config = config_manager.get('business', {})
         self.standard_path = business_config.get('standard_path', 
                                                [["K0001+000", "K0100+000", "K0200+000", "K0300+000"],
                                                 ["K0001+300", "K0100+300", "K0100+300", "K0100+300"]])
+        # 由标准路径编译的标记号目录，热循环中的连续性判断与里程计算均为字典查找
+        self.mark_catalog = MarkCatalog(self.standard_path)
         self.max_threads_multiplier = business_config.get('max_threads_multiplier', 4)
         self.continuous_threshold = business_config.get('continuous_threshold', 1.0)
+        # 流式导入时每次送入COPY的数据块大小（字节）
+        self.copy_chunk_size = config_manager.get('app.upload_chunk_size', 1024 * 1024)
+        # process 引擎的工作进程数与每个任务包含的车牌数
+        self.process_workers = business_config.get('process_workers') or os.cpu_count()
+        self.process_chunk_size = business_config.get('process_chunk_size', 256)
+        # 流式读取暂存表时服务端游标每次取回的行数
+        self.staging_itersize = business_config.get('staging_itersize', 10000)
+        # 原始表过滤到过滤表时每段处理的数据块数（8KB/块），每段结束后报告一次进度
+        self.filter_chunk_blocks = business_config.get('filter_chunk_blocks', 8192)
+        # 计算结果累积到该条数后批量写回vehicle_info表
+        self.vehicle_info_flush_size = business_config.get('vehicle_info_flush_size', 10000)
+        # 车辆状态查询缓存（进程内共享），车辆状态变化时按车牌失效
+        cache_config = config_manager.get('vehicle_cache', {})
+        self.vehicle_cache = (get_vehicle_cache(cache_config.get('max_size', 100000), cache_config.get('ttl', 60))
+                              if cache_config.get('enabled', True) else None)
+        # 车辆状态变更通知通道（LISTEN/NOTIFY，用于多个工作进程之间失效缓存），
+        # 单次变更的车牌数超过 notify_max_plates 时通知全部失效
+        self.cache_notify_channel = cache_config.get('notify_channel', 'vehicle_info_changed')
+        self.cache_notify_max_plates = cache_config.get('notify_max_plates', 10000)
+        # 批量查询一次最多允许的车牌数
+        self.batch_query_max_plates = business_config.get('batch_query_max_plates', 10000)
+        # 通行记录查询：未指定开始时间时默认查询的天数、默认与最大每页记录数
+        self.passes_default_days = business_config.get('passes_default_days', 30)
+        self.passes_page_size = business_config.get('passes_page_size', 100)
+        self.passes_max_page_size = business_config.get('passes_max_page_size', 1000)
+        # vehicle_record 月分区：提前创建的月数、保留的月数（null 表示不卸载）与卸载后归档的模式名
+        partition_config = business_config.get('record_partitions', {})
+        self.partition_premake_months = partition_config.get('premake_months', 3)
+        self.partition_retention_months = partition_config.get('retention_months')
+        self.partition_archive_schema = partition_config.get('archive_schema', 'archive')
+        # 未确认导入批次的保留小时数，超时后自动清理
+        self.import_batch_ttl_hours = business_config.get('import_batch_ttl_hours', 24)
+        # 处理方式：incremental 时暂存表只包含晚于各车辆 last_record_time 的记录，
+        # 早于水位线的迟到记录另存，由 reconcile_late_arrivals 对账处理
+        self.processing_mode = business_config.get('processing_mode', 'full')
+        if self.processing_mode not in self.PROCESSING_MODES:
+            raise ValueError(f"未知的处理方式: {self.processing_mode}（可选: {', '.join(self.PROCESSING_MODES)}）")
+        # 轨迹导入方式：copy 为文本COPY到原始表后在数据库内过滤，binary 为客户端校验后二进制COPY到过滤表
+        self.trace_ingest = business_config.get('trace_ingest', 'copy')
+        if self.trace_ingest not in self.TRACE_INGEST_MODES:
+            raise ValueError(f"未知的轨迹导入方式: {self.trace_ingest}（可选: {', '.join(self.TRACE_INGEST_MODES)}）")
+        # 里程计算引擎：python 为逐车牌线程池处理，process 为常驻进程池处理，
+        # sql 为数据库内集合式计算，numpy 为整批列式计算
+        self.mileage_engine = business_config.get('mileage_engine', 'python')
+        if self.mileage_engine not in self.MILEAGE_ENGINES:
+            raise ValueError(f"未知的里程计算引擎: {self.mileage_engine}（可选: {', '.join(self.MILEAGE_ENGINES)}）")
 
     def path_index(self, mark: Optional[str]) -> int:
         """
         获取定位点在标准路径中的索引
         
         :param loc: 定位点（如 "K0001+000"）
-        :return: 索引位置（0-3）
+        :return: 索引位置（第一条路径为 0-3，第二条路径加 10000）
         :raises ValueError: 当定位点不在标准路径中时
         """
-        if mark is None:
-            raise ValueError("标记号不能为None")
-            
-        for loc,path in enumerate(self.standard_path[0]):
-            if mark in path:
-                return loc
-        else:
-            for loc,path in enumerate(self.standard_path[1]):
-                if mark in path:
-                    return loc+10000
-        raise ValueError(f"标记号 {mark} 不在标准路径中")
+        return self.mark_catalog.lookup(mark).index
 
     def is_continuous(self, mark1: str, mark2: str) -> bool:
         """
@@ -112,285 +179,741 @@ class VehicleDataProcessor:
         :return: 如果连续则返回True，否则返回False
         :raises ValueError: 当任意定位点不在标准路径中时
         """
-        index1 = self.path_index(mark1)
-        index2 = self.path_index(mark2)
-        return (index1 - index2 == 1)
+        return self.mark_catalog.is_continuous(mark1, mark2)
+
+    def mark_lookup_entries(self) -> List[tuple]:
+        """
+        生成数据库标记号查找表数据
+
+        :return: (mark, path_pos, km) 元组列表，同一标记号只保留首次出现的位置
+        """
+        return self.mark_catalog.lookup_rows()
     
+    @property
+    def postgresql_client(self) -> PostgreSQLClient:
+        """
+        当前线程的PostgreSQL客户端，只在 db_connection 中持有连接
+        """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = PostgreSQLClient(*self._client_args, pool=self.pool,
+                                      statement_cache_size=self._statement_cache_size)
+            self._local.client = client
+        return client
+
     def close(self):
         """
-        关闭数据库连接
+        归还当前线程仍持有的数据库连接
+        """
+        client = getattr(self._local, 'client', None)
+        if client is not None:
+            client.close()
+
+    def ensure_connection(self) -> bool:
+        """
+        从连接池借用并归还一个连接：连接池对空闲过久的连接做健康检查，失效则重建。
+        用于工作进程启动时预先建立连接
+
+        :return: 复用已有连接返回True，新建连接返回False
+        """
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        return conn.borrow_count > 1
+
+    def begin_request(self) -> None:
+        """
+        开始统计当前线程新一次请求的连接复用情况
         """
-        if hasattr(self, 'postgresql_client') and self.postgresql_client:
-            self.postgresql_client.close()
+        self._local.connection_reused = None
+
+    def connection_reused(self) -> Optional[bool]:
+        """
+        当前线程本次请求的第一次数据库操作是否复用了连接池中已有的连接
+
+        :return: 复用返回True，新建连接返回False，本次请求未访问数据库时返回None
+        """
+        return getattr(self._local, 'connection_reused', None)
     
     @contextmanager
     def db_connection(self):
         """
-        数据库连接上下文管理器，确保连接正确管理
+        数据库连接上下文管理器：从连接池借用连接并开启事务，结束时提交（出错时回滚）并归还连接
+
+        嵌套使用时内层直接加入外层的事务；连接级错误时丢弃该连接，由连接池重建
         """
+        client = self.postgresql_client
+        if client.conn is not None:
+            yield
+            return
+        client.connect()
+        if getattr(self._local, 'connection_reused', False) is None:
+            self._local.connection_reused = client.conn.borrow_count > 1
+        discard = False
         try:
-            # 如果连接不存在，则建立连接
-            if not self.postgresql_client.conn:
-                self.postgresql_client.connect()
             # 开启事务
-            self.postgresql_client.begin()
+            client.begin()
             yield
             # 提交事务
-            self.postgresql_client.commit()
+            client.commit()
         except Exception as e:
             # 回滚事务
-            self.postgresql_client.rollback()
+            try:
+                client.rollback()
+            except psycopg2.Error:
+                pass
+            # 连接级错误时丢弃连接
+            conn = client.conn
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) or (conn and conn.closed):
+                logger.warning(f"数据库连接异常，回收连接: {str(e)}")
+                discard = True
             raise e
+        finally:
+            client.close(discard=discard)
+
+    def _iter_vehicle_info_rows(self, reader, stats: Dict[str, int]):
+        """
+        校验车辆信息CSV行并输出COPY文本行，格式错误的行计入 stats["rejected"]
+        
+        :param reader: csv.reader（已跳过标题行）
+        :param stats: 计数字典，记录 rows 和 rejected
+        :return: COPY 文本行生成器
+        """
+        for idx, row in enumerate(reader, start=1):
+            stats["rows"] += 1
+            if len(row) != 4:
+                stats["rejected"] += 1
+                logger.warning(f"第{idx}行数据格式错误，跳过")
+                continue
+            row = [value.strip() for value in row]
+            username, phone_num, plate, vehicle_type = row
+            if not plate or not phone_num:
+                stats["rejected"] += 1
+                logger.warning(f"第{idx}行缺少车牌或手机号，跳过")
+                continue
+            too_long = [name for (name, limit), value in zip(self.VEHICLE_INFO_FIELD_LIMITS, row) if len(value) > limit]
+            if too_long:
+                stats["rejected"] += 1
+                logger.warning(f"第{idx}行字段超长({', '.join(too_long)})，跳过")
+                continue
+            yield format_copy_row((idx, username or None, phone_num, plate, vehicle_type or None))
+
+    @contextmanager
+    def _open_text_source(self, source):
+        """
+        以UTF-8文本方式打开CSV数据源
+        
+        :param source: 文件路径，或二进制文件对象（如上传流），后者不会被关闭
+        :return: 文本文件对象
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'r', encoding='utf-8', newline='') as f:
+                yield f
+            return
+        if isinstance(source, io.RawIOBase):
+            source = io.BufferedReader(source, buffer_size=self.copy_chunk_size)
+        text = io.TextIOWrapper(source, encoding='utf-8', newline='')
+        try:
+            yield text
+        finally:
+            text.detach()
+
+    @contextmanager
+    def _open_hashed_text_source(self, source):
+        """
+        以UTF-8文本方式打开CSV数据源，读取的同时计算内容摘要
+
+        :param source: 文件路径，或二进制文件对象（如解压后的上传流），后者不会被关闭
+        :return: (文本文件对象, HashingStream)
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as raw:
+                hashing = HashingStream(raw)
+                with self._open_text_source(hashing) as f:
+                    yield f, hashing
+            return
+        hashing = HashingStream(source)
+        with self._open_text_source(hashing) as f:
+            yield f, hashing
+
+    def _expected_content_hash(self, csv_file, content_hash: Optional[str]) -> Optional[str]:
+        """
+        确定导入前可用于查重的内容摘要：文件路径直接计算（只读文件，不写数据库），
+        上传流只能使用客户端提供的摘要
+
+        :param csv_file: CSV文件路径或二进制文件对象
+        :param content_hash: 客户端提供的内容摘要（可选）
+        :return: 内容摘要（小写十六进制），无法预先得到时返回None
+        """
+        if content_hash:
+            return content_hash.lower()
+        if isinstance(csv_file, (str, os.PathLike)):
+            with open(csv_file, 'rb') as raw:
+                hashing = HashingStream(raw)
+                hashing.drain(self.copy_chunk_size)
+            return hashing.hexdigest()
+        return None
+
+    def _check_ingest_duplicate(self, content_hash: Optional[str]) -> None:
+        """
+        在登记批次、写入数据之前拒绝已导入过的文件（需在 db_connection 中调用）
+
+        :param content_hash: 预先得到的内容摘要，None时跳过
+        :raises ValueError: 相同内容的文件已由仍有效的批次导入
+        """
+        if content_hash is None:
+            return
+        owner = self.postgresql_client.select_ingest_owner(content_hash)
+        if owner is not None:
+            raise ValueError(f"文件内容与批次 {owner} 相同，拒绝重复导入")
+
+    def _record_ingest_file(self, batch_id: int, filename: Optional[str], hashing: HashingStream,
+                            expected_hash: Optional[str] = None) -> str:
+        """
+        读完数据源并在导入文件登记表中登记内容摘要（需在 db_connection 中调用）
+
+        这是导入后的最终检查：没有预先得到摘要的上传流，以及与其它请求并发上传的相同文件，
+        在数据写入之后才能识别为重复，由调用方回滚整个事务
+
+        :param batch_id: 导入批次号
+        :param filename: 上传的文件名
+        :param hashing: 数据源的 HashingStream
+        :param expected_hash: 预先得到的内容摘要（可选），与实际内容不一致时拒绝
+        :return: 内容摘要
+        :raises ValueError: 相同内容的文件已由仍有效的批次导入，或内容与预先提供的摘要不一致
+        """
+        hashing.drain(self.copy_chunk_size)
+        content_hash = hashing.hexdigest()
+        if expected_hash is not None and expected_hash != content_hash:
+            raise ValueError(f"文件内容摘要 {content_hash} 与提供的摘要 {expected_hash} 不一致")
+        owner = self.postgresql_client.record_ingest_file(content_hash, batch_id, filename, hashing.bytes_read)
+        if owner != batch_id:
+            raise ValueError(f"文件内容与批次 {owner} 相同，拒绝重复导入")
+        return content_hash
 
-    def import_vehicle_info_from_csv(self, csv_file_path: str) -> int:
+    def import_vehicle_info_from_csv(self, csv_file) -> Dict[str, int]:
         """
         从CSV文件导入车辆信息数据
         
-        :param csv_file_path: CSV文件路径
-        :return: 导入的记录数
+        通过COPY将文件流式导入装载表，再用一条 INSERT ... ON CONFLICT (plate) DO UPDATE 合并到vehicle_info表
+        
+        :param csv_file: CSV文件路径或二进制文件对象（如上传流）
+        :return: 包含 inserted（新增）、updated（更新）、rejected（格式错误）和 duplicates（文件内重复车牌）的字典
         """
-        imported_count = 0
+        stats = {"rows": 0, "rejected": 0}
         try:
             with self.db_connection():
-                with open(csv_file_path, 'r', encoding='utf-8') as f:
+                client = self.postgresql_client
+                client.create_vehicle_info_load_table()
+                with self._open_text_source(csv_file) as f:
                     reader = csv.reader(f)
-                    next(reader)  # 跳过标题行
-                    for idx, row in enumerate(reader, start=1):
-                        try:
-                            if len(row) != 4:
-                                logger.warning(f"第{idx}行数据格式错误，跳过")
-                                continue
-                                
-                            username, phone_num, plate, vehicle_type = row
-                            
-                            # 使用字典形式插入数据，符合PostSQLClient的API
-                            data = {
-                                "username": username,
-                                "phone_num": phone_num,
-                                "plate": plate,
-                                "vehicle_type": vehicle_type
-                            }
-                            self.postgresql_client.insert(table="vehicle_info", data=data)
-                            imported_count += 1
-                        except Exception as e:
-                                logger.error(f"导入第{idx}行数据失败: {str(e)}")
-            return imported_count
+                    next(reader, None)  # 跳过标题行
+                    loaded_count = client.copy_into_vehicle_info_load(
+                        IteratorFile(self._iter_vehicle_info_rows(reader, stats)))
+                result = client.merge_vehicle_info_from_load()
+                changed_plates = client.select_table_plates(client.VEHICLE_INFO_LOAD_TABLE)
+                self._notify_vehicle_changes(changed_plates)
+                client.drop_table_if_exists(client.VEHICLE_INFO_LOAD_TABLE)
+            self._invalidate_vehicle_cache(changed_plates)
+            result["rejected"] = stats["rejected"]
+            result["duplicates"] = loaded_count - result["inserted"] - result["updated"]
+            logger.info(f"车辆信息导入完成 - 共 {stats['rows']} 行, 新增: {result['inserted']}, "
+                        f"更新: {result['updated']}, 拒绝: {result['rejected']}, 重复: {result['duplicates']}")
+            return result
         except Exception as e:
             raise IOError(f"导入车辆信息失败: {str(e)}")
 
-    def import_vehicle_trace_from_csv(self, csv_file_path: str) -> int:
+    def import_vehicle_trace_from_csv(self, csv_file, filename: Optional[str] = None,
+                                      content_hash: Optional[str] = None) -> Dict[str, Any]:
         """
         从CSV文件导入车辆轨迹数据到过滤表（使用数据库原生导入方式）
         
-        :param csv_file_path: CSV文件路径
-        :return: 导入到过滤表的记录数
+        每次导入登记为一个导入批次，数据保存在按批次区分的UNLOGGED过滤表中，
+        可在之后任意请求中确认执行或撤销
+        
+        :param csv_file: CSV文件路径或二进制文件对象（如上传流），数据按块流式送入COPY
+        :param filename: 上传的原始文件名（可选），用于批次登记
+        :param content_hash: 客户端提供的解压后内容 sha256 摘要（可选），用于导入前查重
+        :return: 包含 batch_id、imported_count（原始行数）和 filtered_count（过滤后行数）的字典
         """
+        batch = self.load_vehicle_trace(csv_file, filename, content_hash)
+        return self.filter_vehicle_trace_batch(batch["batch_id"])
+
+    def ingest_vehicle_trace_binary(self, csv_file, filename: Optional[str] = None,
+                                    content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        导入轨迹的二进制COPY方式：在客户端解析时间、校验车牌和标记号，
+        以二进制COPY把已是最终类型的行直接写入过滤表，不经过原始表和 TO_TIMESTAMP 转换
+
+        批次登记与数据写入在同一事务中完成，提交后即为 pending 状态，无需单独的过滤步骤。
+        与原流程的区别：标记号为空或格式错误的行被丢弃（计入 rejected_count）
+
+        重复文件的识别同 load_vehicle_trace
+
+        :param csv_file: CSV文件路径或二进制文件对象（如上传流）
+        :param filename: 上传的原始文件名（可选），用于批次登记
+        :param content_hash: 客户端提供的解压后内容 sha256 摘要（可选），用于导入前查重
+        :return: 包含 batch_id、imported_count（原始行数）、filtered_count（写入过滤表的行数）
+                 、rejected_count（标记号无效而丢弃的行数）和 content_hash（内容摘要）的字典
+        """
+        client = self.postgresql_client
+        if filename is None and isinstance(csv_file, (str, os.PathLike)):
+            filename = os.path.basename(csv_file)
         try:
+            expected_hash = self._expected_content_hash(csv_file, content_hash)
             with self.db_connection():
-                # 使用封装的方法创建并导入数据
-                self.postgresql_client.drop_table_if_exists("raw_table")
-                self.postgresql_client.create_raw_table()
+                self._expire_import_batches()
+                self._check_ingest_duplicate(expected_hash)
+
+                batch_id = client.register_import_batch(filename, self.import_batch_ttl_hours)
+                encoder = TraceRowEncoder(batch_id, client.select_vehicle_plates())
+                with self._open_hashed_text_source(csv_file) as (f, hashing):
+                    f.readline()  # 跳过表头行
+                    filtered_count = client.copy_into_filtered_binary(
+                        BytesIteratorFile(encoder.encode_lines(f)), size=self.copy_chunk_size)
+                    content_hash = self._record_ingest_file(batch_id, filename, hashing, expected_hash)
+                client.update_import_batch(batch_id, {"row_count": encoder.rows, "filtered_count": filtered_count})
+
+                logger.info(f"批次 {batch_id}: {encoder.rows} 条记录中 {filtered_count} 条写入过滤表"
+                            f"（车牌未登记 {encoder.unknown_plates} 条，标记号无效 {encoder.invalid_marks} 条）")
+                return {"batch_id": batch_id, "imported_count": encoder.rows, "filtered_count": filtered_count,
+                        "rejected_count": encoder.invalid_marks, "content_hash": content_hash}
+        except Exception as e:
+            raise IOError(f"导入车辆轨迹数据失败: {str(e)}")
+
+    def load_vehicle_trace(self, csv_file, filename: Optional[str] = None,
+                           content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        导入轨迹的第一步：登记导入批次（loading 状态），并将CSV数据COPY到该批次的原始表
+
+        重复文件的识别：文件路径先计算内容摘要，上传流使用客户端提供的摘要，在写入任何数据之前查重；
+        都没有时只能在COPY完成后由流式计算的摘要识别，此时整个导入事务回滚，但上传与COPY的开销已经发生
+        
+        :param csv_file: CSV文件路径或二进制文件对象（如上传流），数据按块流式送入COPY
+        :param filename: 上传的原始文件名（可选），用于批次登记
+        :param content_hash: 客户端提供的解压后内容 sha256 摘要（可选），用于导入前查重
+        :return: 包含 batch_id、imported_count（原始行数）和 content_hash（内容摘要）的字典
+        """
+        client = self.postgresql_client
+        if filename is None and isinstance(csv_file, (str, os.PathLike)):
+            filename = os.path.basename(csv_file)
+        try:
+            expected_hash = self._expected_content_hash(csv_file, content_hash)
+            with self.db_connection():
+                self._expire_import_batches()
+                self._check_ingest_duplicate(expected_hash)
+
+                # 登记导入批次，并创建该批次的原始表
+                batch_id = client.register_import_batch(filename, self.import_batch_ttl_hours, status='loading')
+                client.create_raw_table(batch_id)
                 
                 # 使用COPY命令将CSV数据导入到原始表
-                with open(csv_file_path, 'r', encoding='utf-8') as f:
+                with self._open_hashed_text_source(csv_file) as (f, hashing):
                     f.readline()  # 跳过表头行
-                    self.postgresql_client.copy_from(f, 'raw_table', sep=',', columns=['plate', 'pass_time', 'mark'])
-                
-                self.postgresql_client.drop_table_if_exists("filtered_table")
-                self.postgresql_client.create_filtered_table()
+                    imported_count = client.copy_from(f, client.raw_table_name(batch_id), sep=',',
+                                                      columns=['plate', 'pass_time', 'mark'],
+                                                      size=self.copy_chunk_size)
+                    # 预先查重未能识别的重复文件在此被拒绝，整个事务（批次登记与原始表）回滚
+                    content_hash = self._record_ingest_file(batch_id, filename, hashing, expected_hash)
+                client.update_import_batch(batch_id, {"row_count": imported_count})
                 
-                # 从原始表导入数据到过滤表（append模式），并过滤重复项
-                self.postgresql_client.import_from_raw_to_filtered()
+                logger.info(f"批次 {batch_id}: 成功导入 {imported_count} 条原始记录")
+                return {"batch_id": batch_id, "imported_count": imported_count, "content_hash": content_hash}
+        except Exception as e:
+            raise IOError(f"导入车辆轨迹数据失败: {str(e)}")
+
+    def filter_vehicle_trace_batch(self, batch_id: int, progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+        """
+        导入轨迹的第二步：将批次原始表中的数据过滤、转换后写入过滤表，批次转为 pending 状态
+        
+        :param batch_id: 导入批次号
+        :param progress: 进度回调（可选），参数为 (已处理行数, 总行数)
+        :return: 包含 batch_id、imported_count（原始行数）和 filtered_count（过滤后行数）的字典
+        :raises IOError: 批次不存在、状态不正确或过滤失败
+        """
+        client = self.postgresql_client
+        try:
+            with self.db_connection():
+                batch = client.lock_loading_batch(batch_id)
+                if batch is None:
+                    raise ValueError(f"批次 {batch_id} 不存在或不处于待过滤状态")
+                imported_count = batch["row_count"]
+                if progress:
+                    progress(0, imported_count)
                 
-                # 获取导入的记录数
-                result = self.postgresql_client.execute("SELECT COUNT(*) AS imported_count FROM raw_table")
-                imported_count = result[0]['imported_count'] if result else 0
+                # 按 ctid 数据块范围分段，从原始表导入数据到过滤表（重复记录在生成暂存表时去除），
+                # 每段结束后按已扫描的块数估算已处理的原始行数；最后一段不设上界，覆盖到表末尾
+                raw_table = client.raw_table_name(batch_id)
+                total_blocks = client.select_table_block_count(raw_table)
+                filtered_count = 0
+                for start_block in range(0, total_blocks, self.filter_chunk_blocks) or [0]:
+                    end_block = start_block + self.filter_chunk_blocks
+                    if end_block >= total_blocks:
+                        end_block = None
+                    filtered_count += client.import_from_raw_to_filtered(batch_id, start_block, end_block)
+                    if progress and end_block is not None:
+                        progress(imported_count * end_block // total_blocks, imported_count)
+                client.update_import_batch(batch_id, {"status": "pending", "filtered_count": filtered_count})
                 
-                logger.info(f"成功导入 {imported_count} 条记录到 filtered_table 表")
-                # 删除原始表，以便下次导入
-                self.postgresql_client.drop_table_if_exists("raw_table")
+                # 删除原始表
+                client.drop_table_if_exists(raw_table)
+                if progress:
+                    progress(imported_count, imported_count)
                 
-                return imported_count
+                logger.info(f"批次 {batch_id}: {imported_count} 条记录中 {filtered_count} 条写入过滤表")
+                return {"batch_id": batch_id, "imported_count": imported_count, "filtered_count": filtered_count}
         except Exception as e:
-            raise IOError(f"导入车辆轨迹数据失败: {str(e)}")
+            raise IOError(f"过滤车辆轨迹数据失败: {str(e)}")
+
+    def fail_import_batch(self, batch_id: int) -> None:
+        """
+        将处理失败的导入批次标记为 failed，并清理其数据
+        
+        :param batch_id: 导入批次号
+        """
+        with self.db_connection():
+            self.postgresql_client.finish_import_batches([batch_id], "failed")
+
+    def _expire_import_batches(self) -> None:
+        """
+        清理超过保留时间仍未确认的导入批次（需在 db_connection 中调用）
+        """
+        expired_ids = self.postgresql_client.expire_import_batches()
+        if expired_ids:
+            logger.info(f"已清理过期导入批次: {expired_ids}")
+
+    def list_import_batches(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询导入批次，查询前先清理过期批次
+        
+        :param status: 批次状态（可选）：pending / confirmed / discarded / expired
+        :return: 批次信息列表
+        """
+        with self.db_connection():
+            self._expire_import_batches()
+            return self.postgresql_client.list_import_batches(status)
+
+    def discard_import_batches(self, batch_ids: Optional[List[int]] = None) -> List[int]:
+        """
+        撤销待处理的导入批次，删除其过滤数据
+        
+        :param batch_ids: 批次号列表（可选），不传则撤销所有待处理批次
+        :return: 实际撤销的批次号列表
+        """
+        with self.db_connection():
+            discarded_ids = self.postgresql_client.lock_pending_batches(batch_ids)
+            self.postgresql_client.finish_import_batches(discarded_ids, "discarded")
+            self._notify_vehicle_changes(None)
+            logger.info(f"已撤销导入批次: {discarded_ids}")
+        self._clear_vehicle_cache()
+        return discarded_ids
 
-    def process_vehicle_data(self) -> bool:
+    def process_vehicle_data(self, batch_ids: Optional[List[int]] = None,
+                             progress: Optional[Callable[..., None]] = None) -> bool:
         """
-        处理过滤表中的数据，生成暂存表，并将数据添加到vehicle_record表
+        处理过滤表中待处理批次的数据，生成暂存表，并将数据添加到vehicle_record表
         
+        :param batch_ids: 批次号列表（可选），不传则处理所有待处理批次
+        :param progress: 进度回调（可选），参数为 (已处理车牌数, 车牌总数)
         :return: 处理成功返回True，失败返回False
         """
+        client = self.postgresql_client
         try:
+            # 分区的创建、挂载和卸载需要vehicle_record父表的排他锁，在单独的短事务中完成，
+            # 不在耗时的确认事务中持有该锁；之后新到批次中没有分区的记录先写入默认分区
             with self.db_connection():
+                self._expire_import_batches()
+                self._maintain_record_partitions(client.select_pending_batch_months(batch_ids))
+
+            with self.db_connection():
+                # 锁定待处理批次，避免并发重复处理
+                locked_ids = client.lock_pending_batches(batch_ids)
+                if not locked_ids:
+                    logger.warning("没有待处理的导入批次")
+                    return False
+                logger.info(f"开始处理导入批次: {locked_ids}")
+                
                 # 使用封装的方法创建并填充暂存表
-                self.postgresql_client.drop_table_if_exists("staging_table")
-                self.postgresql_client.create_and_populate_staging()
+                if self.processing_mode == 'incremental':
+                    late_count = client.create_and_populate_staging_incremental(locked_ids)
+                    logger.info(f"增量处理: {late_count} 条早于车辆水位线的记录写入迟到记录表")
+                else:
+                    client.create_and_populate_staging(locked_ids)
                 
                 # 从暂存表导入数据到vehicle_record表
-                self.postgresql_client.import_from_staging_to_vehicle_record()
+                inserted_count = client.import_from_staging_to_vehicle_record()
+                logger.info(f"写入通行记录 {inserted_count} 条（已存在的相同记录跳过）")
                 
                 # 处理暂存表数据，更新vehicle_info表
-                self._update_vehicle_info_from_staging()
+                self._update_vehicle_info_from_staging(progress)
                 
-                # 处理完成后删除临时表filtered_table和staging_table
-                self.postgresql_client.drop_table_if_exists("filtered_table")
-                self.postgresql_client.drop_table_if_exists("staging_table")
-                
-                return True
+                # 处理完成后标记批次已确认、清理其过滤数据并删除暂存表
+                changed_plates = client.select_table_plates(client.STAGING_TABLE)
+                self._notify_vehicle_changes(changed_plates)
+                client.finish_import_batches(locked_ids, "confirmed")
+                client.drop_table_if_exists(client.STAGING_TABLE)
+            
+            # 事务提交后失效本批次涉及车牌的查询缓存
+            self._invalidate_vehicle_cache(changed_plates)
+            return True
         except Exception as e:
             logger.error(f"处理车辆数据失败: {str(e)}")
             return False
 
-    def _process_single_plate(self, plate: str, records: List[Dict[str, Any]]) -> bool:
+    def _maintain_record_partitions(self, months: Optional[List[datetime.date]] = None) -> Dict[str, List[str]]:
+        """
+        在当前事务中维护vehicle_record的月分区（调用方应使用单独的短事务，分区DDL会持有父表的排他锁直到事务结束）：创建指定月份以及当前月起 premake_months 个月的分区，
+        卸载超过保留月数的分区。vehicle_record 尚未迁移为分区表时不做任何操作
+
+        :param months: 需要确保存在分区的月份（可选），如暂存数据涉及的月份
+        :return: 包含 created（新建的分区）和 detached（卸载的分区）的字典
+        """
+        client = self.postgresql_client
+        result = {"created": [], "detached": []}
+        if not client.is_vehicle_record_partitioned():
+            return result
+
+        current = datetime.date.today().replace(day=1)
+        wanted = {month.replace(day=1) for month in months or ()}
+        wanted.update(client.add_months(current, offset) for offset in range(self.partition_premake_months + 1))
+        if self.partition_retention_months is not None:
+            oldest = client.add_months(current, -self.partition_retention_months)
+            wanted = {month for month in wanted if month >= oldest}
+        for month in sorted(wanted):
+            if client.create_vehicle_record_partition(month):
+                result["created"].append(client.vehicle_record_partition_name(month))
+
+        if self.partition_retention_months is not None:
+            for month in client.list_vehicle_record_partitions():
+                if month < oldest:
+                    result["detached"].append(
+                        client.detach_vehicle_record_partition(month, self.partition_archive_schema))
+        if result["created"] or result["detached"]:
+            logger.info(f"vehicle_record分区维护 - 新建: {result['created']}, 卸载: {result['detached']}")
+        return result
+
+    def maintain_record_partitions(self) -> Dict[str, List[str]]:
         """
-        处理单个车牌的记录，更新vehicle_info表
+        维护vehicle_record的月分区（可由定时任务调用）：提前创建未来月份的分区，卸载并归档过期分区
+
+        :return: 包含 created（新建的分区）和 detached（卸载的分区）的字典
+        """
+        with self.db_connection():
+            return self._maintain_record_partitions()
+
+    def reconcile_late_arrivals(self) -> Dict[str, int]:
+        """
+        对账处理迟到记录：将增量处理中早于车辆水位线的记录补入vehicle_record表
+
+        与整批重放的语义一致：早于 last_record_time 的记录只保存为通行记录，不参与里程计算，
+        因此vehicle_info不变，不需要失效查询缓存
+
+        :return: 包含 taken（处理的迟到记录数）和 inserted（补入vehicle_record的记录数）的字典
+        """
+        client = self.postgresql_client
+        with self.db_connection():
+            self._maintain_record_partitions(client.select_late_arrival_months())
+        with self.db_connection():
+            result = client.move_late_arrivals_to_vehicle_record()
+        logger.info(f"迟到记录对账完成 - 处理: {result['taken']}, 补入通行记录: {result['inserted']}")
+        return result
+
+    def _process_single_plate(self, plate: str, records: List[Dict[str, Any]],
+                              vehicle_info: Dict[str, Any]) -> tuple:
+        """
+        计算单个车牌处理后的状态，结果由调用方批量写回vehicle_info表
         
         :param plate: 车牌号
         :param records: 该车牌的所有记录
-        :return: 处理成功返回True，失败返回False
+        :param vehicle_info: 预先查询的车辆当前状态（last_record、last_record_time、mileage、bonus）
+        :return: (plate, last_record, last_record_time, mileage, points) 元组
+        :raises ValueError: 当记录中的标记号不在标准路径中时
         """
-        try:
-            # 为每个线程创建独立的数据库连接
-            thread_local = threading.local()
-            if not hasattr(thread_local, 'db_client'):
-                thread_local.db_client = PostSQLClient(
-                    self.postgresql_client.conn_params["host"], 
-                    self.postgresql_client.conn_params["port"], 
-                    self.postgresql_client.conn_params["user"], 
-                    self.postgresql_client.conn_params["password"], 
-                    self.postgresql_client.conn_params["database"]
-                )
-                thread_local.db_client.connect()
-            
-            db_client = thread_local.db_client
-            
-            logger.info(f"处理车牌: {plate}")
-            # 查询vehicle_info表中的当前记录
-            vehicle_info = db_client.select(
-                "vehicle_info",
-                ["last_record", "last_record_time", "mileage", "bonus"],
-                where="plate = %s",
-                params=(plate,)
-            )
-
-            if not vehicle_info:
-                # 如果车辆信息不存在，跳过处理
-                logger.warning(f"车牌 {plate} 的车辆信息不存在，跳过处理")
-                return True
-
-            last_record = vehicle_info[0]["last_record"]
-            last_record_time = vehicle_info[0]["last_record_time"]
-            mileage = vehicle_info[0]["mileage"]
-            bonus = vehicle_info[0]["bonus"]
-
-            logger.debug(f"车牌 {plate} 的初始信息 - last_record: {last_record}, last_record_time: {last_record_time}, mileage: {mileage}")
-
-            for i, record in enumerate(records):
-                mark = record['mark']
-                pass_time = record['pass_time']
-                
-                if last_record_time is not None and pass_time < last_record_time:
-                    # 如果当前记录的时间早于上一条记录的时间，跳过处理
-                    logger.debug(f"记录 {i+1}/{len(records)} - mark: {mark}, pass_time: {pass_time} 早于上一条记录的时间 {last_record_time}，跳过处理")
-                    continue
+        logger.debug(f"处理车牌: {plate}")
 
-                logger.debug(f"处理记录 {i+1}/{len(records)} - mark: {mark}, pass_time: {pass_time}, last_record: {last_record}")
-                
-                # 只有当mark和last_record都不是None时才计算里程差
-                if mark is not None and last_record is not None:
-                    logger.debug(f"mark和last_record都不为None，调用is_continuous方法")
-                    if self.is_continuous(mark, last_record):
-                        logger.debug(f"记录连续，计算里程差")
-                        # 将float类型的里程差转换为Decimal类型，与数据库中的mileage字段类型匹配
-                        diff = mileage_diff(mark, last_record)
-                        mileage += diff
-                
-                last_record = mark
-                last_record_time = pass_time
-
-            points = mileage * bonus
-            db_client.update(
-                "vehicle_info",
-                {
-                    "last_record": last_record,
-                    "last_record_time": last_record_time,
-                    "mileage": mileage,
-                    "points": points
-                },
-                where="plate = %s",
-                params=(plate,)
-            )
-            
-            return True
-        except Exception as e:
-            import traceback
-            logger.error(f"处理车牌 {plate} 失败: {str(e)}")
-            logger.error(f"异常类型: {type(e).__name__}")
-            logger.error(f"异常堆栈: {traceback.format_exc()}")
-            return False
-        finally:
-            # 线程结束时关闭数据库连接
-            thread_local = threading.local()
-            if hasattr(thread_local, 'db_client'):
-                thread_local.db_client.close()
-                delattr(thread_local, 'db_client')
+        last_record = vehicle_info["last_record"]
+        last_record_time = vehicle_info["last_record_time"]
+        mileage = vehicle_info["mileage"]
+        bonus = vehicle_info["bonus"]
+
+        logger.debug(f"车牌 {plate} 的初始信息 - last_record: {last_record}, last_record_time: {last_record_time}, mileage: {mileage}")
 
-    def _update_vehicle_info_from_staging(self) -> None:
+        last_record, last_record_time, mileage = advance_plate_state(
+            self.mark_catalog, last_record, last_record_time, mileage,
+            [self.mark_catalog.intern(record["mark"]) for record in records],
+            [record["pass_time"] for record in records]
+        )
+        return (plate, last_record, last_record_time, mileage, mileage * bonus)
+
+    def _process_plate_chunk(self, chunk: List[tuple]) -> List[tuple]:
+        """
+        在线程池中依次处理一组车牌
+        
+        :param chunk: (plate, records, vehicle_info) 列表
+        :return: (plate, 状态元组, 错误信息) 列表，处理失败时状态元组为None
+        """
+        results = []
+        for plate, records, vehicle_info in chunk:
+            try:
+                results.append((plate, self._process_single_plate(plate, records, vehicle_info), None))
+            except Exception as e:
+                import traceback
+                logger.debug(f"异常堆栈: {traceback.format_exc()}")
+                results.append((plate, None, f"{type(e).__name__}: {str(e)}"))
+        return results
+
+    def _flush_vehicle_info_states(self, states: List[tuple]) -> int:
+        """
+        将累积的车辆状态一次性写回vehicle_info表（需在 db_connection 中调用）
+        
+        :param states: (plate, last_record, last_record_time, mileage, points) 元组列表
+        :return: 更新的车辆数
+        """
+        if not states:
+            return 0
+        updated_count = self.postgresql_client.update_vehicle_info_states(states)
+        logger.info(f"批量写回车辆状态: {updated_count} 辆")
+        return updated_count
+
+    def _update_vehicle_info_set_based(self, progress: Optional[Callable[..., None]] = None) -> None:
+        """
+        在数据库内以集合方式计算连续性与里程差，并用一条 UPDATE 更新vehicle_info表
+        
+        :param progress: 进度回调（可选），单条语句完成后一次性汇报
+        :return: None
+        """
+        self.postgresql_client.create_mark_lookup(self.mark_lookup_entries())
+        result = self.postgresql_client.update_vehicle_info_set_based()
+        self.postgresql_client.drop_table_if_exists(self.postgresql_client.MARK_LOOKUP_TABLE)
+        updated_count = result["updated"]
+        for plate in result["failed"]:
+            logger.error(f"处理车牌 {plate} 失败: 存在不在标准路径中的标记号或里程/积分倍数为空")
+        if progress:
+            progress(updated_count + len(result["failed"]), updated_count + len(result["failed"]))
+        logger.info(f"集合式处理完成 - 成功: {updated_count}, 失败: {len(result['failed'])}")
+
+    def _update_vehicle_info_vectorized(self, progress: Optional[Callable[..., None]] = None) -> None:
+        """
+        将暂存表整批读入列式数组，用 NumPy 计算所有车牌的里程后批量写回vehicle_info表
+        
+        :param progress: 进度回调（可选），计算完成后一次性汇报
+        :return: None
+        """
+        client = self.postgresql_client
+        started_at = time.monotonic()
+        states = client.select_staging_vehicle_states()
+        columns = client.fetch_staging_columns()
+        loaded_at = time.monotonic()
+        
+        computed = compute_vehicle_states(self.mark_catalog, states, columns["vehicle_id"], columns["mark_code"],
+                                          columns["marks"], columns["pass_time_us"], columns["seq"])
+        computed_at = time.monotonic()
+        
+        results = [tuple(result) for result in computed["results"]]
+        updated_count = 0
+        for start in range(0, len(results), self.vehicle_info_flush_size):
+            updated_count += self._flush_vehicle_info_states(results[start:start + self.vehicle_info_flush_size])
+        for plate in computed["failed"]:
+            logger.error(f"处理车牌 {plate} 失败: 存在不在标准路径中的标记号或里程/积分倍数为空")
+        if progress:
+            progress(len(states), len(states))
+        logger.info(f"列式处理完成 - 记录数: {len(columns['vehicle_id'])}, 成功: {updated_count}, "
+                    f"失败: {len(computed['failed'])}, 读取 {loaded_at - started_at:.2f}s, "
+                    f"计算 {computed_at - loaded_at:.2f}s, 写回 {time.monotonic() - computed_at:.2f}s")
+
+    def _update_vehicle_info_from_staging(self, progress: Optional[Callable[..., None]] = None) -> None:
         """
         根据暂存表中的数据更新vehicle_info表的last_record、mileage和points字段
-        使用线程池并行处理多个车牌
+        按 business.mileage_engine 配置选择引擎，python / process 引擎分别使用线程池 / 进程池并行处理多个车牌
         
+        :param progress: 进度回调（可选），参数为 (已处理车牌数, 车牌总数)
         :return: None
         """
+        if self.mileage_engine == 'sql':
+            self._update_vehicle_info_set_based(progress)
+            return
+        if self.mileage_engine == 'numpy':
+            self._update_vehicle_info_vectorized(progress)
+            return
+
         try:
-            # 查询暂存表中的所有记录，按车牌和时间排序
-            staging_data = self.postgresql_client.select(
-                "staging_table",
-                ["plate", "mark", "pass_time"],
-                order_by="plate, pass_time"
-            )
-            logger.debug(f"staging_data: {staging_data}")
+            # 一次查询出暂存表中所有车牌的当前状态，没有车辆信息的车牌跳过
+            vehicle_states = {state["plate"]: state for state in self.postgresql_client.select_staging_vehicle_states()}
+            if not vehicle_states:
+                return
             
-            # 按车牌分组处理数据
-            plate_groups = defaultdict(list)
-            for record in staging_data:
-                plate = record['plate']
-                plate_groups[plate].append(record)
+            logger.info(f"开始并行处理 {len(vehicle_states)} 个车牌的数据")
+            if self.mileage_engine == 'process':
+                # 常驻进程池：每个任务携带一组车牌的紧凑数据，只返回最终状态
+                max_workers = self.process_workers
+                executor = get_process_pool(max_workers, self.standard_path)
+                chunk_size = self.process_chunk_size
+                logger.info(f"使用 {max_workers} 个进程进行并行处理")
+            else:
+                # 根据系统CPU核心数和配置的倍数设置线程池大小（工作线程不访问数据库）
+                max_workers = min(len(vehicle_states), os.cpu_count() * self.max_threads_multiplier)
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+                chunk_size = 1
+                logger.info(f"使用 {max_workers} 个线程进行并行处理")
             
-            # 使用线程池并行处理所有车牌
-            logger.info(f"开始并行处理 {len(plate_groups)} 个车牌的数据")
+            counts = {"success": 0, "failure": 0}
+            pending_states = []
             
-            # 根据系统CPU核心数和配置的倍数设置线程池大小
-            max_workers = min(len(plate_groups), os.cpu_count() * self.max_threads_multiplier)
-            logger.info(f"使用 {max_workers} 个线程进行并行处理")
+            def collect(future) -> None:
+                # 收集一个任务的结果，累积到 flush_size 条后批量写回
+                for plate, state, error in future.result():
+                    if state is not None:
+                        pending_states.append(state)
+                        counts["success"] += 1
+                    else:
+                        logger.error(f"处理车牌 {plate} 时发生异常: {error}")
+                        counts["failure"] += 1
+                if len(pending_states) >= self.vehicle_info_flush_size:
+                    self._flush_vehicle_info_states(pending_states)
+                    pending_states.clear()
+                if progress:
+                    progress(counts["success"] + counts["failure"], len(vehicle_states))
             
-            success_count = 0
-            failure_count = 0
+            def submit(chunk: List[tuple]):
+                if self.mileage_engine == 'process':
+                    return executor.submit(process_plate_chunk, chunk)
+                return executor.submit(self._process_plate_chunk, chunk)
             
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有任务
-                future_to_plate = {
-                    executor.submit(self._process_single_plate, plate, records): plate
-                    for plate, records in plate_groups.items()
-                }
+            # 服务端游标按车牌顺序流式读取暂存表，每次只持有一个车牌的记录；
+            # 同时在途的任务数有上限，内存占用与当天总数据量无关
+            max_in_flight = max_workers * 4
+            in_flight = set()
+            chunk = []
+            try:
+                staging_rows = self.postgresql_client.iter_staging_rows(self.staging_itersize)
+                for plate, group in groupby(staging_rows, key=itemgetter("plate")):
+                    if plate not in vehicle_states:
+                        logger.warning(f"车牌 {plate} 的车辆信息不存在，跳过处理")
+                        continue
+                    records = list(group)
+                    if self.mileage_engine == 'process':
+                        chunk.append(pack_plate(plate, vehicle_states[plate], records))
+                    else:
+                        chunk.append((plate, records, vehicle_states[plate]))
+                    if len(chunk) < chunk_size:
+                        continue
+                    if len(in_flight) >= max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future)
+                    in_flight.add(submit(chunk))
+                    chunk = []
+                if chunk:
+                    in_flight.add(submit(chunk))
                 
-                # 处理任务结果
-                for future in as_completed(future_to_plate):
-                    plate = future_to_plate[future]
-                    try:
-                        result = future.result()
-                        if result:
-                            success_count += 1
-                        else:
-                            failure_count += 1
-                    except Exception as e:
-                        import traceback
-                        logger.error(f"处理车牌 {plate} 时发生异常: {str(e)}")
-                        logger.error(f"异常类型: {type(e).__name__}")
-                        logger.error(f"异常堆栈: {traceback.format_exc()}")
-                        failure_count += 1
+                for future in as_completed(in_flight):
+                    collect(future)
+            finally:
+                # 进程池常驻复用，线程池随本次处理结束
+                if self.mileage_engine != 'process':
+                    executor.shutdown(wait=True)
+            self._flush_vehicle_info_states(pending_states)
             
-            logger.info(f"并行处理完成 - 成功: {success_count}, 失败: {failure_count}")
+            logger.info(f"并行处理完成 - 成功: {counts['success']}, 失败: {counts['failure']}")
 
         except Exception as e:
             import traceback
@@ -399,23 +922,108 @@ class VehicleDataProcessor:
             logger.error(f"异常堆栈: {traceback.format_exc()}")
             raise
 
+    def query_vehicle_passes(self, plate: str, start: datetime.datetime, end: datetime.datetime,
+                             after: Optional[tuple] = None, limit: int = 100) -> Dict[str, Any]:
+        """
+        分页查询某车牌在时间范围内的通行记录，按 (pass_time, id) 升序
+
+        :param plate: 车牌号
+        :param start: 起始时间（包含）
+        :param end: 结束时间（不包含）
+        :param after: 上一页返回的 next 位置 (pass_time, id)（可选）
+        :param limit: 每页记录数
+        :return: 包含 passes（记录列表）和 next（下一页起点，没有更多记录时为None）的字典
+        """
+        with self.db_connection():
+            passes = self.postgresql_client.select_vehicle_passes(plate, start, end, after, limit + 1)
+        has_more = len(passes) > limit
+        passes = passes[:limit]
+        return {
+            "passes": passes,
+            "next": (passes[-1]["pass_time"], passes[-1]["id"]) if has_more else None
+        }
+
+    # 车辆状态查询返回的字段
+    VEHICLE_QUERY_COLUMNS = ["plate", "username", "phone_num", "vehicle_type", "bonus", "points", "mileage",
+                             "last_record", "last_record_time"]
+
+    def query_vehicles_batch(self, plates: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量查询多个车牌的最新状态，所有车牌在一条查询中完成
+
+        :param plates: 车牌号列表
+        :return: 车牌号 -> 车辆综合信息的字典，不存在的车牌不在其中
+        """
+        with self.db_connection():
+            rows = self.postgresql_client.select_vehicles_by_plates(plates, self.VEHICLE_QUERY_COLUMNS)
+        return {row["plate"]: row for row in rows}
+
+    def _notify_vehicle_changes(self, plates: Optional[List[str]]) -> None:
+        """
+        在当前事务中通知其它工作进程失效车辆状态缓存，事务提交后送达
+
+        :param plates: 变更的车牌列表，None 表示全部失效
+        """
+        if not self.cache_notify_channel:
+            return
+        if plates is not None and len(plates) > self.cache_notify_max_plates:
+            plates = None
+        self.postgresql_client.notify_plates(self.cache_notify_channel, plates)
+
+    def start_cache_listener(self):
+        """
+        为当前工作进程启动车辆状态变更监听线程（每个进程一个，使用独立连接）
+
+        :return: 监听器，未启用缓存或未配置通知通道时返回None
+        """
+        if self.vehicle_cache is None or not self.cache_notify_channel:
+            return None
+        return start_cache_listener(self.postgresql_client.conn_params, self.cache_notify_channel, self.vehicle_cache)
+
+    def _invalidate_vehicle_cache(self, plates: List[str]) -> None:
+        """
+        失效指定车牌的查询缓存
+        """
+        if self.vehicle_cache is not None:
+            removed = self.vehicle_cache.invalidate(plates)
+            logger.info(f"车辆状态缓存失效: {len(plates)} 个车牌, 移除 {removed} 条")
+
+    def _clear_vehicle_cache(self) -> None:
+        """
+        清空查询缓存
+        """
+        if self.vehicle_cache is not None:
+            self.vehicle_cache.clear()
+            logger.info("车辆状态缓存已清空")
+
     def query_vehicles(self, plate: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         联结vehicle_trace与vehicle_info表，查询车辆最新状态
         
+        按车牌查询时优先使用进程内缓存（查询不到的车牌也会缓存空结果）
+        
         :param plate: 车牌号（可选），不传则查询所有
         :return: 包含车辆综合信息的列表
         """
+        cache = self.vehicle_cache if plate else None
+        if cache is not None:
+            cached = cache.get(plate)
+            if cached is not None:
+                return [dict(row) for row in cached]
+            version = cache.version
         try:
             with self.db_connection():
                 # 构建完整的SQL查询
 
-                return self.postgresql_client.select(
+                vehicles = self.postgresql_client.select(
                     "vehicle_info",
-                    ["plate", "username", "phone_num", "vehicle_type", "bonus", "points", "mileage", "last_record", "last_record_time"],
+                    self.VEHICLE_QUERY_COLUMNS,
                     where="plate = %s" if plate else None,
                     params=(plate,) if plate else None
                 )
         except Exception as e:
             logger.error(f"查询车辆信息失败: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+        if cache is not None:
+            cache.put(plate, [dict(row) for row in vehicles], version)
+        return vehicles
\ No newline at end of file
@@ -0,0 +1,126 @@
+import re
+import struct
+import datetime
+from typing import Collection, Dict, Iterable, Iterator, Optional
+
+from database.copy_stream import BINARY_COPY_HEADER, BINARY_COPY_TRAILER
+from summarize.mark_catalog import MARK_PATTERN
+
+# 通行时间格式，与 TO_TIMESTAMP(pass_time, 'YYYY/MM/DD HH24:MI') 的解析方式一致：
+# 每个字段取连续的全部数字（月、日、时、分可以不补零），字段之间最多一个任意的非字母数字分隔符，
+# 分隔符前后的空白被忽略；时、分可以省略，分之后的内容（如秒）被忽略。
+# TO_TIMESTAMP 还接受缺少月、日或月、日为0等写法，这里按格式错误处理：只会比原流程更严格，不会解析出不同的时间
+_FIELD_SEPARATOR = r"\s*(?:[^0-9A-Za-z\s]\s*)?"
+_FIELD = r"([0-9]+)(?![0-9])"
+_END = r"(?=\s*[^0-9A-Za-z\s]?\Z)"
+PASS_TIME_PATTERN = re.compile(
+    r"\s*" + _FIELD + _FIELD_SEPARATOR + _FIELD + _FIELD_SEPARATOR + _FIELD
+    + r"(?:" + _FIELD_SEPARATOR + _FIELD + r"(?:" + _FIELD_SEPARATOR + _FIELD + r"|" + _END + r")|" + _END + r")"
+)
+
+_PG_EPOCH = datetime.datetime(2000, 1, 1)
+_TIMESTAMP_FIELD = struct.Struct('!iq')
+_INTEGER_FIELD = struct.Struct('!hii')
+_LENGTH = struct.Struct('!i')
+
+
+def parse_pass_time(value: str) -> datetime.datetime:
+    """
+    解析轨迹CSV中的通行时间
+
+    :param value: 通行时间，格式为 "2024/05/01 08:05"
+    :return: 时间
+    :raises ValueError: 当时间格式错误或超出范围时
+    """
+    match = PASS_TIME_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"通行时间格式错误：{value}（应为 YYYY/MM/DD HH24:MI 格式）")
+    year, month, day, hour, minute = (int(part) if part else 0 for part in match.groups())
+    try:
+        return datetime.datetime(year, month, day, hour, minute)
+    except ValueError:
+        raise ValueError(f"通行时间超出范围：{value}")
+
+
+class TraceRowEncoder:
+    """
+    在客户端把轨迹CSV行校验并编码为过滤表 (batch_id, plate, pass_time, mark) 的二进制COPY数据
+
+    与原始表 + INSERT ... SELECT 的流程相比：时间在客户端解析，不在vehicle_info中的车牌
+    以及格式错误的标记号在客户端丢弃，数据库收到的已是最终类型的行。
+    同一车牌、时间、标记号的编码结果按原始字符串缓存，每行只需三次字典查找
+    """
+
+    def __init__(self, batch_id: int, known_plates: Collection[str]):
+        """
+        :param batch_id: 导入批次号
+        :param known_plates: vehicle_info 中已登记的车牌
+        """
+        self._row_prefix = _INTEGER_FIELD.pack(4, 4, batch_id)
+        self._known_plates = known_plates
+        self._plates: Dict[str, Optional[bytes]] = {}
+        self._times: Dict[str, bytes] = {}
+        self._marks: Dict[str, Optional[bytes]] = {}
+        self.rows = 0             # CSV 数据行数（不含表头）
+        self.written = 0          # 写入过滤表的行数
+        self.unknown_plates = 0   # 车牌不在vehicle_info中而丢弃的行数
+        self.invalid_marks = 0    # 标记号为空或格式错误而丢弃的行数
+
+    @staticmethod
+    def _encode_text(value: str) -> bytes:
+        data = value.encode('utf-8')
+        return _LENGTH.pack(len(data)) + data
+
+    def _encode_plate(self, plate: str) -> Optional[bytes]:
+        field = self._encode_text(plate) if plate in self._known_plates else None
+        self._plates[plate] = field
+        return field
+
+    def _encode_time(self, pass_time: str) -> bytes:
+        value = (parse_pass_time(pass_time) - _PG_EPOCH) // datetime.timedelta(microseconds=1)
+        field = self._times[pass_time] = _TIMESTAMP_FIELD.pack(8, value)
+        return field
+
+    def _encode_mark(self, mark: str) -> Optional[bytes]:
+        field = self._encode_text(mark) if MARK_PATTERN.match(mark) else None
+        self._marks[mark] = field
+        return field
+
+    def encode_lines(self, lines: Iterable[str]) -> Iterator[bytes]:
+        """
+        编码CSV数据行（不含表头），按行产生二进制COPY数据（含文件头和结束标记）
+
+        :param lines: CSV文本行，字段为 plate,pass_time,mark，与原始表COPY的分隔方式一致
+        :raises ValueError: 当某行字段数不为3或通行时间无法解析时（整个导入失败，与原流程一致）
+        """
+        plates, times, marks = self._plates, self._times, self._marks
+        row_prefix = self._row_prefix
+        yield BINARY_COPY_HEADER
+        for line_no, line in enumerate(lines, start=2):
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            self.rows += 1
+            fields = line.split(',')
+            if len(fields) != 3:
+                raise ValueError(f"第 {line_no} 行字段数错误：应为3列（plate,pass_time,mark），实际 {len(fields)} 列")
+            plate, pass_time, mark = fields
+
+            plate_field = plates[plate] if plate in plates else self._encode_plate(plate)
+            if plate_field is None:
+                self.unknown_plates += 1
+                continue
+            mark_field = marks[mark] if mark in marks else self._encode_mark(mark)
+            if mark_field is None:
+                self.invalid_marks += 1
+                continue
+            time_field = times.get(pass_time)
+            if time_field is None:
+                try:
+                    time_field = self._encode_time(pass_time)
+                except ValueError as e:
+                    raise ValueError(f"第 {line_no} 行{str(e)}")
+
+            self.written += 1
+            yield row_prefix + plate_field + time_field + mark_field
+        yield BINARY_COPY_TRAILER
@@ -0,0 +1,386 @@
+import io
+import zlib
+import hashlib
+import struct
+import logging
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，仅解压 .zst 上传文件时需要
+    zstandard = None
+
+from werkzeug.sansio.multipart import MultipartDecoder, NEED_DATA, Data, Epilogue, File
+
+# 获取或创建logger
+logger = logging.getLogger(__name__)
+
+
+class UploadStreamError(ValueError):
+    """
+    上传请求体格式错误或未包含指定的文件字段
+    """
+    pass
+
+
+class MultipartFileStream(io.RawIOBase):
+    """
+    从 multipart/form-data 请求体中流式读取单个文件字段
+
+    请求体按 chunk_size 分块解析，文件内容不落盘、不整体载入内存，
+    可直接交给 TextIOWrapper / cursor.copy_expert 读取
+    """
+
+    def __init__(self, stream, boundary: bytes, field_name: str, chunk_size: int = 1024 * 1024):
+        """
+        :param stream: 原始请求体流（如 request.stream）
+        :param boundary: multipart 分隔符
+        :param field_name: 要读取的文件字段名
+        :param chunk_size: 每次从请求体读取的字节数
+        :raises UploadStreamError: 请求体中没有该文件字段
+        """
+        super().__init__()
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary)
+        self._chunk_size = chunk_size
+        self._eof = False
+        self._pending = b''
+        self._part_done = False
+        self.filename: Optional[str] = None
+        self.bytes_read = 0
+        self._seek_file(field_name)
+
+    def _next_event(self):
+        """
+        获取下一个解析事件，需要数据时从请求体读取一块
+        """
+        while True:
+            try:
+                event = self._decoder.next_event()
+            except ValueError as e:
+                # 请求体在文件字段结束前就已读完时，解析器报 "cannot parse beyond"
+                raise UploadStreamError(f"上传数据不完整: {str(e)}")
+            if event is not NEED_DATA:
+                return event
+            if self._eof:
+                raise UploadStreamError("上传数据不完整")
+            data = self._stream.read(self._chunk_size)
+            # 数据恰好止于分隔符之后的 "-" 或空白时，MultipartDecoder 会把分隔符前的 \r 当作文件内容输出，
+            # 补读到不以这些字符结尾为止
+            while data[-1:] in (b'-', b' ', b'\t'):
+                more = self._stream.read(1)
+                if not more:
+                    break
+                data += more
+            if data:
+                self._decoder.receive_data(data)
+            else:
+                self._eof = True
+                self._decoder.receive_data(None)
+
+    def _seek_file(self, field_name: str) -> None:
+        """
+        跳过其它字段，定位到指定文件字段的开头
+        """
+        while True:
+            event = self._next_event()
+            if isinstance(event, File) and event.name == field_name:
+                self.filename = event.filename
+                return
+            if isinstance(event, Epilogue):
+                raise UploadStreamError(f"请求中没有文件字段: {field_name}")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        """
+        读取文件内容到缓冲区，文件字段结束时返回0
+        """
+        while not self._pending and not self._part_done:
+            event = self._next_event()
+            if isinstance(event, Data):
+                self._pending = event.data
+                self._part_done = not event.more_data
+            else:
+                self._part_done = True
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self.bytes_read += size
+        return size
+
+    def close(self) -> None:
+        """
+        读取并丢弃请求体剩余部分后关闭
+        """
+        if not self.closed:
+            try:
+                while not self._eof and self._stream.read(self._chunk_size):
+                    pass
+            except Exception as e:
+                logger.warning(f"丢弃剩余请求体时出错: {str(e)}")
+        super().close()
+
+
+class _DecompressingStream(io.RawIOBase):
+    """
+    增量解压的只读流基类：每次最多从源读取 chunk_size 字节，最多输出 chunk_size 字节
+    """
+
+    def __init__(self, raw, chunk_size: int = 1024 * 1024):
+        super().__init__()
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._input = b''
+        self._pending = b''
+        self._raw_eof = False
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _step(self) -> bytes:
+        """
+        消费 self._input 中的部分数据并返回解压结果，由子类实现
+        """
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        """
+        源数据读取完毕时的完整性检查，由子类实现
+        """
+
+    def readinto(self, buffer) -> int:
+        while not self._pending and not self._done:
+            if not self._input:
+                if self._raw_eof:
+                    self._finish()
+                    self._done = True
+                    break
+                self._input = self._raw.read(self._chunk_size)
+                if not self._input:
+                    self._raw_eof = True
+                    continue
+            self._pending = self._step()
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class GzipStream(_DecompressingStream):
+    """
+    增量解压 gzip 数据，支持多成员（拼接）的 gzip 文件
+    """
+
+    def __init__(self, raw, chunk_size: int = 1024 * 1024):
+        super().__init__(raw, chunk_size)
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._member_started = False
+
+    def _step(self) -> bytes:
+        if self._decompressor.eof:
+            # 上一个成员已结束，跳过尾部填充后开始下一个成员
+            self._input = self._input.lstrip(b'\x00')
+            if not self._input:
+                return b''
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._member_started = True
+        try:
+            data = self._decompressor.decompress(self._input, self._chunk_size)
+        except zlib.error as e:
+            raise UploadStreamError(f"gzip数据损坏: {str(e)}")
+        if self._decompressor.eof:
+            self._input = self._decompressor.unused_data
+        else:
+            self._input = self._decompressor.unconsumed_tail
+        return data
+
+    def _finish(self) -> None:
+        if self._member_started and not self._decompressor.eof:
+            raise UploadStreamError("gzip数据不完整")
+
+
+class ZipEntryStream(_DecompressingStream):
+    """
+    从 zip 文件开头的本地文件头流式解压唯一的一个条目，不依赖文件末尾的中央目录
+    """
+
+    LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+    LOCAL_SIGNATURE = 0x04034b50
+    DESCRIPTOR_SIGNATURE = 0x08074b50
+    FLAG_ENCRYPTED = 0x01
+    FLAG_DATA_DESCRIPTOR = 0x08
+
+    def __init__(self, raw, chunk_size: int = 1024 * 1024):
+        super().__init__(raw, chunk_size)
+        header = self._read_exact(self.LOCAL_HEADER.size)
+        (signature, _, flags, method, _, _, crc, compressed_size, _,
+         name_length, extra_length) = self.LOCAL_HEADER.unpack(header)
+        if signature != self.LOCAL_SIGNATURE:
+            raise UploadStreamError("不是有效的zip文件")
+        if flags & self.FLAG_ENCRYPTED:
+            raise UploadStreamError("不支持加密的zip文件")
+        self.entry_name = self._read_exact(name_length).decode('utf-8', errors='replace')
+        self._read_exact(extra_length)
+        if self.entry_name.endswith('/'):
+            raise UploadStreamError("zip中的第一个条目是目录")
+
+        self._flags = flags
+        self._expected_crc = None if flags & self.FLAG_DATA_DESCRIPTOR else crc
+        self._crc = 0
+        if method == 8:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._remaining = None
+        elif method == 0 and not flags & self.FLAG_DATA_DESCRIPTOR and compressed_size != 0xFFFFFFFF:
+            self._decompressor = None
+            self._remaining = compressed_size
+        else:
+            raise UploadStreamError(f"不支持的zip压缩方式: {method}")
+        self._entry_done = False
+
+    def _read_exact(self, size: int) -> bytes:
+        """
+        从源读取恰好 size 字节（仅用于解析文件头）
+        """
+        data = b''
+        while len(data) < size:
+            chunk = self._raw.read(size - len(data))
+            if not chunk:
+                raise UploadStreamError("zip文件头不完整")
+            data += chunk
+        return data
+
+    def _step(self) -> bytes:
+        if self._entry_done:
+            # 条目之后的数据只用于检查是否还有第二个条目
+            self._check_single_entry()
+            self._input = b''
+            self._done = True
+            return b''
+        if self._decompressor is None:
+            data = self._input[:self._remaining]
+            self._input = self._input[len(data):]
+            self._remaining -= len(data)
+            self._entry_done = self._remaining == 0
+        else:
+            try:
+                data = self._decompressor.decompress(self._input, self._chunk_size)
+            except zlib.error as e:
+                raise UploadStreamError(f"zip数据损坏: {str(e)}")
+            if self._decompressor.eof:
+                self._input = self._decompressor.unused_data
+                self._entry_done = True
+            else:
+                self._input = self._decompressor.unconsumed_tail
+        self._crc = zlib.crc32(data, self._crc)
+        if self._entry_done and self._expected_crc is not None and self._crc != self._expected_crc:
+            raise UploadStreamError("zip数据校验失败")
+        return data
+
+    def _check_single_entry(self) -> None:
+        """
+        条目结束后校验数据描述符中的 CRC（如有），若紧跟另一个本地文件头，则拒绝该文件
+        """
+        tail = self._input
+        while len(tail) < 28 and not self._raw_eof:
+            chunk = self._raw.read(self._chunk_size)
+            if not chunk:
+                self._raw_eof = True
+            tail += chunk
+        if self._flags & self.FLAG_DATA_DESCRIPTOR:
+            # 数据描述符：可选的签名后依次为 CRC、压缩后大小、原始大小
+            offset = 4 if tail[:4] == struct.pack('<I', self.DESCRIPTOR_SIGNATURE) else 0
+            if len(tail) < offset + 4:
+                raise UploadStreamError("zip数据不完整")
+            if struct.unpack('<I', tail[offset:offset + 4])[0] != self._crc:
+                raise UploadStreamError("zip数据校验失败")
+        offsets = (12, 16, 20, 24) if self._flags & self.FLAG_DATA_DESCRIPTOR else (0,)
+        local_signature = struct.pack('<I', self.LOCAL_SIGNATURE)
+        if any(tail[offset:offset + 4] == local_signature for offset in offsets):
+            raise UploadStreamError("zip文件中只能包含一个文件")
+
+    def _finish(self) -> None:
+        if not self._entry_done:
+            raise UploadStreamError("zip数据不完整")
+        self._check_single_entry()
+
+
+class ZstdStream(io.RawIOBase):
+    """
+    增量解压 zstd 数据（需要安装 zstandard）
+    """
+
+    def __init__(self, raw, chunk_size: int = 1024 * 1024):
+        super().__init__()
+        if zstandard is None:
+            raise UploadStreamError("服务器未安装zstandard，无法解压 .zst 文件")
+        self._reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=chunk_size)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        try:
+            return self._reader.readinto(buffer)
+        except zstandard.ZstdError as e:
+            raise UploadStreamError(f"zstd数据损坏: {str(e)}")
+
+
+class HashingStream(io.RawIOBase):
+    """
+    读取的同时计算内容的 sha256 摘要（用于识别重复上传的文件）
+
+    套在解压之后，摘要针对CSV内容本身，与上传时是否压缩、用何种方式压缩无关
+    """
+
+    def __init__(self, raw):
+        super().__init__()
+        self._raw = raw
+        self._hash = hashlib.sha256()
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = self._raw.readinto(buffer)
+        if size:
+            self._hash.update(memoryview(buffer)[:size])
+            self.bytes_read += size
+        return size
+
+    def drain(self, chunk_size: int = 1024 * 1024) -> None:
+        """
+        读完剩余内容，使摘要覆盖整个文件
+        """
+        while self.read(chunk_size):
+            pass
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+# 文件名后缀 -> 解压流
+COMPRESSED_SUFFIXES = (
+    ('.gz', GzipStream),
+    ('.zst', ZstdStream),
+    ('.zip', ZipEntryStream),
+)
+
+
+def open_decompressed(stream, filename: str, chunk_size: int = 1024 * 1024) -> io.RawIOBase:
+    """
+    根据文件名后缀为上传流套上增量解压，未压缩的文件原样返回
+
+    :param stream: 上传文件的二进制流
+    :param filename: 上传的文件名
+    :param chunk_size: 每次读取/输出的最大字节数
+    :return: 输出解压后CSV内容的二进制流
+    """
+    lower_name = filename.lower()
+    for suffix, stream_class in COMPRESSED_SUFFIXES:
+        if lower_name.endswith(suffix):
+            return stream_class(stream, chunk_size)
+    return stream
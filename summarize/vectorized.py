@@ -0,0 +1,189 @@
+import datetime
+from itertools import repeat
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from summarize.mark_catalog import MarkCatalog
+
+# 时间统一换算为自 1970-01-01 起的微秒数（与 EXTRACT(EPOCH FROM timestamp) 一致）
+EPOCH = datetime.datetime(1970, 1, 1)
+NO_MARK = -1
+UNSEEN_MARK = -2
+
+
+def to_epoch_us(value: datetime.datetime) -> int:
+    """
+    将时间转换为自 1970-01-01 起的微秒数
+    """
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_epoch_us(value: int) -> datetime.datetime:
+    """
+    将自 1970-01-01 起的微秒数转换为时间
+    """
+    return EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+class MarkVocabulary:
+    """
+    标记号编码表：目录中的标记号编码为 0..len(catalog)-1，其余标记号依次追加，None 编码为 -1
+    """
+
+    def __init__(self, catalog: MarkCatalog):
+        rows = catalog.lookup_rows()
+        self.marks: List[str] = [mark for mark, _, _ in rows]
+        self.codes: Dict[str, int] = {mark: code for code, mark in enumerate(self.marks)}
+        self.known_count = len(rows)
+        self.path_index = np.array([index for _, index, _ in rows], dtype=np.int64)
+        self.km = np.array([km for _, _, km in rows], dtype=np.float64)
+
+    def encode(self, mark: Optional[str]) -> int:
+        """
+        获取标记号编码，未见过的标记号分配新编码
+        """
+        if mark is None:
+            return NO_MARK
+        code = self.codes.get(mark)
+        if code is None:
+            code = self.codes[mark] = len(self.marks)
+            self.marks.append(mark)
+        return code
+
+    def encode_all(self, marks: Sequence[Optional[str]]) -> np.ndarray:
+        """
+        批量编码标记号：已知标记号在 C 层完成字典查找，只对未见过的标记号逐个编码
+        """
+        codes = np.fromiter(map(self.codes.get, marks, repeat(UNSEEN_MARK)), dtype=np.int64, count=len(marks))
+        for position in np.flatnonzero(codes == UNSEEN_MARK):
+            codes[position] = self.encode(marks[position])
+        return codes
+
+    def decode(self, code: int) -> Optional[str]:
+        """
+        将编码还原为标记号
+        """
+        return None if code == NO_MARK else self.marks[code]
+
+
+class PlateResult(NamedTuple):
+    """
+    单个车牌的计算结果
+    """
+    plate: str
+    last_record: Optional[str]
+    last_record_time: Optional[datetime.datetime]
+    mileage: float
+    points: float
+
+
+def compute_vehicle_states(catalog: MarkCatalog,
+                           states: List[Dict[str, Any]],
+                           vehicle_ids: Sequence[int],
+                           mark_codes: Sequence[int],
+                           mark_names: Sequence[str],
+                           pass_times_us: Sequence[int],
+                           seqs: Sequence[int]) -> Dict[str, Any]:
+    """
+    以列式数组一次性计算所有车牌的连续性、里程差与累计里程
+
+    语义与逐车牌处理一致：早于 last_record_time 的记录被跳过；相邻两条有效记录
+    （首条与 last_record 相邻）路径索引相差1时累加里程差；出现不在标准路径中的标记号
+    或 mileage/bonus 为空的车牌整体跳过
+
+    :param catalog: 标记号目录
+    :param states: 车辆当前状态，每项包含 id、plate、last_record、last_record_time、mileage、bonus
+    :param vehicle_ids: 暂存表记录的车辆 id 列（vehicle_info.id）
+    :param mark_codes: 暂存表记录的标记号列，以 mark_names 中的下标表示，空标记号为 -1
+    :param mark_names: 暂存表中出现的标记号
+    :param pass_times_us: 暂存表记录的通行时间列（微秒）
+    :param seqs: 暂存表记录的序号列（车牌内按通行时间排列的 ROW_NUMBER）
+    :return: 包含 results（PlateResult 列表）与 failed（跳过的车牌列表）的字典
+    """
+    if not states:
+        return {"results": [], "failed": []}
+    vocabulary = MarkVocabulary(catalog)
+
+    # 车牌编码为 states 中的下标，找不到车辆信息的记录编码为 plate_count
+    plate_names = [state["plate"] for state in states]
+    plate_count = len(plate_names)
+    state_ids = np.array([state["id"] for state in states], dtype=np.int64)
+    init_mark = np.array([vocabulary.encode(state["last_record"]) for state in states], dtype=np.int64)
+    has_init_time = np.array([state["last_record_time"] is not None for state in states], dtype=bool)
+    init_time = np.array([to_epoch_us(state["last_record_time"]) if state["last_record_time"] is not None else 0
+                          for state in states], dtype=np.int64)
+    init_valid = np.array([state["mileage"] is not None and state["bonus"] is not None for state in states],
+                          dtype=bool)
+    init_mileage = np.array([state["mileage"] or 0.0 for state in states], dtype=np.float64)
+    bonus = np.array([state["bonus"] or 0.0 for state in states], dtype=np.float64)
+
+    # 车辆 id 映射为车牌编码：id 较稠密时直接查表，否则二分查找
+    row_ids = np.asarray(vehicle_ids, dtype=np.int64)
+    max_id = int(state_ids.max())
+    if 0 <= state_ids.min() and max_id <= 4 * plate_count + 1000000:
+        code_table = np.full(max(max_id, int(row_ids.max(initial=0))) + 1, plate_count, dtype=np.int64)
+        code_table[state_ids] = np.arange(plate_count)
+        pc = code_table[row_ids]
+    else:
+        id_order = np.argsort(state_ids)
+        sorted_ids = state_ids[id_order]
+        pos = np.minimum(np.searchsorted(sorted_ids, row_ids), plate_count - 1)
+        pc = np.where(sorted_ids[pos] == row_ids, id_order[pos], plate_count)
+    # 每个不同的标记号只编码一次，再按下标展开到所有记录；下标 -1（空标记号）取到末尾追加的 NO_MARK
+    mk = np.append(vocabulary.encode_all(list(mark_names)), NO_MARK)[np.asarray(mark_codes, dtype=np.int64)]
+    tm = np.asarray(pass_times_us, dtype=np.int64)
+    sq = np.asarray(seqs, dtype=np.int64)
+
+    # seq 为车牌内按通行时间排列的序号，按 (车牌, seq) 组合成单个键只排序一次
+    order = np.argsort(pc * (int(sq.max(initial=0)) + 1) + sq)
+    pc, mk, tm = pc[order], mk[order], tm[order]
+
+    # 丢弃没有车辆信息的车牌和早于 last_record_time 的记录
+    kept = pc < plate_count
+    pc, mk, tm = pc[kept], mk[kept], tm[kept]
+    kept = ~has_init_time[pc] | (tm >= init_time[pc])
+    pc, mk, tm = pc[kept], mk[kept], tm[kept]
+
+    # 每条记录的前一个标记号：组内为上一条记录，组首为车辆当前的 last_record
+    group_start = np.ones(len(pc), dtype=bool)
+    group_start[1:] = pc[1:] != pc[:-1]
+    prev = np.empty_like(mk)
+    prev[1:] = mk[:-1]
+    prev[group_start] = init_mark[pc[group_start]]
+
+    # 两端都有标记号时才计算；其中有不在标准路径中的标记号则整个车牌失败
+    paired = (mk != NO_MARK) & (prev != NO_MARK)
+    unknown = paired & ((mk >= vocabulary.known_count) | (prev >= vocabulary.known_count))
+    failed = np.zeros(plate_count, dtype=bool)
+    failed[pc[unknown]] = True
+    failed |= ~init_valid
+
+    valid = paired & ~unknown
+    cur_idx = np.where(valid, mk, 0)
+    prev_idx = np.where(valid, prev, 0)
+    continuous = valid & (vocabulary.path_index[cur_idx] - vocabulary.path_index[prev_idx] == 1)
+    deltas = np.where(continuous, np.abs(vocabulary.km[cur_idx] - vocabulary.km[prev_idx]) / 1000.0, 0.0)
+
+    # 按车牌分组累加里程差，并取每组最后一条记录作为新的 last_record
+    mileage = init_mileage + np.bincount(pc, weights=deltas, minlength=plate_count)
+    points = mileage * bonus
+    last_mark = init_mark.copy()
+    last_time = np.where(has_init_time, init_time, -1)
+    group_end = np.ones(len(pc), dtype=bool)
+    group_end[:-1] = pc[1:] != pc[:-1]
+    last_mark[pc[group_end]] = mk[group_end]
+    last_time[pc[group_end]] = tm[group_end]
+    touched = np.zeros(plate_count, dtype=bool)
+    touched[pc] = True
+
+    results = []
+    for code in np.flatnonzero(~failed):
+        results.append(PlateResult(
+            plate_names[code],
+            vocabulary.decode(int(last_mark[code])),
+            from_epoch_us(last_time[code]) if has_init_time[code] or touched[code] else None,
+            float(mileage[code]),
+            float(points[code])
+        ))
+    return {"results": results, "failed": [plate_names[code] for code in np.flatnonzero(failed)]}
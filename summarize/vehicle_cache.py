@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class VehicleCache:
+    """
+    按车牌缓存车辆状态查询结果的 LRU + TTL 缓存（线程安全）
+
+    车辆状态只在确认执行和导入车辆信息时变化，写入方在提交后按车牌失效对应条目。
+    每次失效都会递增版本号：查询开始前记下版本号，写回缓存时版本号已变化则放弃写回，
+    避免失效之前读到的旧数据在失效之后才被放入缓存
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 60.0):
+        """
+        :param max_size: 最多缓存的车牌数，超出时淘汰最久未使用的条目
+        :param ttl: 条目的有效秒数
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0, "clears": 0}
+
+    @property
+    def version(self) -> int:
+        """
+        当前版本号，每次失效或清空时递增
+        """
+        return self._version
+
+    def get(self, plate: str) -> Optional[Any]:
+        """
+        获取缓存的查询结果，命中时移到最近使用的位置
+
+        :param plate: 车牌号
+        :return: 查询结果，未缓存或已过期时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(plate)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[plate]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(plate)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, plate: str, value: Any, version: int) -> bool:
+        """
+        写入查询结果
+
+        :param plate: 车牌号
+        :param value: 查询结果
+        :param version: 查询开始前的版本号
+        :return: 写入返回True，期间发生过失效而放弃写入返回False
+        """
+        with self._lock:
+            if version != self._version:
+                return False
+            self._entries[plate] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(plate)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            return True
+
+    def invalidate(self, plates: Iterable[str]) -> int:
+        """
+        失效指定车牌的条目
+
+        :param plates: 车牌号
+        :return: 实际移除的条目数
+        """
+        removed = 0
+        with self._lock:
+            self._version += 1
+            for plate in plates:
+                if self._entries.pop(plate, None) is not None:
+                    removed += 1
+            self._stats["invalidations"] += removed
+        return removed
+
+    def clear(self) -> None:
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._stats["clears"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        :return: 包含 size、max_size、ttl、hits、misses、evictions、expirations、invalidations、clears 与 hit_rate 的字典
+        """
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, size=len(self._entries), max_size=self.max_size, ttl=self.ttl,
+                        hit_rate=self._stats["hits"] / lookups if lookups else None)
+
+
+# 每个进程共享一个缓存：请求线程与后台任务中的处理器需要看到同一份缓存才能互相失效
+_shared_cache: Optional[VehicleCache] = None
+_shared_cache_pid: Optional[int] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_vehicle_cache(max_size: int = 100000, ttl: float = 60.0) -> VehicleCache:
+    """
+    获取当前进程的共享车辆状态缓存，不存在或属于父进程时创建
+
+    :param max_size: 最多缓存的车牌数，仅在首次创建时生效
+    :param ttl: 条目的有效秒数，仅在首次创建时生效
+    :return: 车辆状态缓存
+    """
+    global _shared_cache, _shared_cache_pid
+    with _shared_cache_lock:
+        if _shared_cache is None or _shared_cache_pid != os.getpid():
+            _shared_cache = VehicleCache(max_size, ttl)
+            _shared_cache_pid = os.getpid()
+        return _shared_cache
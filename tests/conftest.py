@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config_manager import config_manager
+
+
+@pytest.fixture(scope="session")
+def db_params():
+    """
+    测试数据库连接参数：默认取 config.json 的 database 配置，可用 VEHICLE_TEST_DB_* 环境变量覆盖；
+    数据库需已由 deploy.py 初始化，无法连接时跳过依赖数据库的测试
+    """
+    import psycopg2
+
+    db_config = config_manager.get("database", {}) or {}
+    params = {
+        "host": os.environ.get("VEHICLE_TEST_DB_HOST", db_config.get("host", "localhost")),
+        "port": int(os.environ.get("VEHICLE_TEST_DB_PORT", db_config.get("port", 5432))),
+        "user": os.environ.get("VEHICLE_TEST_DB_USER", db_config.get("user", "postgres")),
+        "password": os.environ.get("VEHICLE_TEST_DB_PASSWORD", db_config.get("password", "")),
+        "dbname": os.environ.get("VEHICLE_TEST_DB_NAME", db_config.get("dbname", "vehicle_db")),
+    }
+    try:
+        psycopg2.connect(connect_timeout=3, **params).close()
+    except psycopg2.Error as e:
+        pytest.skip(f"无法连接测试数据库: {e}")
+    return params
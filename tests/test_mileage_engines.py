@@ -0,0 +1,119 @@
+"""
+里程计算引擎一致性测试：python / process / numpy / sql 四种引擎对同一批随机暂存数据
+写回vehicle_info的 last_record、last_record_time、mileage、points 必须一致
+
+暂存数据包含空标记号、不在标准路径中的标记号、只有一条通行记录的车牌、通行时间相同的记录、
+没有车辆信息的车牌，以及 mileage / bonus 为空的车辆；全部操作在一个事务中完成并回滚
+"""
+import datetime
+import random
+
+import pytest
+
+from summarize.summarize import VehicleDataProcessor
+
+ENGINES = ["python", "process", "numpy", "sql"]
+PLATE_PREFIX = "PARITY"
+UNKNOWN_MARK = "K9999+000"
+BASE_TIME = datetime.datetime(2024, 1, 1)
+
+
+def _random_batch(marks, seed: int):
+    """
+    生成车辆初始状态和通行记录
+
+    :return: (vehicle_rows, trace_rows)
+    """
+    rng = random.Random(seed)
+    vehicle_rows = []
+    trace_rows = set()
+    for index in range(200):
+        plate = f"{PLATE_PREFIX}{index:04d}"
+        last_record = rng.choice(marks + [None, None, UNKNOWN_MARK] if rng.random() < 0.05 else marks + [None])
+        last_record_time = (BASE_TIME + datetime.timedelta(minutes=rng.randint(0, 400))
+                            if last_record is not None or rng.random() < 0.2 else None)
+        mileage = None if rng.random() < 0.05 else round(rng.random() * 100, 3)
+        bonus = None if rng.random() < 0.05 else rng.choice([1.0, 1.5, 2.0])
+        vehicle_rows.append((plate, last_record, last_record_time, mileage, bonus))
+
+        count = 1 if rng.random() < 0.3 else rng.randint(2, 12)
+        times = []
+        for _ in range(count):
+            # 约五分之一的记录复用已有的通行时间，形成时间相同的记录
+            if times and rng.random() < 0.2:
+                pass_time = rng.choice(times)
+            else:
+                pass_time = BASE_TIME + datetime.timedelta(minutes=rng.randint(0, 1000))
+            times.append(pass_time)
+            roll = rng.random()
+            mark = None if roll < 0.1 else UNKNOWN_MARK if roll < 0.13 else rng.choice(marks)
+            trace_rows.add((plate, mark, pass_time))
+    trace_rows.add((f"{PLATE_PREFIX}NOINFO", marks[0], BASE_TIME))
+    return vehicle_rows, sorted(trace_rows, key=lambda row: (row[0], row[2], row[1] or ""))
+
+
+def _prepare(client, vehicle_rows, trace_rows) -> None:
+    """
+    写入测试车辆并按 create_and_populate_staging 的方式生成暂存表（保留空标记号）
+    """
+    client.execute("DELETE FROM vehicle_info WHERE plate LIKE %s", (f"{PLATE_PREFIX}%",))
+    with client.conn.cursor() as cur:
+        cur.executemany(
+            "INSERT INTO vehicle_info (username, phone_num, plate, last_record, last_record_time, mileage, bonus) "
+            "VALUES ('parity', '00000000000', %s, %s, %s, %s, %s)",
+            vehicle_rows
+        )
+        cur.execute("CREATE TEMP TABLE parity_source (plate VARCHAR(20), mark VARCHAR(20), pass_time TIMESTAMP)")
+        cur.executemany("INSERT INTO parity_source VALUES (%s, %s, %s)", trace_rows)
+    client.drop_table_if_exists(client.STAGING_TABLE)
+    client.execute(f"""
+        CREATE TEMP TABLE {client.STAGING_TABLE} AS
+        SELECT plate, mark, pass_time, ROW_NUMBER() OVER (PARTITION BY plate ORDER BY pass_time) AS seq
+        FROM parity_source
+    """)
+
+
+def _vehicle_states(client):
+    rows = client.execute(
+        "SELECT plate, last_record, last_record_time, mileage, points FROM vehicle_info "
+        "WHERE plate LIKE %s ORDER BY plate",
+        (f"{PLATE_PREFIX}%",)
+    )
+    return [(row["plate"], row["last_record"], row["last_record_time"], row["mileage"], row["points"])
+            for row in rows]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_engines_write_identical_vehicle_states(db_params, seed):
+    processor = VehicleDataProcessor(**db_params)
+    processor.vehicle_info_flush_size = 37
+    processor.process_workers = 2
+    processor.process_chunk_size = 16
+    marks = [mark for path in processor.standard_path for mark in path]
+    vehicle_rows, trace_rows = _random_batch(marks, seed)
+
+    client = processor.postgresql_client
+    client.connect()
+    try:
+        _prepare(client, vehicle_rows, trace_rows)
+        initial = _vehicle_states(client)
+        results = {}
+        for engine in ENGINES:
+            client.execute("SAVEPOINT engine_parity")
+            processor.mileage_engine = engine
+            processor._update_vehicle_info_from_staging()
+            results[engine] = _vehicle_states(client)
+            client.execute("ROLLBACK TO SAVEPOINT engine_parity")
+    finally:
+        client.rollback()
+        client.close()
+
+    expected = results["python"]
+    changed = sum(1 for before, after in zip(initial, expected) if before != after)
+    assert changed > len(expected) // 2, "随机数据应使大多数车辆状态发生变化"
+    assert any(before == after for before, after in zip(initial, expected)), "应有被跳过的车辆"
+    for engine in ENGINES[1:]:
+        actual = results[engine]
+        assert [row[:3] for row in actual] == [row[:3] for row in expected], engine
+        for got, want in zip(actual, expected):
+            assert got[3:] == pytest.approx(want[3:], rel=1e-9, abs=1e-9), (engine, got[0])
@@ -0,0 +1,59 @@
+"""
+预编译语句缓存测试：表结构变化、服务端语句被清除后的重新预编译与重试
+"""
+import psycopg2
+import pytest
+
+from database.postgresql_client import PostgreSQLClient
+
+
+@pytest.fixture
+def client(db_params):
+    client = PostgreSQLClient(db_params["host"], db_params["port"], db_params["user"],
+                              db_params["password"], db_params["dbname"])
+    client.connect()
+    client.conn.autocommit = True
+    client.execute("CREATE TEMP TABLE cache_probe (id INTEGER, name TEXT)")
+    client.execute("INSERT INTO cache_probe VALUES (1, 'a'), (2, 'b')")
+    try:
+        yield client
+    finally:
+        client.close()
+
+
+def test_select_star_is_not_prepared(client):
+    assert client.select("cache_probe", where="id = %s", params=(1,)) == [{"id": 1, "name": "a"}]
+    client.execute("ALTER TABLE cache_probe ADD COLUMN extra INTEGER")
+    assert client.select("cache_probe", where="id = %s", params=(1,)) == [{"id": 1, "name": "a", "extra": None}]
+    assert client.statement_cache_stats()["size"] == 0
+
+
+def test_result_type_change_re_prepares(client):
+    rows = client.select("cache_probe", columns=["id", "name"], where="id = %s", params=(2,))
+    assert rows == [{"id": 2, "name": "b"}]
+    client.execute("ALTER TABLE cache_probe ALTER COLUMN name TYPE VARCHAR(10)")
+    rows = client.select("cache_probe", columns=["id", "name"], where="id = %s", params=(2,))
+    assert rows == [{"id": 2, "name": "b"}]
+
+
+def test_discarded_statements_re_prepare(client):
+    client.select("cache_probe", columns=["name"], where="id = %s", params=(1,))
+    client.execute("DEALLOCATE ALL")
+    assert client.select("cache_probe", columns=["name"], where="id = %s", params=(1,)) == [{"name": "a"}]
+    # 新事务的第一条语句同样可以重试
+    client.conn.autocommit = False
+    client.execute("DEALLOCATE ALL")
+    client.commit()
+    assert client.select("cache_probe", columns=["name"], where="id = %s", params=(2,)) == [{"name": "b"}]
+    client.rollback()
+
+
+def test_invalidation_inside_caller_transaction_raises(client):
+    client.select("cache_probe", columns=["name"], where="id = %s", params=(1,))
+    client.conn.autocommit = False
+    client.execute("DEALLOCATE ALL")
+    with pytest.raises(psycopg2.errors.InvalidSqlStatementName):
+        client.select("cache_probe", columns=["name"], where="id = %s", params=(1,))
+    client.rollback()
+    assert client.select("cache_probe", columns=["name"], where="id = %s", params=(1,)) == [{"name": "a"}]
+    client.rollback()
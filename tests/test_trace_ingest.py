@@ -0,0 +1,149 @@
+"""
+轨迹二进制编码测试：TraceRowEncoder 写入过滤表的结果与原流程（原始表 + TO_TIMESTAMP 转换）一致
+"""
+import datetime
+import io
+import random
+
+import psycopg2
+import pytest
+
+from database.copy_stream import BytesIteratorFile
+from summarize.trace_ingest import TraceRowEncoder, parse_pass_time
+
+KNOWN_PLATES = {"京A00001", "京A00002", "沪B12345"}
+PASS_TIMES = [
+    "2024/05/01 08:05",
+    "2024/5/1 8:5",
+    "2024/05/01",
+    "2024/05/01 8",
+    "2024/05/01 08:",
+    "2024-05-01 08:05",
+    "2024.05.01 08.05",
+    "2024 05 01 08 05",
+    "2024/05/01/08:05",
+    "2024/05/01 08:05:59",
+    " 2024/05/01  08:05 ",
+    "2024/12/31 23:59",
+    "2024/02/29 00:00",
+    "1999/12/31 23:59",
+]
+INVALID_PASS_TIMES = ["2024/13/01 00:00", "2023/02/29 08:00", "2024/05/01 25:00", "2024/05/01T08:05",
+                      "2024/05/0108:05", "2024/05/01/ ", "not a time"]
+# TO_TIMESTAMP 接受但客户端按格式错误处理的写法（缺少月日、月日为0、空字符串）
+STRICTER_PASS_TIMES = ["2024/05", "2024/00/01 08:00", ""]
+CSV_LINES = [
+    "京A00001,2024/05/01 08:05,K0001+000\n",
+    "京A00001,2024/5/1 8:6,K0002+500\r\n",
+    "京A00002,2024/05/01,K0010+000\n",
+    "\n",
+    "沪B12345,2024-05-01 23:59,K0003+100\n",
+    "粤C99999,2024/05/01 08:05,K0001+000\n",   # 车牌未登记
+    "京A00002,2024/05/01 09:00,\n",            # 标记号为空
+    "京A00002,2024/05/01 09:01,K12+5\n",       # 标记号格式错误
+    "京A00001,2024/05/01 08:05,K0001+000\n",   # 重复记录原样保留
+]
+
+
+@pytest.fixture
+def connection(db_params):
+    conn = psycopg2.connect(**db_params)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_encoder_counts_and_skips():
+    encoder = TraceRowEncoder(7, KNOWN_PLATES)
+    chunks = list(encoder.encode_lines(CSV_LINES))
+    assert encoder.rows == 8
+    assert encoder.written == 5
+    assert encoder.unknown_plates == 1
+    assert encoder.invalid_marks == 2
+    # 文件头、5行数据、结束标记
+    assert len(chunks) == 7
+
+
+def test_encoder_rejects_malformed_lines():
+    encoder = TraceRowEncoder(7, KNOWN_PLATES)
+    with pytest.raises(ValueError, match="第 3 行字段数错误"):
+        list(encoder.encode_lines(["京A00001,2024/05/01 08:05,K0001+000\n", "京A00001,2024/05/01 08:05\n"]))
+    with pytest.raises(ValueError, match="第 2 行通行时间"):
+        list(encoder.encode_lines(["京A00001,2024/13/01 08:05,K0001+000\n"]))
+
+
+def _to_timestamp(cur, value: str):
+    """
+    用 TO_TIMESTAMP 解析通行时间，无法解析时返回None
+    """
+    cur.execute("SAVEPOINT parse_time")
+    try:
+        cur.execute("SELECT TO_TIMESTAMP(%s, 'YYYY/MM/DD HH24:MI')::timestamp", (value,))
+        return cur.fetchone()[0]
+    except (psycopg2.DataError, ValueError):
+        # ValueError：公元前等超出 Python datetime 范围的结果
+        cur.execute("ROLLBACK TO SAVEPOINT parse_time")
+        return None
+
+
+def _random_pass_times(count: int, seed: int):
+    rng = random.Random(seed)
+    separators = ["/", "-", ".", ":", " ", "  ", "/ ", " /", "", "T", "_", "//"]
+    for _ in range(count):
+        fields = [rng.choice(["2024", "24", "12345"]), rng.choice(["5", "05", "13", "0"]),
+                  rng.choice(["1", "01", "29", "31"]), rng.choice(["8", "08", "24", ""]),
+                  rng.choice(["5", "05", "60", ""])]
+        yield (fields[0] + "".join(rng.choice(separators) + field for field in fields[1:])
+               + rng.choice(["", " ", "/", "/ ", ":30", "x"]))
+
+
+def test_parse_pass_time_matches_to_timestamp(connection):
+    with connection.cursor() as cur:
+        for value in PASS_TIMES:
+            assert parse_pass_time(value) == _to_timestamp(cur, value), value
+        for value in INVALID_PASS_TIMES:
+            assert _to_timestamp(cur, value) is None, value
+            with pytest.raises(ValueError):
+                parse_pass_time(value)
+        for value in STRICTER_PASS_TIMES:
+            with pytest.raises(ValueError):
+                parse_pass_time(value)
+        # 客户端可以比 TO_TIMESTAMP 更严格，但解析成功时结果必须相同
+        for value in _random_pass_times(300, seed=17):
+            try:
+                parsed = parse_pass_time(value)
+            except ValueError:
+                continue
+            assert parsed == _to_timestamp(cur, value), value
+
+
+def test_encoder_matches_to_timestamp_path(connection):
+    with connection.cursor() as cur:
+        cur.execute("SET TIME ZONE 'Asia/Shanghai'")
+        cur.execute("CREATE TEMP TABLE encoder_raw (plate VARCHAR(20), pass_time VARCHAR(50), mark VARCHAR(20))")
+        cur.execute("CREATE TEMP TABLE encoder_plates (plate VARCHAR(20))")
+        cur.executemany("INSERT INTO encoder_plates VALUES (%s)", [(plate,) for plate in KNOWN_PLATES])
+        cur.execute("CREATE TEMP TABLE encoder_filtered (LIKE filtered_trace_data)")
+        # 与原流程一样以逗号分隔的文本格式COPY到原始表
+        cur.copy_from(io.StringIO("".join(line.rstrip("\r\n") + "\n" for line in CSV_LINES if line.strip())),
+                      "encoder_raw", sep=",")
+
+        encoder = TraceRowEncoder(7, KNOWN_PLATES)
+        cur.copy_expert("COPY encoder_filtered (batch_id, plate, pass_time, mark) FROM STDIN WITH (FORMAT binary)",
+                        BytesIteratorFile(encoder.encode_lines(CSV_LINES)))
+
+        # 原流程不校验标记号，与二进制流程比较时同样排除空的和格式错误的标记号
+        cur.execute("""
+        SELECT 7, t0.plate, TO_TIMESTAMP(t0.pass_time, 'YYYY/MM/DD HH24:MI')::timestamp, t0.mark
+        FROM encoder_raw t0 JOIN encoder_plates p ON t0.plate = p.plate
+        WHERE t0.mark ~ '^K\\d+\\+\\d{3}$'
+        ORDER BY 2, 3, 4
+        """)
+        expected = cur.fetchall()
+        cur.execute("SELECT batch_id, plate, pass_time, mark FROM encoder_filtered ORDER BY 2, 3, 4")
+        actual = cur.fetchall()
+    assert len(actual) == encoder.written
+    assert actual == expected
+    assert actual[0][2] == datetime.datetime(2024, 5, 1, 8, 5)
@@ -0,0 +1,192 @@
+"""
+上传流测试：multipart 文件字段流式读取，gzip / zip 增量解压，内容摘要
+"""
+import gzip
+import hashlib
+import io
+import zipfile
+
+import pytest
+
+from summarize.upload_stream import (GzipStream, HashingStream, MultipartFileStream, UploadStreamError,
+                                     ZipEntryStream, open_decompressed)
+
+BOUNDARY = b"----vehicle-test-boundary"
+CSV_CONTENT = "".join(f"京A{index:05d},2024/05/01 08:{index % 60:02d},K{index % 100:04d}+000\n"
+                      for index in range(2000)).encode("utf-8")
+
+
+def _multipart_body(file_field: str = "file", content: bytes = CSV_CONTENT) -> bytes:
+    """
+    构造包含一个普通字段和一个文件字段的 multipart/form-data 请求体
+    """
+    return b"".join([
+        b"--" + BOUNDARY + b"\r\n",
+        b'Content-Disposition: form-data; name="note"\r\n\r\n',
+        b"trace upload\r\n",
+        b"--" + BOUNDARY + b"\r\n",
+        f'Content-Disposition: form-data; name="{file_field}"; filename="trace.csv"\r\n'.encode("utf-8"),
+        b"Content-Type: text/csv\r\n\r\n",
+        content,
+        b"\r\n--" + BOUNDARY + b"--\r\n",
+    ])
+
+
+def _read_all(stream, size: int = 333) -> bytes:
+    parts = []
+    while True:
+        data = stream.read(size)
+        if not data:
+            return b"".join(parts)
+        parts.append(data)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 4096, 1024 * 1024])
+def test_multipart_reads_file_field(chunk_size):
+    stream = MultipartFileStream(io.BytesIO(_multipart_body()), BOUNDARY, "file", chunk_size=chunk_size)
+    assert stream.filename == "trace.csv"
+    assert _read_all(stream) == CSV_CONTENT
+    assert stream.bytes_read == len(CSV_CONTENT)
+    stream.close()
+
+
+def test_multipart_missing_field():
+    with pytest.raises(UploadStreamError, match="没有文件字段"):
+        MultipartFileStream(io.BytesIO(_multipart_body(file_field="other")), BOUNDARY, "file", chunk_size=64)
+
+
+def test_multipart_truncated_body():
+    body = _multipart_body()
+    stream = MultipartFileStream(io.BytesIO(body[:len(body) // 2]), BOUNDARY, "file", chunk_size=64)
+    with pytest.raises(UploadStreamError, match="不完整"):
+        _read_all(stream)
+
+
+def test_multipart_truncated_before_file_field():
+    body = _multipart_body()
+    with pytest.raises(UploadStreamError, match="不完整"):
+        MultipartFileStream(io.BytesIO(body[:body.index(b"trace upload")]), BOUNDARY, "file", chunk_size=64)
+
+
+class _UnseekableWriter(io.RawIOBase):
+    """
+    不可定位的写入目标：zipfile 写入此类目标时为条目添加数据描述符
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.data = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.data += data
+        return len(data)
+
+
+def _zip_bytes(entries, compression=zipfile.ZIP_DEFLATED, data_descriptor: bool = False) -> bytes:
+    target = _UnseekableWriter() if data_descriptor else io.BytesIO()
+    with zipfile.ZipFile(target, "w", compression=compression) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+    return bytes(target.data) if data_descriptor else target.getvalue()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 1024 * 1024])
+def test_gzip_multi_member(chunk_size):
+    half = len(CSV_CONTENT) // 2
+    # 两个拼接的成员之间带有零字节填充
+    data = gzip.compress(CSV_CONTENT[:half]) + b"\x00" * 8 + gzip.compress(CSV_CONTENT[half:])
+    assert _read_all(GzipStream(io.BytesIO(data), chunk_size=chunk_size)) == CSV_CONTENT
+
+
+def test_gzip_truncated():
+    data = gzip.compress(CSV_CONTENT)
+    with pytest.raises(UploadStreamError, match="不完整"):
+        _read_all(GzipStream(io.BytesIO(data[:len(data) // 2]), chunk_size=100))
+
+
+def test_gzip_corrupted():
+    data = bytearray(gzip.compress(CSV_CONTENT))
+    data[len(data) // 2] ^= 0xFF
+    with pytest.raises(UploadStreamError):
+        _read_all(GzipStream(io.BytesIO(bytes(data)), chunk_size=100))
+
+
+@pytest.mark.parametrize("compression, data_descriptor", [
+    (zipfile.ZIP_STORED, False),
+    (zipfile.ZIP_DEFLATED, False),
+    (zipfile.ZIP_DEFLATED, True),
+])
+@pytest.mark.parametrize("chunk_size", [1, 100, 1024 * 1024])
+def test_zip_single_entry(compression, data_descriptor, chunk_size):
+    data = _zip_bytes([("trace.csv", CSV_CONTENT)], compression, data_descriptor)
+    stream = ZipEntryStream(io.BytesIO(data), chunk_size=chunk_size)
+    assert stream.entry_name == "trace.csv"
+    assert _read_all(stream) == CSV_CONTENT
+
+
+@pytest.mark.parametrize("compression, data_descriptor", [
+    (zipfile.ZIP_STORED, False),
+    (zipfile.ZIP_DEFLATED, False),
+    (zipfile.ZIP_DEFLATED, True),
+])
+def test_zip_second_entry_rejected(compression, data_descriptor):
+    data = _zip_bytes([("trace.csv", CSV_CONTENT), ("other.csv", b"x")], compression, data_descriptor)
+    with pytest.raises(UploadStreamError, match="只能包含一个文件"):
+        _read_all(ZipEntryStream(io.BytesIO(data), chunk_size=100))
+
+
+@pytest.mark.parametrize("compression, data_descriptor", [
+    (zipfile.ZIP_STORED, False),
+    (zipfile.ZIP_DEFLATED, False),
+    (zipfile.ZIP_DEFLATED, True),
+])
+def test_zip_crc_mismatch(compression, data_descriptor):
+    data = bytearray(_zip_bytes([("trace.csv", CSV_CONTENT)], compression, data_descriptor))
+    # 改写本地文件头中的 CRC，有数据描述符时改写描述符中的 CRC
+    if data_descriptor:
+        crc_offset = data.index(b"PK\x07\x08") + 4
+    else:
+        crc_offset = ZipEntryStream.LOCAL_HEADER.size - 16
+    data[crc_offset] ^= 0xFF
+    with pytest.raises(UploadStreamError, match="校验失败"):
+        _read_all(ZipEntryStream(io.BytesIO(bytes(data)), chunk_size=100))
+
+
+def test_zip_truncated():
+    data = _zip_bytes([("trace.csv", CSV_CONTENT)])
+    with pytest.raises(UploadStreamError, match="不完整"):
+        _read_all(ZipEntryStream(io.BytesIO(data[:len(data) // 2]), chunk_size=100))
+
+
+def _compressed_uploads():
+    """
+    同一份CSV内容的各种上传形式：(文件名, 文件数据)，未安装 zstandard 时不含 .zst
+    """
+    uploads = [
+        ("trace.csv", CSV_CONTENT),
+        ("trace.csv.gz", gzip.compress(CSV_CONTENT)),
+        ("trace.zip", _zip_bytes([("trace.csv", CSV_CONTENT)], zipfile.ZIP_STORED)),
+        ("trace.ZIP", _zip_bytes([("trace.csv", CSV_CONTENT)], zipfile.ZIP_DEFLATED, data_descriptor=True)),
+    ]
+    try:
+        import zstandard
+        uploads.append(("trace.csv.zst", zstandard.ZstdCompressor().compress(CSV_CONTENT)))
+    except ImportError:
+        pass
+    return [pytest.param(filename, data, id=filename) for filename, data in uploads]
+
+
+@pytest.mark.parametrize("filename, data", _compressed_uploads())
+def test_hashing_digest_independent_of_compression(filename, data):
+    body = _multipart_body(content=data)
+    upload = MultipartFileStream(io.BytesIO(body), BOUNDARY, "file", chunk_size=4096)
+    stream = HashingStream(open_decompressed(upload, filename, chunk_size=4096))
+    # 只读取开头一部分（如遇到格式错误提前停止），drain 后摘要仍覆盖整个文件
+    assert stream.read(1000) == CSV_CONTENT[:1000]
+    stream.drain(chunk_size=777)
+    assert stream.hexdigest() == hashlib.sha256(CSV_CONTENT).hexdigest()
+    assert stream.bytes_read == len(CSV_CONTENT)
+    assert upload.bytes_read == len(data)